@@ -48,6 +48,7 @@ setup(
     packages=["delphyne"],
     extras_require={
         "TEST": ["pytest", "pytest-cov", "docker", "nox", "flake8"],
+        "ASYNC": ["asyncpg >= 0.21, <1"],
     },
     url="https://github.com/thehyve/delphyne",
     version=version['__version__'],
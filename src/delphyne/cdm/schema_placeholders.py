@@ -6,3 +6,5 @@
 # provided parameters in the config.yml file.
 VOCAB_SCHEMA = 'vocabulary_schema'
 CDM_SCHEMA = 'cdm_schema'
+# Optional schema for intermediate tables, see StagingManager
+STAGING_SCHEMA = 'staging_schema'
@@ -4,7 +4,7 @@ from typing import Optional, Dict
 
 from pydantic import BaseModel, validator, SecretStr, DirectoryPath
 
-from ...cdm.schema_placeholders import VOCAB_SCHEMA, CDM_SCHEMA
+from ...cdm.schema_placeholders import VOCAB_SCHEMA, CDM_SCHEMA, STAGING_SCHEMA
 
 _REQUIRED_SCHEMAS = [VOCAB_SCHEMA, CDM_SCHEMA]
 
@@ -59,6 +59,32 @@ class MainConfig(BaseModel):
                 raise ValueError(f'Missing required key in schema_translate_map: {schema}')
         return schema_map
 
+    @validator('schema_translate_map')
+    def check_staging_schema(cls, schema_map: Dict[str, str]) -> Dict[str, str]:
+        """
+        Check the staging schema, if present, is not a CDM schema.
+
+        The staging schema is dropped entirely at the end of a run.
+
+        Parameters
+        ----------
+        schema_map : dict of {str : str}
+            Placeholder to actual schema name mapping.
+
+        Returns
+        -------
+        dict of {str : str}
+            The validated schema_map.
+        """
+        staging_schema = schema_map.get(STAGING_SCHEMA)
+        if staging_schema is None:
+            return schema_map
+        for placeholder, schema in schema_map.items():
+            if placeholder != STAGING_SCHEMA and schema == staging_schema:
+                raise ValueError(f'{STAGING_SCHEMA} cannot be the same schema '
+                                 f'as {placeholder}: {schema}')
+        return schema_map
+
     @validator('schema_translate_map', 'sql_parameters')
     def no_empty_strings(cls, str_dict: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
         """
@@ -0,0 +1,378 @@
+"""
+Module for inserting large numbers of table records.
+
+Records can either be ORM instances of the CDM table classes, or
+(table, row) pairs, where table is a declarative table class or a
+sqlalchemy.Table and row is either a dictionary with column names as
+keys, or a tuple with a value for each column in the table's column
+order. A mapping of tables to lists of rows is accepted as well.
+"""
+
+from __future__ import annotations
+
+import datetime
+import io
+import logging
+from collections import Counter
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Table, inspect
+from sqlalchemy.schema import sort_tables
+
+from ..util.table import get_full_table_name
+
+logger = logging.getLogger(__name__)
+
+SchemaMap = Optional[Union[MappingProxyType, Dict[str, str]]]
+
+# Characters that need escaping in the PostgreSQL COPY text format
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+_COPY_NULL = '\\N'
+
+
+def get_record_table(record: Any) -> Table:
+    """
+    Get the target table of a record.
+
+    Parameters
+    ----------
+    record : ORM instance or tuple of (table, row)
+        Record to be inserted.
+
+    Returns
+    -------
+    sqlalchemy.Table
+        The table the record should be inserted into.
+    """
+    if isinstance(record, tuple):
+        return _as_table(record[0])
+    return record.__table__
+
+
+def get_record_values(record: Any, table: Table) -> Tuple:
+    """
+    Get the values of a record, in the column order of its table.
+
+    Python-side column defaults are applied to missing values, as would
+    happen when the record was flushed by the ORM.
+
+    Parameters
+    ----------
+    record : ORM instance or tuple of (table, row)
+        Record to be inserted.
+    table : sqlalchemy.Table
+        Target table of the record.
+
+    Returns
+    -------
+    tuple
+        Record values, one for each column of the table.
+    """
+    if isinstance(record, tuple):
+        row = record[1]
+        if isinstance(row, tuple):
+            if len(row) != len(table.columns):
+                raise ValueError(f'Expected {len(table.columns)} values for a {table.name} '
+                                 f'row, got {len(row)}')
+            values = list(row)
+        else:
+            values = [row.get(column.name) for column in table.columns]
+    else:
+        values = [getattr(record, key) for key in _get_attribute_keys(type(record))]
+    for i, column in enumerate(table.columns):
+        if values[i] is None and column.default is not None:
+            values[i] = _get_column_default(column)
+    return tuple(values)
+
+
+def group_records_by_table(records: Iterable) -> Dict[Table, List[Tuple]]:
+    """
+    Group record values by target table.
+
+    The tables are returned in an order in which they can be inserted
+    without violating FK constraints between them.
+
+    Parameters
+    ----------
+    records : iterable of ORM instances or (table, row) tuples
+        Records to be inserted. Can also be a mapping of tables to
+        lists of rows.
+
+    Returns
+    -------
+    dict of {sqlalchemy.Table : list of tuple}
+        Target table to record values mapping.
+    """
+    groups: Dict[Table, List[Tuple]] = {}
+    for record in iter_records(records):
+        table = get_record_table(record)
+        groups.setdefault(table, []).append(get_record_values(record, table))
+    return {table: groups[table] for table in sort_tables(groups.keys())}
+
+
+def iter_records(records: Union[Iterable, Mapping]) -> Iterator:
+    """
+    Iterate over records, unpacking a mapping of tables to rows.
+
+    Parameters
+    ----------
+    records : iterable of records or mapping of {table : list of rows}
+        Records to be inserted.
+
+    Yields
+    ------
+    ORM instance or tuple of (table, row)
+        A single record.
+    """
+    if isinstance(records, Mapping):
+        for table, rows in records.items():
+            for row in rows:
+                yield table, row
+    else:
+        yield from records
+
+
+def core_insert_records(connection, records: Iterable, schema_map: SchemaMap = None) -> Counter:
+    """
+    Insert records via executemany of SQLAlchemy Core insert statements.
+
+    No ORM objects are created or tracked, and insertion counts are
+    determined per table rather than per record. Columns for which
+    none of a table's records provides a value are left out of the
+    insert, so server-side defaults (e.g. serial primary keys) will be
+    used for them.
+
+    Parameters
+    ----------
+    connection : sqlalchemy.engine.Connection
+        Connection to use for the insertion.
+    records : iterable of ORM instances or (table, row) tuples
+        Records to be inserted. Can also be a mapping of tables to
+        lists of rows.
+    schema_map : dict of {str : str}, optional
+        Placeholder to actual schema name mapping, used for the keys of
+        the returned counts.
+
+    Returns
+    -------
+    collections.Counter
+        Insertion counts per full table name.
+    """
+    insertion_counts = Counter()
+    for table, rows in group_records_by_table(records).items():
+        full_table_name = get_full_table_name(table=table.name, schema=table.schema,
+                                              schema_map=schema_map)
+        column_indexes = _get_columns_with_values(rows)
+        columns = list(table.columns)
+        keys = [(i, columns[i].key) for i in column_indexes]
+        parameters = [{key: row[i] for i, key in keys} for row in rows]
+        logger.debug(f'Inserting {len(rows)} records into {full_table_name}')
+        connection.execute(table.insert(), parameters)
+        insertion_counts += Counter({full_table_name: len(rows)})
+    return insertion_counts
+
+
+def copy_records(connection, records: Iterable, schema_map: SchemaMap = None) -> Counter:
+    """
+    Insert records via the PostgreSQL COPY command.
+
+    Columns for which none of a table's records provides a value are
+    left out of the COPY statement, so server-side defaults (e.g. serial
+    primary keys) will be used for them. None, NaN and NaT values are
+    written as NULL.
+
+    The records are streamed to the database; committing the
+    transaction is left to the caller.
+
+    Parameters
+    ----------
+    connection : DBAPI connection
+        psycopg2 (proxied) connection to use for the insertion.
+    records : iterable of ORM instances or (table, row) tuples
+        Records to be inserted.
+    schema_map : dict of {str : str}, optional
+        Placeholder to actual schema name mapping.
+
+    Returns
+    -------
+    collections.Counter
+        Insertion counts per full table name.
+    """
+    insertion_counts = Counter()
+    cursor = connection.cursor()
+    try:
+        for table, rows in group_records_by_table(records).items():
+            full_table_name = get_full_table_name(table=table.name, schema=table.schema,
+                                                  schema_map=schema_map)
+            column_indexes = _get_columns_with_values(rows)
+            column_names = ', '.join(_quote_identifier(column.name)
+                                     for i, column in enumerate(table.columns)
+                                     if i in column_indexes)
+            statement = f'COPY {full_table_name} ({column_names}) FROM STDIN'
+            logger.debug(f'Copying {len(rows)} records into {full_table_name}')
+            cursor.copy_expert(sql=statement,
+                               file=_LineStream(_iter_copy_lines(rows, column_indexes)))
+            insertion_counts += Counter({full_table_name: cursor.rowcount})
+    finally:
+        cursor.close()
+    return insertion_counts
+
+
+async def copy_records_async(connection,
+                             records: Iterable,
+                             schema_map: SchemaMap = None,
+                             ) -> Counter:
+    """
+    Insert records via the binary COPY protocol of asyncpg.
+
+    As with copy_records, columns without any values are left out and
+    None, NaN and NaT values are written as NULL. Other values must be
+    of the python type asyncpg expects for the column type, e.g.
+    datetime.date for date columns.
+
+    Parameters
+    ----------
+    connection : asyncpg.Connection
+        Connection to use for the insertion.
+    records : iterable of ORM instances or (table, row) tuples
+        Records to be inserted. Can also be a mapping of tables to
+        lists of rows.
+    schema_map : dict of {str : str}, optional
+        Placeholder to actual schema name mapping.
+
+    Returns
+    -------
+    collections.Counter
+        Insertion counts per full table name.
+    """
+    schema_map = schema_map or {}
+    insertion_counts = Counter()
+    for table, rows in group_records_by_table(records).items():
+        schema = schema_map.get(table.schema, table.schema)
+        full_table_name = get_full_table_name(table=table.name, schema=table.schema,
+                                              schema_map=schema_map)
+        column_indexes = _get_columns_with_values(rows)
+        columns = list(table.columns)
+        logger.debug(f'Copying {len(rows)} records into {full_table_name}')
+        status = await connection.copy_records_to_table(
+            table.name, schema_name=schema,
+            columns=[columns[i].name for i in column_indexes],
+            records=([_null_if_missing(row[i]) for i in column_indexes] for row in rows),
+        )
+        # Status message of the form 'COPY <rows>'
+        insertion_counts += Counter({full_table_name: int(status.split()[-1])})
+    return insertion_counts
+
+
+def format_copy_value(value: Any) -> str:
+    """
+    Format a python value for the PostgreSQL COPY text format.
+
+    Parameters
+    ----------
+    value : Any
+        Value to format.
+
+    Returns
+    -------
+    str
+        The value as it should be written in the COPY input stream.
+    """
+    if value is None or value is pd.NaT or value is pd.NA:
+        return _COPY_NULL
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    if isinstance(value, (bool, np.bool_)):
+        return 't' if value else 'f'
+    if isinstance(value, (float, np.floating)):
+        return _COPY_NULL if np.isnan(value) else str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _as_table(table_or_class: Any) -> Table:
+    if isinstance(table_or_class, Table):
+        return table_or_class
+    return table_or_class.__table__
+
+
+def _get_column_default(column) -> Any:
+    default = column.default
+    if default.is_scalar:
+        return default.arg
+    if default.is_callable:
+        return default.arg(None)
+    # Sequences and SQL expressions are left to the database
+    return None
+
+
+_attribute_keys_cache: Dict[type, List[str]] = {}
+
+
+def _get_attribute_keys(mapped_class: type) -> List[str]:
+    # ORM attribute names may differ from the column names, so
+    # translate each table column to its mapped attribute name.
+    keys = _attribute_keys_cache.get(mapped_class)
+    if keys is None:
+        mapper = inspect(mapped_class)
+        keys = [mapper.get_property_by_column(column).key
+                for column in mapper.local_table.columns]
+        _attribute_keys_cache[mapped_class] = keys
+    return keys
+
+
+def _get_columns_with_values(rows: List[Tuple]) -> List[int]:
+    n_columns = len(rows[0])
+    return [i for i in range(n_columns)
+            if any(row[i] is not None for row in rows)]
+
+
+def _null_if_missing(value: Any) -> Any:
+    if value is pd.NaT or (isinstance(value, float) and value != value):
+        return None
+    return value
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _iter_copy_lines(rows: List[Tuple], column_indexes: List[int]) -> Iterator[str]:
+    for row in rows:
+        yield '\t'.join([format_copy_value(row[i]) for i in column_indexes]) + '\n'
+
+
+class _LineStream(io.TextIOBase):
+    """Read-only file-like object over an iterator of lines."""
+
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buffer = ''
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size is None or size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = ''.join(chunks)
+        if size is None or size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
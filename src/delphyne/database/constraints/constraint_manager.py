@@ -7,21 +7,35 @@ defined by the user in the template, and the reflected metadata at
 Database.reflected_metadata which contains table definitions of what is
 actually present in the database. Add-methods use the model metadata,
 while drop-methods use the reflected metadata.
+
+The reflected constraints/indexes are indexed by name and by functional
+signature once, after which the index is kept up to date as the
+ConstraintManager adds and drops objects. After changing constraints or
+tables by other means, call
+ConstraintManager.invalidate_current_db_cache.
 """
 
 from __future__ import annotations
 
 import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from copy import copy
-from functools import lru_cache, wraps
-from typing import TYPE_CHECKING, Union, Dict, Callable, List, Tuple
+from functools import lru_cache, partial
+from typing import (TYPE_CHECKING, Union, Dict, Callable, ContextManager, FrozenSet, Iterable,
+                    List, Optional, Set, Tuple)
 
 from itertools import chain
-from sqlalchemy import Index, Table, PrimaryKeyConstraint, Constraint, MetaData
+from sqlalchemy import (Index, Table, PrimaryKeyConstraint, Constraint, MetaData,
+                        ForeignKeyConstraint, UniqueConstraint, text)
+from sqlalchemy.engine import Connection
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.schema import DropConstraint, AddConstraint, DropIndex, CreateIndex
 
 from .conventions import VOCAB_TABLES
+from .ddl import AddNotValidConstraint, ValidateConstraint
 
 if TYPE_CHECKING:
     from ..database import Database
@@ -31,6 +45,7 @@ _VALID_ERRORS_OPTIONS = {'raise', 'ignore'}
 logger = logging.getLogger(__name__)
 
 ConstraintOrIndex = Union[Constraint, Index]
+Signature = Tuple[type, str, FrozenSet[str]]
 
 
 def _is_non_pk_constraint(constraint: ConstraintOrIndex) -> bool:
@@ -42,13 +57,52 @@ def _is_non_pk_constraint(constraint: ConstraintOrIndex) -> bool:
     return False
 
 
-def _invalidate_db_cache(func: Callable) -> Callable:
-    # Decorator to invalidate cached derivatives of reflected MetaData
-    @wraps(func)
-    def wrapper_invalidate_db_cache(*args, **kwargs):
-        ConstraintManager.invalidate_current_db_cache()
-        return func(*args, **kwargs)
-    return wrapper_invalidate_db_cache
+def _get_signature(constraint: ConstraintOrIndex) -> Signature:
+    # Constraints/indexes with the same signature are assumed to be
+    # functional equivalents: they have the same type and act on the
+    # same table and columns. This works for all regular CDM
+    # constraints, but could fall short on custom constraints.
+    return (type(constraint), constraint.table.name,
+            frozenset(c.name for c in constraint.columns))
+
+
+def _group_by_table(constraints: List[ConstraintOrIndex]) -> List[List[ConstraintOrIndex]]:
+    # Group constraints/indexes per table, keeping their order. Adding
+    # or dropping a FK locks both tables involved, so tables with FKs
+    # referencing each other (directly or indirectly) share a group, to
+    # prevent concurrent groups from deadlocking.
+    references: Dict[str, Set[str]] = defaultdict(set)
+    for constraint in constraints:
+        if isinstance(constraint, ForeignKeyConstraint):
+            references[constraint.table.name].add(constraint.referred_table.name)
+
+    reachable: Dict[str, Set[str]] = {}
+    for table_name in references:
+        seen: Set[str] = set()
+        stack = list(references[table_name])
+        while stack:
+            name = stack.pop()
+            if name not in seen:
+                seen.add(name)
+                stack.extend(references.get(name, ()))
+        reachable[table_name] = seen
+
+    groups: Dict[str, List[ConstraintOrIndex]] = {}
+    for constraint in constraints:
+        table_name = constraint.table.name
+        cycle = {name for name in reachable.get(table_name, ())
+                 if table_name in reachable.get(name, ())}
+        group_key = min(cycle | {table_name})
+        groups.setdefault(group_key, []).append(constraint)
+    return list(groups.values())
+
+
+def _is_supported_by(fk: ForeignKeyConstraint, constraint: ConstraintOrIndex) -> bool:
+    # An index supports lookups on the FK columns if these are its
+    # leading columns, in any order
+    fk_columns = {c.name for c in fk.columns}
+    leading_columns = {c.name for c in list(constraint.columns)[:len(fk_columns)]}
+    return fk_columns == leading_columns
 
 
 def _create_constraint_lookup(metadata: MetaData) -> Dict[str, ConstraintOrIndex]:
@@ -79,6 +133,45 @@ class _TargetModel:
         # All non-pk model constraints
         self.constraints = [c for c in self.constraint_lookup.values()
                             if _is_non_pk_constraint(c)]
+        # Indexes on model tables that are not part of the metadata
+        self._added_indexes: Dict[str, List[Index]] = {}
+
+    def add_index(self, index: Index) -> None:
+        """
+        Add an index on a model table that is not part of the metadata.
+
+        The index is only known to this instance, the model table
+        itself is left unchanged.
+
+        Parameters
+        ----------
+        index : sqlalchemy.Index
+            Index bound to a model table.
+
+        Returns
+        -------
+        None
+        """
+        self.constraint_lookup[index.name] = index
+        self.indexes.append(index)
+        self._added_indexes.setdefault(index.table.name, []).append(index)
+
+    def get_table_indexes(self, table_name: str) -> List[Index]:
+        """
+        Get the model indexes of a table, including added indexes.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of a model table.
+
+        Returns
+        -------
+        list of sqlalchemy.Index
+            The indexes of the table.
+        """
+        table = self.table_lookup[table_name]
+        return list(chain(table.indexes, self._added_indexes.get(table_name, [])))
 
     def is_model_table(self, table_name: str) -> bool:
         """
@@ -97,6 +190,133 @@ class _TargetModel:
         return table_name in self.table_lookup
 
 
+class _ReflectedConstraints:
+    """
+    Lookup class for the constraints/indexes present in the database.
+
+    Constraints/indexes are looked up by name and by functional
+    signature. After creation from the reflected metadata, objects are
+    added and removed as they are added to or dropped from the database.
+
+    Parameters
+    ----------
+    metadata : sqlalchemy.MetaData
+        Reflected metadata of the database.
+    """
+
+    def __init__(self, metadata: MetaData):
+        self._by_name: Dict[str, ConstraintOrIndex] = {}
+        self._by_signature: Dict[Signature, Dict[str, ConstraintOrIndex]] = defaultdict(dict)
+        self._lock = threading.Lock()
+        for constraint in _create_constraint_lookup(metadata).values():
+            self.add(constraint)
+
+    def get(self, name: str) -> Optional[ConstraintOrIndex]:
+        """
+        Get a constraint/index by name.
+
+        Parameters
+        ----------
+        name : str
+            Name of the constraint/index.
+
+        Returns
+        -------
+        sqlalchemy.Constraint or sqlalchemy.Index or None
+            The constraint/index, or None if not present.
+        """
+        return self._by_name.get(name)
+
+    def get_equivalent(self, constraint: ConstraintOrIndex) -> Optional[ConstraintOrIndex]:
+        """
+        Get a functional equivalent of a constraint/index.
+
+        Parameters
+        ----------
+        constraint : sqlalchemy.Constraint or sqlalchemy.Index
+            Constraint/index, possibly of another MetaData instance.
+
+        Returns
+        -------
+        sqlalchemy.Constraint or sqlalchemy.Index or None
+            A present constraint/index acting on the same table and
+            columns, or None if there is none.
+        """
+        equivalents = self._by_signature.get(_get_signature(constraint))
+        if not equivalents:
+            return None
+        return next(iter(equivalents.values()))
+
+    def get_table_objects(self, table_names: Iterable[str]) -> List[ConstraintOrIndex]:
+        """
+        Get all constraints/indexes of a set of tables.
+
+        Parameters
+        ----------
+        table_names : iterable of str
+            Names of the tables, without schema name.
+
+        Returns
+        -------
+        list of sqlalchemy.Constraint or sqlalchemy.Index
+        """
+        table_names = set(table_names)
+        return [c for c in self._by_name.values() if c.table.name in table_names]
+
+    def get_referencing_fks(self, table_names: Iterable[str]) -> List[ForeignKeyConstraint]:
+        """
+        Get all FK constraints that reference a set of tables.
+
+        Parameters
+        ----------
+        table_names : iterable of str
+            Names of the referenced tables, without schema name.
+
+        Returns
+        -------
+        list of sqlalchemy.ForeignKeyConstraint
+        """
+        table_names = set(table_names)
+        return [c for c in self._by_name.values() if isinstance(c, ForeignKeyConstraint)
+                and c.referred_table.name in table_names]
+
+    def add(self, constraint: ConstraintOrIndex) -> None:
+        """
+        Register a constraint/index as present in the database.
+
+        Parameters
+        ----------
+        constraint : sqlalchemy.Constraint or sqlalchemy.Index
+
+        Returns
+        -------
+        None
+        """
+        # SQLAlchemy reflects empty PK objects in tables that don't have
+        # a PK (anymore). These are not actual database objects.
+        if constraint.name is None:
+            return
+        with self._lock:
+            self._by_name[constraint.name] = constraint
+            self._by_signature[_get_signature(constraint)][constraint.name] = constraint
+
+    def remove(self, constraint: ConstraintOrIndex) -> None:
+        """
+        Register a constraint/index as no longer present.
+
+        Parameters
+        ----------
+        constraint : sqlalchemy.Constraint or sqlalchemy.Index
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._by_name.pop(constraint.name, None)
+            self._by_signature[_get_signature(constraint)].pop(constraint.name, None)
+
+
 class ConstraintManager:
     """
     Manager for adding and removing table constraints/indexes.
@@ -119,13 +339,18 @@ class ConstraintManager:
 
     @property
     @lru_cache()
-    def _reflected_constraint_lookup(self) -> Dict[str, ConstraintOrIndex]:
-        return _create_constraint_lookup(self._db.reflected_metadata)
+    def _reflected_constraints(self) -> _ReflectedConstraints:
+        return _ReflectedConstraints(self._reflected_metadata)
 
     @property
     @lru_cache()
     def _reflected_table_lookup(self) -> Dict[str, Table]:
-        return {t.name: t for t in self._db.reflected_metadata.tables.values()}
+        return {t.name: t for t in self._reflected_metadata.tables.values()}
+
+    @property
+    @lru_cache()
+    def _reflected_metadata(self) -> MetaData:
+        return self._db.reflected_metadata
 
     @staticmethod
     def invalidate_current_db_cache() -> None:
@@ -137,14 +362,17 @@ class ConstraintManager:
         None
         """
         logger.debug('Invalidating database tables cache')
+        ConstraintManager._reflected_metadata.fget.cache_clear()
         ConstraintManager._reflected_table_lookup.fget.cache_clear()
-        ConstraintManager._reflected_constraint_lookup.fget.cache_clear()
+        ConstraintManager._reflected_constraints.fget.cache_clear()
 
     def drop_all_constraints(self,
                              drop_constraint: bool = True,
                              drop_pk: bool = True,
                              drop_index: bool = True,
                              errors: str = 'raise',
+                             max_workers: int = 1,
+                             maintenance_work_mem: Optional[str] = None,
                              ) -> None:
         """
         Remove constraints/indexes of all tables (including vocabulary).
@@ -168,6 +396,13 @@ class ConstraintManager:
             encountering an object that cannot be dropped.
             If 'ignore', raise no exception and try to drop the
             remaining constraints (if any).
+        max_workers : int, default 1
+            Maximum number of tables of which constraints/indexes are
+            dropped simultaneously.
+        maintenance_work_mem : str, optional
+            Value of maintenance_work_mem for the database sessions
+            that drop the constraints/indexes, e.g. '1GB'. By default,
+            the server setting is used.
 
         Returns
         -------
@@ -175,21 +410,24 @@ class ConstraintManager:
         """
         logger.info('Dropping all constraints')
 
-        tables = [table for table in self._db.reflected_metadata.tables.values()
-                  if self._model.is_model_table(table.name)]
+        table_names = [name for name in self._reflected_table_lookup
+                       if self._model.is_model_table(name)]
+        objects = self._reflected_constraints.get_table_objects(table_names)
 
-        constraints, pks, indexes = self._get_table_objects(tables, drop_constraint,
-                                                            drop_pk, drop_index)
+        constraints, pks, indexes = self._split_objects(objects, drop_constraint,
+                                                        drop_pk, drop_index)
 
-        for constraint in chain(constraints, indexes, pks):
-            self._drop_constraint_in_db(constraint, errors)
+        self._drop_constraints_in_db(list(chain(constraints, indexes, pks)), errors,
+                                     max_workers, maintenance_work_mem)
 
-    @_invalidate_db_cache
     def add_all_constraints(self,
                             add_constraint: bool = True,
                             add_pk: bool = True,
                             add_index: bool = True,
                             errors: str = 'raise',
+                            max_workers: int = 1,
+                            maintenance_work_mem: Optional[str] = None,
+                            fk_not_valid: bool = False,
                             ) -> None:
         """
         Add constraints/indexes of all tables (including vocabulary).
@@ -217,6 +455,18 @@ class ConstraintManager:
             encountering an object that cannot be added.
             If 'ignore', raise no exception and try to add the remaining
             constraints (if any).
+        max_workers : int, default 1
+            Maximum number of tables of which constraints/indexes are
+            added simultaneously.
+        maintenance_work_mem : str, optional
+            Value of maintenance_work_mem for the database sessions
+            that add the constraints/indexes, e.g. '1GB'. By default,
+            the server setting is used.
+        fk_not_valid : bool, default False
+            If True, add FKs as NOT VALID, which skips checking the
+            existing rows, and validate them afterwards, see
+            validate_constraints. FKs that fail validation are logged
+            and remain NOT VALID.
 
         Returns
         -------
@@ -231,14 +481,16 @@ class ConstraintManager:
         if add_constraint:
             constraints = self._model.constraints
 
-        for constraint in chain(indexes, pks, constraints):
-            self._add_constraint_in_db(constraint, errors)
+        self._add_constraints_in_db(list(chain(indexes, pks, constraints)), errors,
+                                    max_workers, maintenance_work_mem, fk_not_valid)
 
     def drop_cdm_constraints(self,
                              drop_constraint: bool = True,
                              drop_pk: bool = True,
                              drop_index: bool = True,
                              errors: str = 'raise',
+                             max_workers: int = 1,
+                             maintenance_work_mem: Optional[str] = None,
                              ) -> None:
         """
         Remove constraints/indexes of all non-vocabulary tables.
@@ -263,6 +515,13 @@ class ConstraintManager:
             encountering an object that cannot be dropped.
             If 'ignore', raise no exception and try to drop the
             remaining constraints (if any).
+        max_workers : int, default 1
+            Maximum number of tables of which constraints/indexes are
+            dropped simultaneously.
+        maintenance_work_mem : str, optional
+            Value of maintenance_work_mem for the database sessions
+            that drop the constraints/indexes, e.g. '1GB'. By default,
+            the server setting is used.
 
         Returns
         -------
@@ -270,22 +529,24 @@ class ConstraintManager:
         """
         logger.info('Dropping CDM constraints')
 
-        tables = [table for table in self._db.reflected_metadata.tables.values()
-                  if self._model.is_model_table(table.name)
-                  and table.name not in VOCAB_TABLES]
+        table_names = [name for name in self._reflected_table_lookup
+                       if self._model.is_model_table(name) and name not in VOCAB_TABLES]
+        objects = self._reflected_constraints.get_table_objects(table_names)
 
-        constraints, pks, indexes = self._get_table_objects(tables, drop_constraint,
-                                                            drop_pk, drop_index)
+        constraints, pks, indexes = self._split_objects(objects, drop_constraint,
+                                                        drop_pk, drop_index)
 
-        for constraint in chain(constraints, indexes, pks):
-            self._drop_constraint_in_db(constraint, errors)
+        self._drop_constraints_in_db(list(chain(constraints, indexes, pks)), errors,
+                                     max_workers, maintenance_work_mem)
 
-    @_invalidate_db_cache
     def add_cdm_constraints(self,
                             add_constraint: bool = True,
                             add_pk: bool = True,
                             add_index: bool = True,
                             errors: str = 'raise',
+                            max_workers: int = 1,
+                            maintenance_work_mem: Optional[str] = None,
+                            fk_not_valid: bool = False,
                             ) -> None:
         """
         Add constraints/indexes of all non-vocabulary tables.
@@ -314,6 +575,18 @@ class ConstraintManager:
             encountering an object that cannot be added.
             If 'ignore', raise no exception and try to add the remaining
             constraints (if any).
+        max_workers : int, default 1
+            Maximum number of tables of which constraints/indexes are
+            added simultaneously.
+        maintenance_work_mem : str, optional
+            Value of maintenance_work_mem for the database sessions
+            that add the constraints/indexes, e.g. '1GB'. By default,
+            the server setting is used.
+        fk_not_valid : bool, default False
+            If True, add FKs as NOT VALID, which skips checking the
+            existing rows, and validate them afterwards, see
+            validate_constraints. FKs that fail validation are logged
+            and remain NOT VALID.
 
         Returns
         -------
@@ -328,11 +601,11 @@ class ConstraintManager:
         if add_constraint:
             constraints = self._model.constraints
 
-        for constraint in chain(indexes, pks, constraints):
-            if constraint.table.name not in VOCAB_TABLES:
-                self._add_constraint_in_db(constraint, errors)
+        cdm_constraints = [c for c in chain(indexes, pks, constraints)
+                           if c.table.name not in VOCAB_TABLES]
+        self._add_constraints_in_db(cdm_constraints, errors, max_workers, maintenance_work_mem,
+                                    fk_not_valid)
 
-    @_invalidate_db_cache
     def drop_table_constraints(self,
                                table_name: str,
                                drop_constraint: bool = True,
@@ -366,17 +639,15 @@ class ConstraintManager:
         None
         """
         logger.info(f'Dropping constraints on table {table_name}')
-        table = self._reflected_table_lookup.get(table_name)
-        if table is None:
+        if table_name not in self._reflected_table_lookup:
             raise KeyError(f'No table found in database with name "{table_name}"')
+        objects = self._reflected_constraints.get_table_objects([table_name])
 
-        constraints, pks, indexes = self._get_table_objects([table], drop_constraint,
-                                                            drop_pk, drop_index)
+        constraints, pks, indexes = self._split_objects(objects, drop_constraint,
+                                                        drop_pk, drop_index)
 
-        for constraint in chain(constraints, indexes, pks):
-            self._drop_constraint_in_db(constraint, errors)
+        self._drop_constraints_in_db(list(chain(constraints, indexes, pks)), errors)
 
-    @_invalidate_db_cache
     def add_table_constraints(self,
                               table_name: str,
                               add_constraint: bool = True,
@@ -421,13 +692,12 @@ class ConstraintManager:
         if table is None:
             raise KeyError(f'No table found in model with name "{table_name}"')
 
-        constraints, pks, indexes = self._get_table_objects([table], add_constraint,
-                                                            add_pk, add_index)
+        table_objects = chain(table.constraints, self._model.get_table_indexes(table_name))
+        constraints, pks, indexes = self._split_objects(table_objects,
+                                                        add_constraint, add_pk, add_index)
 
-        for constraint in chain(indexes, pks, constraints):
-            self._add_constraint_in_db(constraint, errors)
+        self._add_constraints_in_db(list(chain(indexes, pks, constraints)), errors)
 
-    @_invalidate_db_cache
     def drop_constraint_or_index(self, name: str, errors: str = 'raise') -> None:
         """
         Drop a single constraint/index by name.
@@ -450,13 +720,12 @@ class ConstraintManager:
         -------
         None
         """
-        constraint = self._reflected_constraint_lookup.get(name)
+        constraint = self._reflected_constraints.get(name)
         if constraint is None:
             raise KeyError(f'Constraint "{name}" not found')
         else:
             self._drop_constraint_in_db(constraint, errors)
 
-    @_invalidate_db_cache
     def add_constraint_or_index(self, name: str, errors: str = 'raise') -> None:
         """
         Add a single constraint/index by name.
@@ -482,30 +751,236 @@ class ConstraintManager:
         constraint = self._get_constraint_from_model(name)
         self._add_constraint_in_db(constraint, errors)
 
+    @contextmanager
+    def constraints_suspended(self,
+                              table_names: Iterable[str],
+                              max_workers: int = 1,
+                              maintenance_work_mem: Optional[str] = None,
+                              ) -> ContextManager[None]:
+        """
+        Suspend indexes and FKs of tables for the duration of a load.
+
+        Drops the indexes and FKs of the given tables, as well as the
+        FKs of other tables that reference them. PKs, unique and check
+        constraints remain active. When closing the with statement,
+        exactly the dropped objects are added again, also if an
+        exception occurred. Objects that cannot be restored, e.g.
+        because loaded records violate a FK, are logged.
+
+        Parameters
+        ----------
+        table_names : iterable of str
+            Names of the tables to load, without schema name.
+        max_workers : int, default 1
+            Maximum number of tables of which constraints/indexes are
+            dropped and added simultaneously.
+        maintenance_work_mem : str, optional
+            Value of maintenance_work_mem for the database sessions
+            that drop and add the constraints/indexes, e.g. '1GB'. By
+            default, the server setting is used.
+
+        Yields
+        ------
+        None
+        """
+        table_names = set(table_names)
+        for table_name in table_names:
+            if table_name not in self._reflected_table_lookup:
+                raise KeyError(f'No table found in database with name "{table_name}"')
+
+        objects = [c for c in self._reflected_constraints.get_table_objects(table_names)
+                   if isinstance(c, (Index, ForeignKeyConstraint))]
+        objects.extend(c for c in self._reflected_constraints.get_referencing_fks(table_names)
+                       if c.table.name not in table_names)
+
+        logger.info(f'Suspending {len(objects)} constraints/indexes of tables: '
+                    f'{", ".join(sorted(table_names))}')
+        try:
+            self._drop_constraints_in_db(objects, 'raise', max_workers, maintenance_work_mem)
+            yield
+        finally:
+            logger.info(f'Restoring {len(objects)} suspended constraints/indexes')
+            # Objects that were not dropped are skipped, as they are
+            # still active
+            self._add_constraints_in_db(objects, 'ignore', max_workers, maintenance_work_mem)
+            missing = [c.name for c in objects if self._reflected_constraints.get(c.name) is None
+                       and self._reflected_constraints.get_equivalent(c) is None]
+            if missing:
+                logger.error(f'Unable to restore suspended constraints/indexes: '
+                             f'{", ".join(sorted(missing))}')
+
+    def get_unindexed_fks(self) -> List[ForeignKeyConstraint]:
+        """
+        Get the model FK constraints without a supporting index.
+
+        A FK is supported by an index, PK or unique constraint of which
+        the leading columns are the FK columns. Without one, deleting
+        records from the referenced table requires a sequential scan of
+        the referencing table for every deleted record.
+
+        Returns
+        -------
+        list of sqlalchemy.ForeignKeyConstraint
+            The unsupported FKs of the model.
+        """
+        unindexed_fks = []
+        for table in self._model.table_lookup.values():
+            table_indexes = self._model.get_table_indexes(table.name)
+            supporting = [c for c in chain(table_indexes, table.constraints)
+                          if isinstance(c, (Index, PrimaryKeyConstraint, UniqueConstraint))]
+            for fk in table.foreign_key_constraints:
+                if not any(_is_supported_by(fk, c) for c in supporting):
+                    logger.info(f'No index supports {fk.name}')
+                    unindexed_fks.append(fk)
+        return unindexed_fks
+
+    def add_fk_indexes(self,
+                       errors: str = 'raise',
+                       max_workers: int = 1,
+                       maintenance_work_mem: Optional[str] = None,
+                       ) -> List[Index]:
+        """
+        Add indexes for all model FK constraints without one.
+
+        The indexes are named according to the naming convention and
+        created in the database for the tables that exist. From then
+        on, this constraint manager adds and drops them like any other
+        model index.
+
+        The indexes are kept by this constraint manager only. The model
+        tables, which are shared by all databases using the same
+        SQLAlchemy Base, are left unchanged, so the indexes are not
+        created by ``MetaData.create_all``.
+
+        Parameters
+        ----------
+        errors : {'ignore', 'raise'}, default 'raise'
+            Behavior in case one or more indexes cannot be created.
+            If 'raise', an exception will be raised upon first
+            encountering an index that cannot be created.
+            If 'ignore', raise no exception and try to create the
+            remaining indexes (if any).
+        max_workers : int, default 1
+            Maximum number of tables of which indexes are created
+            simultaneously.
+        maintenance_work_mem : str, optional
+            Value of maintenance_work_mem for the database sessions
+            that create the indexes, e.g. '1GB'. By default, the server
+            setting is used.
+
+        Returns
+        -------
+        list of sqlalchemy.Index
+            The added indexes.
+        """
+        indexes = []
+        for fk in self.get_unindexed_fks():
+            # The name is set by the naming convention. Creating the
+            # index attaches it to the shared model table; detach it
+            # again, so only this constraint manager knows of it.
+            index = Index(None, *fk.columns)
+            index.table.indexes.discard(index)
+            self._model.add_index(index)
+            indexes.append(index)
+        logger.info(f'Adding {len(indexes)} FK indexes')
+        existing = [index for index in indexes
+                    if index.table.name in self._reflected_table_lookup]
+        self._add_constraints_in_db(existing, errors, max_workers, maintenance_work_mem)
+        return indexes
+
+    def validate_constraints(self,
+                             names: Optional[List[str]] = None,
+                             max_workers: int = 1,
+                             maintenance_work_mem: Optional[str] = None,
+                             ) -> Dict[str, str]:
+        """
+        Validate FK constraints that were added as NOT VALID.
+
+        Validation checks the existing rows of the table against the
+        constraint. Constraints of different tables are validated
+        concurrently, as validation does not block reads and writes on
+        the referenced tables. A constraint that fails validation
+        remains NOT VALID; the failure is logged and validation of the
+        other constraints continues.
+
+        Parameters
+        ----------
+        names : list of str, optional
+            Names of the constraints to validate. By default, all FK
+            constraints on model tables that are not validated yet.
+        max_workers : int, default 1
+            Maximum number of tables of which constraints are validated
+            simultaneously.
+        maintenance_work_mem : str, optional
+            Value of maintenance_work_mem for the database sessions
+            that validate the constraints, e.g. '1GB'. By default, the
+            server setting is used.
+
+        Returns
+        -------
+        dict of {str : str}
+            Error message per constraint that failed validation.
+        """
+        if names is None:
+            names = self._get_not_valid_constraint_names()
+        constraints = []
+        for name in names:
+            constraint = self._reflected_constraints.get(name)
+            if constraint is None:
+                raise KeyError(f'Constraint "{name}" not found')
+            constraints.append(constraint)
+
+        logger.info(f'Validating {len(constraints)} constraints')
+        failures: Dict[str, str] = {}
+        self._execute_per_table(constraints,
+                                partial(self._validate_constraint, failures=failures),
+                                'ignore', max_workers, maintenance_work_mem)
+        if failures:
+            logger.warning(f'{len(failures)} constraints failed validation '
+                           f'and remain NOT VALID: {", ".join(sorted(failures))}')
+        return failures
+
+    def _get_not_valid_constraint_names(self) -> List[str]:
+        # NOT VALID FKs on model tables only, other tables in the same
+        # schemas are not part of the reflected constraints
+        query = text("""
+            SELECT pg_constraint.conname
+            FROM pg_constraint
+                JOIN pg_class ON pg_class.oid = pg_constraint.conrelid
+                JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+            WHERE NOT pg_constraint.convalidated
+                AND pg_constraint.contype = 'f'
+                AND pg_namespace.nspname || '.' || pg_class.relname = ANY(:table_names)
+        """)
+        schema_map = self._db.schema_translate_map
+        table_names = [f'{schema_map.get(table.schema, table.schema)}.{table.name}'
+                       for table in self._db.base.metadata.tables.values()]
+        with self._db.engine.connect() as conn:
+            rows = conn.execute(query, table_names=table_names).fetchall()
+        return [row.conname for row in rows]
+
     @staticmethod
-    def _get_table_objects(tables: List[Table],
-                           get_constraints: bool,
-                           get_pks: bool,
-                           get_indexes: bool
-                           ) -> Tuple[List[Constraint], List[PrimaryKeyConstraint], List[Index]]:
-        # Return the non-pk constraints, pks and indexes of a list of
-        # tables.
+    def _split_objects(objects: Iterable[ConstraintOrIndex],
+                       get_constraints: bool,
+                       get_pks: bool,
+                       get_indexes: bool
+                       ) -> Tuple[List[Constraint], List[PrimaryKeyConstraint], List[Index]]:
+        # Return the non-pk constraints, pks and indexes of a collection
+        # of table objects.
         # Because we don't know in which order the table constraints can
         # be dropped without violating one in the process, we first
         # collect all of them. They can then safely be dropped in the
         # following order: non-pk constraints, indexes, pks.
         constraints, pks, indexes = [], [], []
-        for table in tables:
-            for constraint in table.constraints:
-                is_pk = isinstance(constraint, PrimaryKeyConstraint)
-                if is_pk and get_pks:
-                    pks.append(constraint)
-                elif not is_pk and get_constraints:
-                    constraints.append(constraint)
-
-            if get_indexes:
-                for index in table.indexes:
-                    indexes.append(index)
+        for obj in objects:
+            if isinstance(obj, Index):
+                if get_indexes:
+                    indexes.append(obj)
+            elif isinstance(obj, PrimaryKeyConstraint):
+                if get_pks:
+                    pks.append(obj)
+            elif get_constraints:
+                constraints.append(obj)
         return constraints, pks, indexes
 
     def _get_constraint_from_model(self, constraint_name: str) -> ConstraintOrIndex:
@@ -518,77 +993,169 @@ class ConstraintManager:
                               constraint: ConstraintOrIndex,
                               errors: str = 'raise',
                               ) -> None:
+        self._add_constraints_in_db([constraint], errors)
+
+    def _add_constraints_in_db(self,
+                               constraints: List[ConstraintOrIndex],
+                               errors: str = 'raise',
+                               max_workers: int = 1,
+                               maintenance_work_mem: Optional[str] = None,
+                               fk_not_valid: bool = False,
+                               ) -> None:
         assert errors in _VALID_ERRORS_OPTIONS
-        if self._constraint_already_active(constraint):
-            return
-        with self._db.engine.connect() as conn:
-            logger.info(f'Adding {constraint.name}')
-            try:
-                if isinstance(constraint, Index):
-                    conn.execute(CreateIndex(constraint))
+        constraints = [c for c in constraints if not self._constraint_already_active(c)]
+        # PKs and unique constraints must exist before the FKs that
+        # reference them
+        fks = [c for c in constraints if isinstance(c, ForeignKeyConstraint)]
+        others = [c for c in constraints if not isinstance(c, ForeignKeyConstraint)]
+        self._execute_per_table(others, self._add_constraint, errors,
+                                max_workers, maintenance_work_mem)
+        self._execute_per_table(fks, partial(self._add_constraint, not_valid=fk_not_valid),
+                                errors, max_workers, maintenance_work_mem)
+        if fk_not_valid:
+            added_fks = [c.name for c in fks if self._reflected_constraints.get(c.name)]
+            self.validate_constraints(added_fks, max_workers, maintenance_work_mem)
+
+    def _add_constraint(self,
+                        conn: Connection,
+                        constraint: ConstraintOrIndex,
+                        errors: str,
+                        not_valid: bool = False,
+                        ) -> None:
+        logger.info(f'Adding {constraint.name}')
+        try:
+            if isinstance(constraint, Index):
+                conn.execute(CreateIndex(constraint))
+            else:
+                # We add a copy instead of the original constraint.
+                # Otherwise, when you later call metadata.create_all
+                # to create tables, SQLAlchemy thinks the
+                # constraints have already been created and skips
+                # them.
+                c = copy(constraint)
+                if not_valid and isinstance(c, ForeignKeyConstraint):
+                    conn.execute(AddNotValidConstraint(c))
                 else:
-                    # We add a copy instead of the original constraint.
-                    # Otherwise, when you later call metadata.create_all
-                    # to create tables, SQLAlchemy thinks the
-                    # constraints have already been created and skips
-                    # them.
-                    c = copy(constraint)
                     conn.execute(AddConstraint(c))
-            except SQLAlchemyError:
-                if errors == 'raise':
-                    raise
-                elif errors == 'ignore':
-                    logger.info(f'Unable to add {constraint.name}')
+        except SQLAlchemyError:
+            if errors == 'raise':
+                raise
+            elif errors == 'ignore':
+                logger.info(f'Unable to add {constraint.name}')
+        else:
+            self._reflected_constraints.add(constraint)
 
     def _constraint_already_active(self, new_constraint: ConstraintOrIndex) -> bool:
         base_message = f'Cannot add {type(new_constraint).__name__} "{new_constraint.name}"'
-        if new_constraint.name in self._reflected_constraint_lookup:
+        if self._reflected_constraints.get(new_constraint.name) is not None:
             logger.info(f'{base_message}, a relationship with this name already exists')
             return True
-        for constraint in self._reflected_constraint_lookup.values():
-            if self._constraints_functionally_equal(constraint, new_constraint):
-                logger.info(f'{base_message}, a functional equivalent already exists '
-                            f'with name "{constraint.name}"')
-                return True
+        constraint = self._reflected_constraints.get_equivalent(new_constraint)
+        if constraint is not None:
+            logger.info(f'{base_message}, a functional equivalent already exists '
+                        f'with name "{constraint.name}"')
+            return True
         return False
 
+    @staticmethod
+    def _validate_constraint(conn: Connection,
+                             constraint: ForeignKeyConstraint,
+                             errors: str,
+                             failures: Dict[str, str],
+                             ) -> None:
+        logger.info(f'Validating {constraint.name}')
+        try:
+            conn.execute(ValidateConstraint(constraint))
+        except SQLAlchemyError as e:
+            message = str(getattr(e, 'orig', e)).strip().split('\n')[0]
+            logger.error(f'Validation of {constraint.name} failed: {message}')
+            failures[constraint.name] = message
+
     def _drop_constraint_in_db(self,
                                constraint: ConstraintOrIndex,
                                errors: str = 'raise',
                                ) -> None:
+        self._drop_constraints_in_db([constraint], errors)
+
+    def _drop_constraints_in_db(self,
+                                constraints: List[ConstraintOrIndex],
+                                errors: str = 'raise',
+                                max_workers: int = 1,
+                                maintenance_work_mem: Optional[str] = None,
+                                ) -> None:
         # SQLAlchemy reflects empty PK objects in tables that don't have
         # a PK (anymore). These cannot be dropped because they have
         # no name and are therefore ignored here.
         assert errors in _VALID_ERRORS_OPTIONS
-        if constraint.name is None:
+        constraints = [c for c in constraints if c.name is not None]
+        # FKs must be dropped before the PKs and unique constraints
+        # they reference
+        fks = [c for c in constraints if isinstance(c, ForeignKeyConstraint)]
+        others = [c for c in constraints if not isinstance(c, ForeignKeyConstraint)]
+        for phase in (fks, others):
+            self._execute_per_table(phase, self._drop_constraint, errors,
+                                    max_workers, maintenance_work_mem)
+
+    def _drop_constraint(self,
+                         conn: Connection,
+                         constraint: ConstraintOrIndex,
+                         errors: str,
+                         ) -> None:
+        logger.info(f'Dropping {constraint.name}')
+        try:
+            if isinstance(constraint, Index):
+                conn.execute(DropIndex(constraint))
+            else:
+                conn.execute(DropConstraint(constraint))
+        except SQLAlchemyError:
+            if errors == 'raise':
+                raise
+            elif errors == 'ignore':
+                logger.info(f'Unable to drop {constraint.name}')
+        else:
+            self._reflected_constraints.remove(constraint)
+
+    def _execute_per_table(self,
+                           constraints: List[ConstraintOrIndex],
+                           action: Callable[[Connection, ConstraintOrIndex, str], None],
+                           errors: str,
+                           max_workers: int,
+                           maintenance_work_mem: Optional[str],
+                           ) -> None:
+        # Apply the action to the constraints/indexes, with tables
+        # handled concurrently. Every group of tables uses a single
+        # connection.
+        groups = _group_by_table(constraints)
+        if not groups:
             return
-
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._execute_group, group, action, errors,
+                                       maintenance_work_mem)
+                       for group in groups]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _execute_group(self,
+                       constraints: List[ConstraintOrIndex],
+                       action: Callable[[Connection, ConstraintOrIndex, str], None],
+                       errors: str,
+                       maintenance_work_mem: Optional[str],
+                       ) -> None:
         with self._db.engine.connect() as conn:
-            logger.info(f'Dropping {constraint.name}')
+            if maintenance_work_mem is not None:
+                conn.execute(text('SET maintenance_work_mem = :value')
+                             .execution_options(autocommit=True), value=maintenance_work_mem)
             try:
-                if isinstance(constraint, Index):
-                    conn.execute(DropIndex(constraint))
-                else:
-                    conn.execute(DropConstraint(constraint))
-            except SQLAlchemyError:
-                if errors == 'raise':
-                    raise
-                elif errors == 'ignore':
-                    logger.info(f'Unable to drop {constraint.name}')
-
-    @staticmethod
-    def _constraints_functionally_equal(c1: ConstraintOrIndex,
-                                        c2: ConstraintOrIndex,
-                                        ) -> bool:
-        # Check if two constraints/indexes are functional equivalents.
-        # This assumes that if they act on the same table and columns
-        # (and same column order), they are identical. This works for
-        # all regular CDM constraints, but could fall short on custom
-        # constraints.
-        if not type(c1) == type(c2):
-            return False
-        if not c1.table.name == c2.table.name:
-            return False
-        if not {c.name for c in c1.columns} == {c.name for c in c2.columns}:
-            return False
-        return True
+                for constraint in constraints:
+                    action(conn, constraint, errors)
+            finally:
+                # The setting would otherwise stay with the pooled
+                # connection
+                if maintenance_work_mem is not None:
+                    conn.execute(text('RESET maintenance_work_mem')
+                                 .execution_options(autocommit=True))
@@ -0,0 +1,41 @@
+"""Constraint DDL constructs that SQLAlchemy does not provide."""
+
+from sqlalchemy import ForeignKeyConstraint
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import AddConstraint, DDLElement
+
+
+class AddNotValidConstraint(AddConstraint):
+    """
+    Add a FK constraint without checking the existing rows.
+
+    New rows are checked as soon as the constraint is added. The
+    existing rows are checked by validating the constraint later on,
+    see ValidateConstraint.
+    """
+
+
+class ValidateConstraint(DDLElement):
+    """
+    Validate a constraint that was added as NOT VALID.
+
+    Parameters
+    ----------
+    constraint : sqlalchemy.ForeignKeyConstraint
+        The constraint to validate.
+    """
+
+    def __init__(self, constraint: ForeignKeyConstraint):
+        self.element = constraint
+
+
+@compiles(AddNotValidConstraint, 'postgresql')
+def _compile_add_not_valid_constraint(element: AddNotValidConstraint, compiler, **kw) -> str:
+    return compiler.visit_add_constraint(element, **kw) + ' NOT VALID'
+
+
+@compiles(ValidateConstraint, 'postgresql')
+def _compile_validate_constraint(element: ValidateConstraint, compiler, **kw) -> str:
+    table = compiler.preparer.format_table(element.element.table)
+    constraint = compiler.preparer.format_constraint(element.element)
+    return f'ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}'
@@ -2,13 +2,20 @@
 
 from __future__ import annotations
 
+import asyncio
+import importlib
 import logging
-from contextlib import contextmanager
+import pickle
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from getpass import getpass
 from types import MappingProxyType
-from typing import Dict, Set, FrozenSet, ContextManager, Tuple
+from typing import (AsyncContextManager, Dict, Set, FrozenSet, ContextManager, Tuple,
+                    Iterable, List, Optional)
 
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, event, MetaData, Table, text
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.session import Session
@@ -16,8 +23,16 @@ from sqlalchemy_utils.functions import database_exists
 
 from .constraints import ConstraintManager
 from .session_tracker import SessionTracker
+from .staging import StagingManager
 from ..config.models import MainConfig
-from ..model.etl_stats import EtlTransformation, open_transformation
+from ..model.etl_stats import (EtlTransformation, get_active_transformation, open_transformation,
+                               suspend_active_transformation)
+from ..util.sql import is_ddl_statement
+
+try:
+    import asyncpg
+except ImportError:  # Optional dependency, see the ASYNC extra
+    asyncpg = None
 
 logger = logging.getLogger(__name__)
 
@@ -41,8 +56,12 @@ class Database:
     reflected_metadata
     engine : sqlalchemy.engine.base.Engine
         Database engine.
+    async_pool_size : int
+        Maximum number of connections in the asyncpg connection pool.
     constraint_manager : ConstraintManager
         Access point to alter constraints/indexes of the database.
+    staging_manager : StagingManager
+        Access point to intermediate tables in the staging schema.
     """
 
     schema_translate_map: MappingProxyType = None
@@ -55,8 +74,47 @@ class Database:
                                     })
         self.base = base
         self.constraint_manager = ConstraintManager(self)
+        self.staging_manager = StagingManager(self)
         self._schemas = self._set_schemas()
         self._sessionmaker = sessionmaker(bind=self.engine, autoflush=False)
+        self.async_pool_size = 10
+        self._async_pool_task = None
+        self._async_pool_loop = None
+        self._reflected_metadata: Optional[MetaData] = None
+        self._reflection_lock = threading.RLock()
+        event.listen(self.engine, 'before_cursor_execute', _count_statement)
+        event.listen(self.engine, 'after_cursor_execute', self._invalidate_on_ddl)
+
+    def __getstate__(self) -> Dict:
+        """Get the arguments needed to recreate this instance."""
+        # An engine and its connection pool cannot be shared between
+        # processes, so a new one is created when unpickling.
+        return {
+            'uri': str(self.engine.url),
+            'schema_translate_map': dict(self.schema_translate_map),
+            'base_location': self._get_base_location(),
+        }
+
+    def __setstate__(self, state: Dict) -> None:
+        """Recreate the instance, including a new engine."""
+        module_name, base_name = state['base_location']
+        base = getattr(importlib.import_module(module_name), base_name)
+        self.__init__(uri=state['uri'], schema_translate_map=state['schema_translate_map'],
+                      base=base)
+
+    def _get_base_location(self) -> Tuple[str, str]:
+        # A declarative base class cannot be pickled by reference, as
+        # it is created dynamically. Instead, find the module attribute
+        # it was assigned to, via the modules of its mapped classes.
+        for mapped_class in self.base._decl_class_registry.values():
+            module = sys.modules.get(getattr(mapped_class, '__module__', None))
+            if module is None:
+                continue
+            for name, value in vars(module).items():
+                if value is self.base:
+                    return module.__name__, name
+        raise pickle.PicklingError('Declarative base not found in the modules '
+                                   'of its mapped classes')
 
     @classmethod
     def from_config(cls, config: MainConfig, base) -> Database:
@@ -127,6 +185,67 @@ class Database:
         """
         self.engine.dispose()
 
+    async def get_async_pool(self):
+        """
+        Get the asyncpg connection pool of the running event loop.
+
+        The pool is created on first use. Requires the optional asyncpg
+        package.
+
+        Returns
+        -------
+        asyncpg.Pool
+            Connection pool to the database.
+        """
+        if asyncpg is None:
+            raise ImportError('Async execution requires asyncpg, '
+                              'install with: pip install delphyne[ASYNC]')
+        loop = asyncio.get_running_loop()
+        task = self._async_pool_task
+        # A pool can only be used within the event loop it was created
+        # in. Concurrent callers await the same creation task.
+        if task is None or self._async_pool_loop is not loop:
+            logger.debug('Creating async connection pool')
+            url = self.engine.url
+            task = asyncio.ensure_future(asyncpg.create_pool(
+                host=url.host, port=url.port, user=url.username, password=url.password,
+                database=url.database, min_size=1, max_size=self.async_pool_size))
+            self._async_pool_task = task
+            self._async_pool_loop = loop
+        return await task
+
+    @asynccontextmanager
+    async def async_connection(self) -> AsyncContextManager:
+        """
+        Provide an asyncpg connection from the pool.
+
+        The connection is returned to the pool when closing the with
+        statement.
+
+        Yields
+        ------
+        asyncpg.Connection
+            Open connection.
+        """
+        pool = await self.get_async_pool()
+        async with pool.acquire() as connection:
+            yield connection
+
+    async def close_async_pool(self) -> None:
+        """
+        Close the asyncpg connection pool, if it was created.
+
+        Must be called from the event loop the pool was created in.
+
+        Returns
+        -------
+        None
+        """
+        task, self._async_pool_task = self._async_pool_task, None
+        if task is not None:
+            pool = await task
+            await pool.close()
+
     @staticmethod
     def _perform_rollback(session: Session) -> None:
         logger.info('Performing rollback')
@@ -198,10 +317,13 @@ class Database:
         session = self.get_new_session()
         session_id = id(session)
         with open_transformation(name=name) as metadata:
-            SessionTracker.sessions[session_id] = metadata
+            SessionTracker.add_session(session_id, metadata)
             try:
                 yield session, metadata
-                session.commit()
+                with metadata.time_phase('flush'):
+                    session.flush()
+                with metadata.time_phase('commit'):
+                    session.commit()
             except Exception as e:
                 logging.error(e, exc_info=True)
                 self._perform_rollback(session)
@@ -237,13 +359,202 @@ class Database:
             logger.error(f'Could not connect. Database "{db_name}" does not exist')
         return db_exists
 
+    def get_unlogged_tables(self) -> Set[str]:
+        """
+        Get the names of the model tables that are UNLOGGED.
+
+        Returns
+        -------
+        set of str
+            Names of the tables, without schema name.
+        """
+        query = text("""
+            SELECT pg_class.relname
+            FROM pg_class
+                JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+            WHERE pg_class.relpersistence = 'u'
+                AND pg_class.relkind IN ('r', 'p')
+                AND pg_namespace.nspname = ANY(:schemas)
+        """)
+        with self.engine.connect() as conn:
+            rows = conn.execute(query, schemas=list(self.schemas)).fetchall()
+        model_tables = {table.name for table in self.base.metadata.tables.values()}
+        return {row.relname for row in rows if row.relname in model_tables}
+
+    def set_tables_unlogged(self, tables: Iterable[Table], max_workers: int = 1) -> None:
+        """
+        Make model tables UNLOGGED, to speed up loading them.
+
+        Writes to unlogged tables skip the write-ahead log, but their
+        contents are lost after a crash. A logged table cannot reference
+        an unlogged table, so tables are altered in order of their
+        foreign keys, referencing tables first. Tables that do not
+        reference each other are altered in parallel. Tables referenced
+        by a logged table that is not part of the given tables cannot be
+        made unlogged, as long as that foreign key exists.
+
+        Parameters
+        ----------
+        tables : iterable of sqlalchemy.Table
+            Model tables to alter.
+        max_workers : int, default 1
+            Maximum number of tables that are altered simultaneously.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If some of the tables reference each other in a cycle. As
+            PostgreSQL checks the persistence of both sides of a
+            foreign key, such tables cannot be altered one at a time.
+        """
+        levels = _get_dependency_levels(list(tables))
+        self._set_table_persistence(reversed(levels), 'UNLOGGED', max_workers)
+
+    def set_tables_logged(self,
+                          tables: Optional[Iterable[Table]] = None,
+                          max_workers: int = 1,
+                          ) -> None:
+        """
+        Make unlogged model tables LOGGED again, after loading them.
+
+        Every altered table is rewritten to the write-ahead log, which
+        makes this the expensive part of the UNLOGGED load mode. Tables
+        are altered in order of their foreign keys, referenced tables
+        first. Tables that do not reference each other are altered in
+        parallel.
+
+        Parameters
+        ----------
+        tables : iterable of sqlalchemy.Table, optional
+            Model tables to alter. By default, all model tables that are
+            currently unlogged.
+        max_workers : int, default 1
+            Maximum number of tables that are altered simultaneously.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If some of the tables reference each other in a cycle.
+        """
+        unlogged_tables = self.get_unlogged_tables()
+        if tables is None:
+            tables = self.base.metadata.tables.values()
+        tables = [table for table in tables if table.name in unlogged_tables]
+        levels = _get_dependency_levels(tables)
+        self._set_table_persistence(levels, 'LOGGED', max_workers)
+
+    def _set_table_persistence(self,
+                               levels: Iterable[List[Table]],
+                               persistence: str,
+                               max_workers: int,
+                               ) -> None:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for level in levels:
+                # Every level must be complete before the next one
+                # starts
+                list(executor.map(self._alter_table_persistence, level,
+                                  [persistence] * len(level)))
+
+    def _alter_table_persistence(self, table: Table, persistence: str) -> None:
+        preparer = self.engine.dialect.identifier_preparer
+        schema = self.schema_translate_map.get(table.schema, table.schema)
+        table_name = preparer.quote(table.name)
+        if schema is not None:
+            table_name = f'{preparer.quote_schema(schema)}.{table_name}'
+        logger.info(f'Setting table {table.name} {persistence}')
+        with self.engine.connect() as conn:
+            conn.execute(text(f'ALTER TABLE {table_name} SET {persistence}')
+                         .execution_options(autocommit=True))
+
     @property
     def reflected_metadata(self) -> MetaData:
-        """Metadata of the current state of tables in the database."""
-        metadata = MetaData(bind=self.engine)
-        for schema in self.schemas:
-            metadata.reflect(schema=schema)
-        return metadata
+        """
+        Metadata of the current state of tables in the database.
+
+        Only tables that are part of the model (and the tables they
+        reference) are reflected. The result is reused until DDL is
+        executed through the engine of this instance.
+        """
+        with self._reflection_lock, suspend_active_transformation():
+            if self._reflected_metadata is None:
+                logger.debug('Reflecting database tables')
+                metadata = MetaData(bind=self.engine)
+                for schema, table_names in self._get_model_table_names().items():
+                    metadata.reflect(schema=schema,
+                                     only=lambda name, _, names=table_names: name in names)
+                self._reflected_metadata = metadata
+            return self._reflected_metadata
+
+    def invalidate_reflected_metadata(self) -> None:
+        """
+        Discard the reflected metadata, so it is reflected again on use.
+
+        This is done automatically after DDL is executed through the
+        engine. Call this after changing tables by other means, e.g.
+        via asyncpg connections.
+
+        Returns
+        -------
+        None
+        """
+        with self._reflection_lock:
+            self._reflected_metadata = None
+
+    def refresh_reflected_table(self, table_name: str) -> None:
+        """
+        Reflect a single model table again in the reflected metadata.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of the model table, without schema name.
+
+        Returns
+        -------
+        None
+        """
+        schema = next((schema for schema, table_names in self._get_model_table_names().items()
+                       if table_name in table_names), None)
+        if schema is None:
+            raise KeyError(f'No table found in model with name "{table_name}"')
+        with self._reflection_lock, suspend_active_transformation():
+            if self._reflected_metadata is None:
+                return
+            full_table_name = f'{schema}.{table_name}' if schema else table_name
+            # Tables referencing the refreshed table must refer to the
+            # new Table object, so the other tables are copied to a new
+            # MetaData instance instead of reflecting them again.
+            metadata = MetaData(bind=self.engine)
+            if self.engine.has_table(table_name, schema=schema):
+                metadata.reflect(schema=schema, only=[table_name], resolve_fks=False)
+            for table in self._reflected_metadata.tables.values():
+                if table.key != full_table_name:
+                    table.tometadata(metadata)
+            self._reflected_metadata = metadata
+
+    def _get_model_table_names(self) -> Dict[Optional[str], Set[str]]:
+        # Names of the model tables per actual schema name
+        table_names: Dict[Optional[str], Set[str]] = {}
+        for table in self.base.metadata.tables.values():
+            schema = self.schema_translate_map.get(table.schema, table.schema)
+            table_names.setdefault(schema, set()).add(table.name)
+        return table_names
+
+    def _invalidate_on_ddl(self, conn, cursor, statement, parameters, context, executemany):
+        # Runs after every successfully executed statement
+        if self._reflected_metadata is None:
+            return
+        if (context is not None and context.isddl) or is_ddl_statement(statement):
+            logger.debug('Invalidating reflected metadata after DDL')
+            self.invalidate_reflected_metadata()
 
     def _set_schemas(self) -> FrozenSet[str]:
         schemas: Set[str] = set()
@@ -256,3 +567,46 @@ class Database:
             else:
                 schemas.add(raw_schema_value)
         return frozenset(schemas)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    # Count the statements executed while a transformation is active
+    tm = get_active_transformation()
+    if tm is not None:
+        tm.n_statements += 1
+
+
+def _get_dependency_levels(tables: List[Table]) -> List[List[Table]]:
+    # Group tables by their foreign keys among the given tables. Tables
+    # in a level only reference tables in earlier levels.
+    # Self-references are ignored. Tables in a reference cycle cannot
+    # be ordered, so these raise a ValueError.
+    referenced = {table: {fk.column.table for fk in table.foreign_keys
+                          if fk.column.table in tables and fk.column.table is not table}
+                  for table in tables}
+    levels: List[List[Table]] = []
+    done: Set[Table] = set()
+    remaining = list(tables)
+    while remaining:
+        level = [table for table in remaining if referenced[table] <= done]
+        if not level:
+            cycle_names = sorted(table.name for table in _get_cycle_tables(remaining, referenced))
+            raise ValueError(f'Tables {cycle_names} reference each other in a foreign key '
+                             f'cycle, so their persistence cannot be changed')
+        levels.append(level)
+        done.update(level)
+        remaining = [table for table in remaining if table not in done]
+    return levels
+
+
+def _get_cycle_tables(tables: List[Table],
+                      referenced: Dict[Table, Set[Table]],
+                      ) -> Set[Table]:
+    # Remove tables that no other table references, until only the
+    # tables in (or between) reference cycles are left
+    cycle_tables = set(tables)
+    while True:
+        still_referenced = {ref for table in cycle_tables for ref in referenced[table]}
+        if cycle_tables <= still_referenced:
+            return cycle_tables
+        cycle_tables &= still_referenced
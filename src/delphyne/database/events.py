@@ -20,16 +20,17 @@ logger = logging.getLogger(__name__)
 
 @event.listens_for(Session, "before_flush")
 def _track_instances_before_flush(session: Session, context, instances):
-    if id(session) not in SessionTracker.sessions:
+    tm: EtlTransformation = SessionTracker.sessions.get(id(session))
+    if tm is None:
         return
-    deletion_counts = Counter(get_record_targets(session.deleted))
-    insertion_counts = Counter(get_record_targets(session.new))
-    update_counts = Counter(get_record_targets(session.dirty))
+    with tm.time_phase('tracking'):
+        deletion_counts = Counter(get_record_targets(session.deleted))
+        insertion_counts = Counter(get_record_targets(session.new))
+        update_counts = Counter(get_record_targets(session.dirty))
 
-    tm: EtlTransformation = SessionTracker.sessions[id(session)]
-    tm.deletion_counts += deletion_counts
-    tm.insertion_counts += insertion_counts
-    tm.update_counts += update_counts
+        tm.deletion_counts += deletion_counts
+        tm.insertion_counts += insertion_counts
+        tm.update_counts += update_counts
 
 
 @event.listens_for(Session, 'after_bulk_update')
@@ -66,15 +67,14 @@ def get_record_targets(record_containing_object: Iterable) -> Iterable[str]:
 
 
 def _process_bulk_event(context: Union[BulkUpdate, BulkDelete]):
-    session_id = id(context.session)
-    if session_id not in SessionTracker.sessions:
+    tm: EtlTransformation = SessionTracker.sessions.get(id(context.session))
+    if tm is None:
         return
 
     full_table_name = get_full_table_name(table=context.primary_table.name,
                                           schema=context.primary_table.schema,
                                           schema_map=Database.schema_translate_map)
 
-    tm: EtlTransformation = SessionTracker.sessions[session_id]
     bulk_counts = Counter({full_table_name: context.rowcount})
     if isinstance(context, BulkUpdate):
         tm.update_counts += bulk_counts
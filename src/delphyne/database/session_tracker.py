@@ -1,5 +1,6 @@
 """Storage module for tracked sessions."""
 
+import threading
 from typing import Dict
 
 from ..model.etl_stats import EtlTransformation
@@ -14,6 +15,9 @@ class SessionTracker:
     session is stored in here, and if so, will capture table change
     information.
 
+    Sessions can be added and removed concurrently from multiple
+    threads.
+
     Attributes
     ----------
     sessions : dict
@@ -21,6 +25,26 @@ class SessionTracker:
     """
 
     sessions: Dict[int, EtlTransformation] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def add_session(session_id, transformation: EtlTransformation) -> None:
+        """
+        Add item to sessions, so its changes will be tracked.
+
+        Parameters
+        ----------
+        session_id : int
+            Id value of the session via `id` builtin.
+        transformation : EtlTransformation
+            Metadata instance in which the changes will be stored.
+
+        Returns
+        -------
+        None
+        """
+        with SessionTracker._lock:
+            SessionTracker.sessions[session_id] = transformation
 
     @staticmethod
     def remove_session(session_id) -> None:
@@ -36,5 +60,5 @@ class SessionTracker:
         -------
         None
         """
-        if session_id in SessionTracker.sessions:
-            del SessionTracker.sessions[session_id]
+        with SessionTracker._lock:
+            SessionTracker.sessions.pop(session_id, None)
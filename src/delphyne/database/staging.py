@@ -0,0 +1,205 @@
+"""
+Module for intermediate tables in a dedicated staging schema.
+
+Intermediate tables, such as lookup tables and deduplicated source
+extracts, are kept apart from the CDM in the schema registered as
+'staging_schema' in the schema_translate_map. In raw SQL queries, the
+schema is available as the '@staging_schema' parameter. The staging
+schema is dropped as a whole when cleaning up, including tables that
+were created by SQL queries rather than via the StagingManager. Only
+schemas that were created by the StagingManager are ever dropped.
+"""
+
+from __future__ import annotations
+
+import logging
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, ContextManager, List, Optional
+
+from sqlalchemy import inspect, text
+
+from ..cdm.schema_placeholders import STAGING_SCHEMA
+
+if TYPE_CHECKING:
+    from .database import Database
+
+logger = logging.getLogger(__name__)
+
+# Marks schemas created by the StagingManager, which are safe to drop
+_STAGING_SCHEMA_COMMENT = 'delphyne staging schema'
+
+# Schemas that are never used as staging schema
+_RESERVED_SCHEMAS = {'public', 'information_schema'}
+
+
+class StagingManager:
+    """
+    Manager for intermediate tables in the staging schema.
+
+    Tables are created UNLOGGED, as their contents can be recreated
+    from the source data, and are analyzed after population so the
+    planner never uses stale statistics for them.
+
+    Parameters
+    ----------
+    database : Database
+        Database instance to interact with.
+    """
+
+    def __init__(self, database: Database):
+        self._db = database
+
+    @property
+    def schema(self) -> str:
+        """Actual name of the staging schema."""
+        schema = self._db.schema_translate_map.get(STAGING_SCHEMA)
+        if schema is None:
+            raise KeyError(f'No {STAGING_SCHEMA} found in schema_translate_map')
+        if schema in self._db.schemas:
+            raise ValueError(f'Staging schema "{schema}" cannot contain model tables')
+        if schema in _RESERVED_SCHEMAS or schema.startswith('pg_'):
+            raise ValueError(f'Schema "{schema}" cannot be used as staging schema')
+        return schema
+
+    def create_schema(self) -> None:
+        """
+        Create the staging schema if it does not exist yet.
+
+        A new schema is marked with a comment, so it can be recognized
+        as staging schema when dropping it.
+
+        Returns
+        -------
+        None
+        """
+        if self._schema_exists():
+            return
+        schema = self._quote_schema()
+        logger.info(f'Creating staging schema {self.schema}')
+        self._execute(f"CREATE SCHEMA {schema}; "
+                      f"COMMENT ON SCHEMA {schema} IS '{_STAGING_SCHEMA_COMMENT}'")
+
+    def create_table(self, table_name: str, query: str) -> str:
+        """
+        Create an UNLOGGED staging table from the result of a query.
+
+        An existing table with the same name is replaced. The table is
+        analyzed after it has been populated.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of the table, without schema name.
+        query : str
+            Final (non-parameterized) SELECT query that populates the
+            table.
+
+        Returns
+        -------
+        str
+            The schema-qualified name of the created table.
+        """
+        full_table_name = self._get_full_table_name(table_name)
+        logger.info(f'Creating staging table {table_name}')
+        self._execute(f'DROP TABLE IF EXISTS {full_table_name}; '
+                      f'CREATE UNLOGGED TABLE {full_table_name} AS {query}; '
+                      f'ANALYZE {full_table_name}')
+        return full_table_name
+
+    def get_table_names(self) -> List[str]:
+        """
+        Get the names of all tables in the staging schema.
+
+        Returns
+        -------
+        list of str
+            Names of the tables, without schema name.
+        """
+        return inspect(self._db.engine).get_table_names(schema=self.schema)
+
+    def analyze_tables(self, table_names: Optional[List[str]] = None) -> None:
+        """
+        Update the planner statistics of staging tables.
+
+        Use this after populating staging tables with raw SQL queries.
+
+        Parameters
+        ----------
+        table_names : list of str, optional
+            Names of the tables to analyze, without schema name. By
+            default, all tables in the staging schema are analyzed.
+
+        Returns
+        -------
+        None
+        """
+        if table_names is None:
+            table_names = self.get_table_names()
+        for table_name in table_names:
+            logger.debug(f'Analyzing staging table {table_name}')
+            self._execute(f'ANALYZE {self._get_full_table_name(table_name)}')
+
+    def drop_schema(self) -> None:
+        """
+        Drop the staging schema, including all tables in it.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If the schema exists, but was not created by the
+            StagingManager.
+        """
+        if not self._schema_exists():
+            return
+        if self._get_schema_comment() != _STAGING_SCHEMA_COMMENT:
+            raise ValueError(f'Refusing to drop schema "{self.schema}", as it was not '
+                             f'created as staging schema')
+        schema = self._quote_schema()
+        logger.info(f'Dropping staging schema {self.schema}')
+        self._execute(f'DROP SCHEMA {schema} CASCADE')
+
+    @contextmanager
+    def staging_scope(self) -> ContextManager[StagingManager]:
+        """
+        Provide an empty staging schema for the duration of a run.
+
+        The staging schema is dropped when closing the with statement,
+        also if an exception occurred. A staging schema left behind by
+        a previous run is dropped first, but an existing schema that
+        was not created by the StagingManager raises a ValueError.
+
+        Yields
+        ------
+        StagingManager
+            This staging manager.
+        """
+        self.drop_schema()
+        self.create_schema()
+        try:
+            yield self
+        finally:
+            self.drop_schema()
+
+    def _schema_exists(self) -> bool:
+        return self.schema in inspect(self._db.engine).get_schema_names()
+
+    def _get_schema_comment(self) -> Optional[str]:
+        query = text("SELECT obj_description(oid, 'pg_namespace') "
+                     "FROM pg_namespace WHERE nspname = :schema")
+        with self._db.engine.connect() as conn:
+            return conn.execute(query, schema=self.schema).scalar()
+
+    def _quote_schema(self) -> str:
+        return self._db.engine.dialect.identifier_preparer.quote_schema(self.schema)
+
+    def _get_full_table_name(self, table_name: str) -> str:
+        preparer = self._db.engine.dialect.identifier_preparer
+        return f'{self._quote_schema()}.{preparer.quote(table_name)}'
+
+    def _execute(self, statement: str) -> None:
+        with self._db.engine.connect() as conn:
+            conn.execute(text(statement).execution_options(autocommit=True))
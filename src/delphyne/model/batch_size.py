@@ -0,0 +1,177 @@
+"""Adaptive sizing of transformation batches."""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+@dataclass(frozen=True)
+class BatchMeasurement:
+    """
+    Performance measurement of a single inserted batch.
+
+    Attributes
+    ----------
+    batch_size : int
+        Number of records in the batch.
+    latency : float
+        Time in seconds needed to insert and commit the batch.
+    rows_per_second : float
+        Insertion throughput of the batch.
+    rss_mb : float or None
+        Resident memory of the process after the batch, in MB. None if
+        it could not be determined on this platform.
+    """
+
+    batch_size: int
+    latency: float
+    rows_per_second: float
+    rss_mb: Optional[float]
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size that adapts to the measured performance of each batch.
+
+    Can be passed as batch_size to the batch transformation methods of
+    the wrapper. After every inserted batch, the commit latency and the
+    resident memory (RSS) of the process are measured. The size of the
+    next batches is scaled towards the target latency, but by no more
+    than max_growth at a time. If the RSS exceeds max_rss_mb, the batch
+    size is halved instead.
+
+    The chosen sizes are logged, stored as batch_size of the batch
+    EtlTransformations and kept in the measurements attribute.
+
+    An instance is meant for a single transformation. When used from
+    multiple writer threads, measurements are combined in the order
+    the batches complete.
+
+    Parameters
+    ----------
+    initial_size : int, default 10000
+        Size of the first batch.
+    target_latency : float, default 5.0
+        Desired time in seconds to insert and commit one batch.
+    max_rss_mb : float, optional
+        Memory ceiling of the process in MB. Batches are shrunk while
+        it is exceeded.
+    min_size : int, default 100
+        Lower bound of the batch size.
+    max_size : int, default 1000000
+        Upper bound of the batch size.
+    max_growth : float, default 2.0
+        Maximum factor by which the size can grow or shrink after a
+        single batch.
+
+    Attributes
+    ----------
+    measurements : list of BatchMeasurement
+        Measurements of all batches inserted so far.
+    """
+
+    def __init__(self,
+                 initial_size: int = 10000,
+                 target_latency: float = 5.0,
+                 max_rss_mb: Optional[float] = None,
+                 min_size: int = 100,
+                 max_size: int = 1000000,
+                 max_growth: float = 2.0):
+        if not 0 < min_size <= max_size:
+            raise ValueError('min_size must be positive and not larger than max_size')
+        if target_latency <= 0:
+            raise ValueError('target_latency must be positive')
+        if max_growth <= 1:
+            raise ValueError('max_growth must be larger than 1')
+        self.target_latency = target_latency
+        self.max_rss_mb = max_rss_mb
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_growth = max_growth
+        self.measurements: List[BatchMeasurement] = []
+        self._size = self._clamp(initial_size)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """Get the state without the lock, for sending to processes."""
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state and create a new lock."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Size of the next batch."""
+        return self._size
+
+    def record(self, batch_size: int, latency: float) -> BatchMeasurement:
+        """
+        Record the performance of an inserted batch.
+
+        Updates the size of the next batches.
+
+        Parameters
+        ----------
+        batch_size : int
+            Number of records in the batch.
+        latency : float
+            Time in seconds needed to insert and commit the batch.
+
+        Returns
+        -------
+        BatchMeasurement
+            The measurement of the batch.
+        """
+        rss_mb = get_rss_mb()
+        rows_per_second = batch_size / latency if latency > 0 else float('inf')
+        measurement = BatchMeasurement(batch_size=batch_size, latency=latency,
+                                       rows_per_second=rows_per_second, rss_mb=rss_mb)
+        with self._lock:
+            self.measurements.append(measurement)
+            if self.max_rss_mb is not None and rss_mb is not None and rss_mb > self.max_rss_mb:
+                new_size = self._clamp(self._size / 2)
+                reason = f'RSS {rss_mb:.0f} MB exceeds {self.max_rss_mb:.0f} MB'
+            else:
+                # Scale the size of the measured batch, rather than the
+                # current size, as batches of other threads may have
+                # changed it in the meantime.
+                factor = self.target_latency / latency if latency > 0 else self.max_growth
+                factor = min(max(factor, 1 / self.max_growth), self.max_growth)
+                new_size = self._clamp(batch_size * factor)
+                reason = f'latency {latency:.2f}s, target {self.target_latency:.2f}s'
+            if new_size != self._size:
+                logger.debug(f'Batch size changed from {self._size} to {new_size} ({reason})')
+            self._size = new_size
+        return measurement
+
+    def _clamp(self, size: Union[int, float]) -> int:
+        return int(min(max(size, self.min_size), self.max_size))
+
+
+def get_rss_mb() -> Optional[float]:
+    """
+    Get the resident memory size of the current process.
+
+    Returns
+    -------
+    float or None
+        RSS in MB, or None if not available on this platform.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * _PAGE_SIZE / 1024 ** 2
@@ -1,4 +1,6 @@
 """Etl statistics metadata package."""
 
-from .etl_stats import EtlSource, EtlTransformation, EtlStats, etl_stats, open_transformation
+from .etl_stats import (EtlSource, EtlPlanNode, EtlStatement, EtlTransformation, EtlStats,
+                        etl_stats, open_transformation, get_active_transformation,
+                        suspend_active_transformation)
 from .etl_stats_reporter import EtlStatsReporter
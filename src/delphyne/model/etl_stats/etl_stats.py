@@ -1,8 +1,11 @@
 """ETL metadata statistics."""
 
+import contextvars
 import copy
 import datetime
 import logging
+import threading
+import time
 from abc import ABC, abstractmethod
 from collections import Counter
 from contextlib import contextmanager
@@ -64,18 +67,91 @@ class EtlSource(_AbstractEtlBase):
         return super().to_dict()
 
 
+@dataclass
+class EtlStatement:
+    """
+    Execution statistics of one statement of a SQL transformation.
+
+    target_table is '?' and row_count is -1 if they are unknown, e.g.
+    for DDL statements.
+    """
+
+    index: int
+    command: str
+    target_table: str
+    row_count: int
+    duration: float
+    chunk: Optional[str] = None
+
+    df_column_order: ClassVar = ['index', 'chunk', 'command', 'target_table', 'row_count',
+                                 'duration']
+
+    def __str__(self):
+        """Return index, chunk, command, target, rows and duration."""
+        chunk = f' {self.chunk}' if self.chunk else ''
+        target = f' {self.target_table}' if self.target_table != '?' else ''
+        rows = f'{self.row_count} rows, ' if self.row_count >= 0 else ''
+        return (f'{self.index}{chunk}: {self.command}{target} '
+                f'({rows}{self.duration:.2f}s)')
+
+
+@dataclass
+class EtlPlanNode:
+    """
+    Execution statistics of a query plan node of a SQL statement.
+
+    exclusive_time is the time spent in the node itself, excluding its
+    child nodes, in milliseconds.
+    """
+
+    statement_index: int
+    node_type: str
+    relation: Optional[str]
+    exclusive_time: float
+    actual_rows: int
+    plan_rows: int
+
+    def __str__(self):
+        """Return node type, relation, statement, time and rows."""
+        relation = f' on {self.relation}' if self.relation else ''
+        return (f'{self.node_type}{relation} in statement {self.statement_index}: '
+                f'{self.exclusive_time:.1f} ms ({self.actual_rows} rows, '
+                f'{self.plan_rows} estimated)')
+
+
 @dataclass
 class EtlTransformation(_AbstractEtlBase):
-    """Metadata storage unit for data mutation calls."""
+    """
+    Metadata storage unit for data mutation calls.
+
+    Besides the table counts, the time spent in the phases of the
+    transformation is kept in phase_durations, in seconds. Phases are
+    e.g. 'generate' (creating the records), 'save' (passing them to
+    the session or database), 'flush', 'commit' and 'execute' (raw SQL).
+    'tracking' is the time spent counting changed records in the
+    before_flush listener, which is part of the 'flush' phase.
+    n_statements is the number of SQL statements issued via the
+    Database engine while the transformation was open, excluding
+    bookkeeping such as reflection. For raw SQL transformations,
+    statements holds the statistics of every statement separately, and
+    plan_nodes the slowest query plan nodes if the statements were
+    profiled.
+    """
 
     name: str = ''
     query_success: bool = True
     insertion_counts: Counter = field(default_factory=Counter)
     deletion_counts: Counter = field(default_factory=Counter)
     update_counts: Counter = field(default_factory=Counter)
+    batch_size: Optional[int] = None
+    phase_durations: Counter = field(default_factory=Counter)
+    n_statements: int = 0
+    statements: List[EtlStatement] = field(default_factory=list)
+    plan_nodes: List[EtlPlanNode] = field(default_factory=list)
 
     df_column_order: ClassVar = ['name', 'query_success', 'insertion_counts', 'update_counts',
-                                 'deletion_counts', 'duration', 'start', 'end']
+                                 'deletion_counts', 'batch_size', 'duration', 'phase_durations',
+                                 'n_statements', 'rows_per_second', 'start', 'end']
 
     def __str__(self):
         """Return name and duration."""
@@ -88,6 +164,36 @@ class EtlTransformation(_AbstractEtlBase):
                 and not self.deletion_counts
                 and not self.update_counts)
 
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        """Number of inserted, updated and deleted rows per second."""
+        if self.duration is None or not self.duration.total_seconds():
+            return None
+        n_rows = sum(chain(self.insertion_counts.values(),
+                           self.update_counts.values(),
+                           self.deletion_counts.values()))
+        return n_rows / self.duration.total_seconds()
+
+    @contextmanager
+    def time_phase(self, phase: str) -> ContextManager[None]:
+        """
+        Add the time spent within the with statement to a phase.
+
+        Parameters
+        ----------
+        phase : str
+            Name of the phase.
+
+        Yields
+        ------
+        None
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_durations[phase] += time.perf_counter() - start
+
     @property
     def is_vocab_only(self) -> bool:
         """All mutations are exclusively on vocabulary tables."""
@@ -100,17 +206,26 @@ class EtlTransformation(_AbstractEtlBase):
     def to_dict(self) -> Dict:
         """Return dict with empty Counters as None, otherwise string."""
         d = copy.deepcopy(super().to_dict())
+        # Statements are reported separately, see EtlStats.statements_df
+        d.pop('statements', None)
+        d.pop('plan_nodes', None)
+        d['rows_per_second'] = self.rows_per_second
         for key, value in d.items():
             if isinstance(value, Counter):
                 if not value:
                     d[key] = None
                 else:
-                    counts: List[str] = [':'.join([table, str(count)])
+                    counts: List[str] = [':'.join([table, _format_count(count)])
                                          for table, count in value.items()]
                     d[key] = ', '.join(counts)
         return d
 
 
+def _format_count(count: Union[int, float]) -> str:
+    # Phase durations are floats, in seconds
+    return f'{count:.3f}' if isinstance(count, float) else str(count)
+
+
 class EtlStats:
     """
     Metadata storage unit for ETL statistics.
@@ -136,6 +251,8 @@ class EtlStats:
         self.start_time = datetime.datetime.now()
         self.transformations: List[EtlTransformation] = []
         self.sources: List[EtlSource] = []
+        self._lock = threading.Lock()
+        self._captured = contextvars.ContextVar('captured_transformations', default=None)
 
     @property
     def n_queries_executed(self) -> int:
@@ -166,6 +283,14 @@ class EtlStats:
         transformations_df = transformations_df.append([t.to_dict() for t in self.transformations])
         return transformations_df[EtlTransformation.df_column_order]
 
+    @property
+    def statements_df(self) -> pd.DataFrame:
+        """pandas.DataFrame of the statements of all transformations."""
+        column_order = ['transformation'] + EtlStatement.df_column_order
+        records = [{'transformation': t.name, **statement.__dict__}
+                   for t in self.transformations for statement in t.statements]
+        return pd.DataFrame(records, columns=column_order)
+
     def reset(self) -> None:
         """
         Remove all stored Etl objects from this instance.
@@ -209,7 +334,11 @@ class EtlStats:
         -------
         None
         """
-        self.transformations.append(transformation)
+        with self._lock:
+            self.transformations.append(transformation)
+        captured = self._captured.get()
+        if captured is not None:
+            captured.append(transformation)
 
     def add_source(self, source: EtlSource) -> None:
         """
@@ -223,11 +352,88 @@ class EtlStats:
         -------
         None
         """
-        self.sources.append(source)
+        with self._lock:
+            self.sources.append(source)
+
+    @property
+    def active_capture(self) -> Optional[List[EtlTransformation]]:
+        """Transformations captured by the current thread or task."""
+        return self._captured.get()
+
+    @contextmanager
+    def capture_transformations(self,
+                                target: Optional[List[EtlTransformation]] = None,
+                                ) -> ContextManager[List[EtlTransformation]]:
+        """
+        Collect the transformations added by the current thread.
+
+        The capture is stored in a context variable, so asyncio tasks
+        created within the with statement also add to it.
+
+        Transformations are still stored in this instance as usual, but
+        are also collected in the yielded list while the with statement
+        is active. Nested captures are also added to the outer capture.
+
+        Parameters
+        ----------
+        target : list of EtlTransformation, optional
+            List to collect the transformations in. Can be used to
+            continue the active capture of another thread. If not
+            provided, a new list is used.
+
+        Yields
+        ------
+        list of EtlTransformation
+            The transformations added within the with statement.
+        """
+        outer_capture = self.active_capture
+        captured: List[EtlTransformation] = [] if target is None else target
+        self._captured.set(captured)
+        try:
+            yield captured
+        finally:
+            self._captured.set(outer_capture)
+            if outer_capture is not None:
+                outer_capture.extend(captured)
 
 
 etl_stats = EtlStats()
 
+# Transformation opened in the current thread or task
+_active_transformation = contextvars.ContextVar('active_transformation', default=None)
+
+
+def get_active_transformation() -> Optional[EtlTransformation]:
+    """
+    Get the innermost transformation opened in the current context.
+
+    Returns
+    -------
+    EtlTransformation or None
+        The transformation of the innermost open_transformation of the
+        current thread or asyncio task, if any.
+    """
+    return _active_transformation.get()
+
+
+@contextmanager
+def suspend_active_transformation() -> ContextManager[None]:
+    """
+    Hide the active transformation within the with statement.
+
+    Use this for bookkeeping, such as reflection, so its statements are
+    not counted as statements of the transformation.
+
+    Yields
+    ------
+    None
+    """
+    token = _active_transformation.set(None)
+    try:
+        yield
+    finally:
+        _active_transformation.reset(token)
+
 
 @contextmanager
 def open_transformation(name: str, **kwargs) -> ContextManager[EtlTransformation]:
@@ -253,9 +459,11 @@ def open_transformation(name: str, **kwargs) -> ContextManager[EtlTransformation
         Instance to track table changes.
     """
     transformation = EtlTransformation(name=name, **kwargs)
+    token = _active_transformation.set(transformation)
     try:
         yield transformation
     finally:
+        _active_transformation.reset(token)
         if transformation.end is None:
             transformation.end_now()
         etl_stats.add_transformation(transformation)
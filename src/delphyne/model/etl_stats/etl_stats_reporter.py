@@ -29,10 +29,14 @@ class EtlStatsReporter:
     ----------
     etl_stats : EtlStats
         Statistics to report on.
+    n_plan_nodes : int, default 10
+        Number of slowest query plan nodes to include in the summary,
+        for raw SQL transformations that were profiled.
     """
 
-    def __init__(self, etl_stats: EtlStats):
+    def __init__(self, etl_stats: EtlStats, n_plan_nodes: int = 10):
         self.stats = etl_stats
+        self.n_plan_nodes = n_plan_nodes
 
     def log_summary(self) -> None:
         """Log summary of all sources/transformations."""
@@ -55,6 +59,8 @@ class EtlStatsReporter:
                             f'{self.stats.get_total_duration(cdm_transformations)})')
                 self._log_transformations(cdm_transformations)
 
+            self._log_slowest_plan_nodes()
+
             logger.info('Total insertions:')
             counts = {k: v for k, v in sorted(self.stats.total_insertions.items(),
                                               key=lambda item: item[1], reverse=True)}
@@ -69,6 +75,17 @@ class EtlStatsReporter:
                 logger.info(f'\t{source}')
             logger.info('')
 
+    def _log_slowest_plan_nodes(self) -> None:
+        plan_nodes = [(t.name, node) for t in self.stats.transformations
+                      for node in t.plan_nodes]
+        if not plan_nodes or self.n_plan_nodes < 1:
+            return
+        plan_nodes.sort(key=lambda item: item[1].exclusive_time, reverse=True)
+        logger.info(f'Slowest query plan nodes ({min(len(plan_nodes), self.n_plan_nodes)}):')
+        for name, node in plan_nodes[:self.n_plan_nodes]:
+            logger.info(f'\t{name}: {node}')
+        logger.info('')
+
     def _log_transformations(self, transformations: List[EtlTransformation]) -> None:
         successful_transformations = [t for t in transformations if t.query_success]
         if successful_transformations:
@@ -93,13 +110,24 @@ class EtlStatsReporter:
             logger.info(f'\t\tUpdates: {dict(transformation.update_counts)}')
         if transformation.deletion_counts:
             logger.info(f'\t\tDeletions: {dict(transformation.deletion_counts)}')
+        if transformation.phase_durations:
+            phases = ', '.join(f'{phase} {seconds:.2f}s'
+                               for phase, seconds in transformation.phase_durations.items())
+            rows_per_second = transformation.rows_per_second
+            throughput = f', {rows_per_second:.0f} rows/s' if rows_per_second else ''
+            logger.info(f'\t\tPhases: {phases} ({transformation.n_statements} statements'
+                        f'{throughput})')
+        if len(transformation.statements) > 1:
+            slowest = sorted(transformation.statements, key=lambda s: s.duration, reverse=True)
+            logger.info(f'\t\tSlowest statements: {", ".join(map(str, slowest[:3]))}')
 
     def write_summary_files(self) -> None:
         """
         Write overview tables.
 
         One table for the sources and one table for the ETL
-        transformations.
+        transformations. If available, a third table contains the
+        statements of the raw SQL transformations.
         """
         logger.info('Writing summary files')
         time_str = time.strftime("%Y-%m-%dT%H%M%S")
@@ -109,3 +137,7 @@ class EtlStatsReporter:
                                      sep='\t', index=False)
         self.stats.transformations_df.to_csv(output_dir / f'{time_str}_transformations.tsv',
                                              sep='\t', index=False)
+        statements_df = self.stats.statements_df
+        if not statements_df.empty:
+            statements_df.to_csv(output_dir / f'{time_str}_statements.tsv',
+                                 sep='\t', index=False)
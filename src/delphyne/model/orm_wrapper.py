@@ -1,20 +1,42 @@
 """ORM wrapper module."""
 
+import asyncio
+import contextvars
+import json
 import logging
 import os
+import queue
+import threading
+import time
 from abc import ABC, abstractmethod
 from collections import Counter
-from functools import lru_cache
-from inspect import signature
-from typing import Callable, List
+from concurrent.futures import wait
+from inspect import iscoroutinefunction, signature
+from pathlib import Path
+from typing import (Any, Callable, Dict, List, Mapping, Optional, Iterable, Iterator, Tuple,
+                    Union)
 
 from sqlalchemy.orm.session import Session
 
-from .etl_stats import EtlTransformation
+from .batch_size import AdaptiveBatchSize
+from .etl_stats import EtlTransformation, etl_stats, open_transformation
+from .process_pool import WrapperProcessPool, get_shared_data
+from .sharding import Shard
+from .stcm import StcmIndex
 from ..database import Database, events
+from .._paths import LOG_OUTPUT_DIR
+from ..database.bulk_insert import (copy_records, copy_records_async, core_insert_records,
+                                    get_record_table, get_record_values, iter_records)
 
 logger = logging.getLogger(__name__)
 
+_VALID_INSERT_MODES = {'orm', 'bulk', 'copy', 'core'}
+
+BatchSize = Union[int, AdaptiveBatchSize]
+
+# Serializes writes to quarantine files from concurrent writer threads
+_quarantine_lock = threading.Lock()
+
 
 class OrmWrapper(ABC):
     """
@@ -24,10 +46,14 @@ class OrmWrapper(ABC):
     ----------
     database : Database
         Database instance to interact with.
+    cdm_ : module, optional
+        Module containing the CDM table definitions used for STCM
+        lookups. By default, the cdm class variable.
     """
 
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, cdm_=None):
         self.db = database
+        self.stcm_index = StcmIndex(database, self.cdm if cdm_ is None else cdm_)
 
     @property
     @abstractmethod
@@ -51,7 +77,11 @@ class OrmWrapper(ABC):
         """
         return os.path.exists('./.git')
 
-    def execute_transformation(self, statement: Callable, bulk: bool = False) -> None:
+    def execute_transformation(self,
+                               statement: Callable,
+                               bulk: bool = False,
+                               mode: Optional[str] = None,
+                               ) -> None:
         """
         Execute an ETL transformation via a python statement.
 
@@ -59,36 +89,117 @@ class OrmWrapper(ABC):
         ----------
         statement : Callable
             Python function which takes this wrapper as input and
-            returns a list of records to be inserted.
+            returns a list of records to be inserted. In 'copy' and
+            'core' mode, it can also return a mapping of table classes
+            to lists of rows.
             It will be called as a transformation.
         bulk : bool
             If True, use SQLAlchemy's bulk_save_objects instead of
             add_all for persisting the ORM objects.
+            Equivalent to mode='bulk'.
+        mode : {'orm', 'bulk', 'copy', 'core'}, optional
+            How the records are persisted. 'orm' adds them to the
+            session, 'bulk' uses SQLAlchemy's bulk_save_objects and
+            'copy' streams them into the tables via the PostgreSQL COPY
+            command and 'core' inserts them with SQLAlchemy Core insert
+            statements, without constructing ORM objects. In 'copy' and
+            'core' mode, records can also be provided as (table, row)
+            tuples, with row a dictionary or a tuple of column values.
+            If not provided, 'bulk' is used if bulk is True, otherwise
+            'orm'.
 
         Returns
         -------
         None
         """
+        mode = self._get_insert_mode(bulk, mode)
         logger.info(f'Executing transformation: {statement.__name__}')
         with self.db.tracked_session_scope(name=statement.__name__, raise_on_error=False) \
                 as (session, transformation_metadata):
             func_args = signature(statement).parameters
-            if 'session' in func_args:
-                records_to_insert = statement(self, session)
-            else:
-                records_to_insert = statement(self)
+            with transformation_metadata.time_phase('generate'):
+                if 'session' in func_args:
+                    records_to_insert = statement(self, session)
+                else:
+                    records_to_insert = statement(self)
+                if isinstance(records_to_insert, Mapping):
+                    records_to_insert = list(iter_records(records_to_insert))
             logger.info(f'Saving {len(records_to_insert)} objects')
-            if bulk:
-                session.bulk_save_objects(records_to_insert)
-                self._collect_query_statistics_bulk_mode(session, records_to_insert,
-                                                         transformation_metadata)
-            else:
-                session.add_all(records_to_insert)
+            with transformation_metadata.time_phase('save'):
+                self._save_records(session, records_to_insert, mode, transformation_metadata)
 
             logger.info(f'{statement.__name__} completed with success status: '
                         f'{transformation_metadata.query_success}')
 
-    def execute_batch_transformation(self, batch_statement: Callable, bulk: bool = False, batch_size: int = 10000) -> None:
+    async def execute_transformation_async(self, statement: Callable) -> None:
+        """
+        Execute an ETL transformation via a python statement in asyncio.
+
+        Async counterpart of execute_transformation, allowing multiple
+        python and SQL transformations to be awaited concurrently, e.g.
+        with asyncio.gather. The records are inserted with the binary
+        COPY protocol of asyncpg, using a connection from the async pool
+        of the database. Records can be ORM instances or (table, row)
+        tuples, as in mode='copy' of execute_transformation.
+
+        Requires the optional asyncpg package.
+
+        Parameters
+        ----------
+        statement : Callable
+            Python function or coroutine function which takes this
+            wrapper as input and returns a list of records to be
+            inserted, or a mapping of table classes to lists of rows.
+            If it has a 'connection' parameter, the asyncpg connection
+            is passed as well; it is in the transaction in which the
+            records will be inserted. A regular function is run in the
+            default executor, so it does not block the event loop.
+
+        Returns
+        -------
+        None
+        """
+        name = statement.__name__
+        logger.info(f'Executing async transformation: {name}')
+        with open_transformation(name=name) as transformation_metadata:
+            try:
+                async with self.db.async_connection() as connection, \
+                        connection.transaction():
+                    kwargs = {}
+                    if 'connection' in signature(statement).parameters:
+                        kwargs['connection'] = connection
+                    with transformation_metadata.time_phase('generate'):
+                        if iscoroutinefunction(statement):
+                            records_to_insert = await statement(self, **kwargs)
+                        else:
+                            context = contextvars.copy_context()
+                            records_to_insert = await asyncio.get_running_loop() \
+                                .run_in_executor(None,
+                                                 lambda: context.run(statement, self, **kwargs))
+                        if isinstance(records_to_insert, Mapping):
+                            records_to_insert = list(iter_records(records_to_insert))
+                    logger.info(f'Saving {len(records_to_insert)} objects')
+                    with transformation_metadata.time_phase('save'):
+                        insertion_counts = await copy_records_async(
+                            connection, records_to_insert, self.db.schema_translate_map)
+                    # One COPY per table, not issued via SQLAlchemy
+                    transformation_metadata.n_statements += len(insertion_counts)
+                    transformation_metadata.insertion_counts += insertion_counts
+            except Exception as e:
+                logger.error(e, exc_info=True)
+                transformation_metadata.query_success = False
+        logger.info(f'{name} completed with success status: '
+                    f'{transformation_metadata.query_success}')
+
+    def execute_batch_transformation(self,
+                                     batch_statement: Callable,
+                                     bulk: bool = False,
+                                     batch_size: BatchSize = 10000,
+                                     mode: Optional[str] = None,
+                                     writer_threads: int = 0,
+                                     max_pending_batches: int = 2,
+                                     recover_failed_batches: bool = False,
+                                     ) -> None:
         """
         Execute an ETL transformation statement in batches.
 
@@ -96,6 +207,18 @@ class OrmWrapper(ABC):
         a failed insertion of a batch will not trigger
         a rollback of the other batches.
 
+        Optionally, batches are inserted by background writer threads,
+        so the generator can produce the next batches while previous
+        ones are being committed.
+
+        Optionally, a failed batch is recovered by inserting it again in
+        halves, splitting each failing half further until the offending
+        records are isolated. This is done within a single transaction,
+        using savepoints, which is recorded in etl_stats as a separate
+        '<batch name>_recovery' transformation. The records that cannot
+        be inserted are written, together with the database error, as
+        JSON lines to a quarantine file in the log directory.
+
         Parameters
         ----------
         batch_statement : Callable
@@ -105,60 +228,378 @@ class OrmWrapper(ABC):
         bulk : bool
             If True, use SQLAlchemy's bulk_save_objects instead of
             add_all for persisting the ORM objects.
-        batch_size : int
+        batch_size : int or AdaptiveBatchSize
             Number of records inserted in each batch.
             At maximum this number of records is kept in memory.
             Smaller batch sizes will decrease memory use,
             bigger batch sizes will increase insert performance.
+            With an AdaptiveBatchSize, the size is adjusted after each
+            batch, based on its commit latency and the process memory.
+        mode : {'orm', 'bulk', 'copy', 'core'}, optional
+            How the records are persisted, see execute_transformation.
+        writer_threads : int, default 0
+            Number of background threads inserting batches. If 0,
+            each batch is inserted before the next one is produced.
+        max_pending_batches : int, default 2
+            Maximum number of produced batches waiting to be inserted
+            by the writer threads, at least 1. Together with the
+            batches being inserted, this limits the number of batches
+            in memory.
+        recover_failed_batches : bool, default False
+            If True, insert the valid records of failed batches and
+            quarantine the invalid ones.
 
         Returns
         -------
         None
         """
+        if writer_threads < 0:
+            raise ValueError('writer_threads must be at least 0')
+        if max_pending_batches < 1:
+            raise ValueError('max_pending_batches must be at least 1')
+        mode = self._get_insert_mode(bulk, mode)
         logger.info(f'Executing batched transformation: {batch_statement.__name__} ')
 
         records_generator = batch_statement(self)
+        self._execute_batches(records_generator, batch_statement.__name__, mode, batch_size,
+                              writer_threads, max_pending_batches, recover_failed_batches)
+
+    def execute_sharded_batch_transformation(self,
+                                             batch_statement: Callable,
+                                             n_shards: int,
+                                             max_workers: Optional[int] = None,
+                                             bulk: bool = False,
+                                             batch_size: BatchSize = 10000,
+                                             mode: Optional[str] = None,
+                                             lookups: Optional[Dict[str, Any]] = None,
+                                             recover_failed_batches: bool = False,
+                                             ) -> None:
+        """
+        Execute a batched ETL transformation in parallel processes.
+
+        The work is split into n_shards shards, which are executed by a
+        pool of worker processes. Each worker has its own copy of this
+        wrapper and its own database engine, and inserts the records of
+        a shard in batches, as in execute_batch_transformation.
+        The EtlTransformations of all batches are added to etl_stats.
+
+        The batch statement is called once for every shard, with the
+        Shard as second argument. It should only yield records for
+        source rows of which the partition key (e.g. the person source
+        value) is contained in that shard, which can be checked with
+        shard.contains(key). As worker processes are spawned, the
+        statement must be defined at module level.
+
+        Parameters
+        ----------
+        batch_statement : Callable
+            Python generator function which takes this wrapper and a
+            Shard as input and yields one record at a time.
+        n_shards : int
+            Number of shards to split the work into.
+        max_workers : int, optional
+            Maximum number of worker processes. By default, the number
+            of shards or the number of CPUs, whichever is lower.
+        bulk : bool
+            If True, use SQLAlchemy's bulk_save_objects instead of
+            add_all for persisting the ORM objects.
+        batch_size : int or AdaptiveBatchSize
+            Number of records inserted in each batch. An
+            AdaptiveBatchSize is copied to each worker process and
+            adapts to the batches of that process only.
+        mode : {'orm', 'bulk', 'copy', 'core'}, optional
+            How the records are persisted, see execute_transformation.
+        lookups : dict of {str : Any}, optional
+            Read-only lookup objects (e.g. MappingDict instances) that
+            are sent to each worker process once. If the batch statement
+            has a 'lookups' parameter, they are passed to it.
+        recover_failed_batches : bool, default False
+            If True, insert the valid records of failed batches and
+            quarantine the invalid ones, see
+            execute_batch_transformation. Each shard has its own
+            quarantine file.
 
+        Returns
+        -------
+        None
+        """
+        mode = self._get_insert_mode(bulk, mode)
+        name = batch_statement.__name__
+        if max_workers is None:
+            max_workers = min(n_shards, os.cpu_count() or 1)
+        logger.info(f'Executing sharded transformation: {name} '
+                    f'({n_shards} shards, {max_workers} workers)')
+
+        with WrapperProcessPool(self, max_workers, shared_data=lookups) as pool:
+            futures = [pool.submit('_execute_batch_shard', batch_statement,
+                                   Shard(index=i, n_shards=n_shards), mode, batch_size,
+                                   recover_failed_batches)
+                       for i in range(n_shards)]
+            wait(futures)
+
+        transformations = []
+        for i, future in enumerate(futures):
+            if future.exception() is not None:
+                logger.error(f'{name} shard {i} failed: {future.exception()}',
+                             exc_info=future.exception())
+            else:
+                transformations.extend(future.result())
+        n_batches_success = sum(t.query_success for t in transformations)
+        logger.info(f'{name} completed with status: {n_batches_success} success and '
+                    f'{len(transformations) - n_batches_success} fails')
+
+    def _execute_batch_shard(self,
+                             batch_statement: Callable,
+                             shard: Shard,
+                             mode: str,
+                             batch_size: BatchSize,
+                             recover_failed_batches: bool = False,
+                             ) -> None:
+        # Called in a worker process of
+        # execute_sharded_batch_transformation
+        name = f'{batch_statement.__name__}_shard{shard.index}_'
+        logger.info(f'Executing {batch_statement.__name__} {shard}')
+        if 'lookups' in signature(batch_statement).parameters:
+            records_generator = batch_statement(self, shard, lookups=get_shared_data())
+        else:
+            records_generator = batch_statement(self, shard)
+        self._execute_batches(records_generator, name, mode, batch_size,
+                              writer_threads=0, max_pending_batches=0,
+                              recover_failed_batches=recover_failed_batches)
+
+    def _execute_batches(self,
+                         records_generator: Iterable,
+                         name: str,
+                         mode: str,
+                         batch_size: BatchSize,
+                         writer_threads: int,
+                         max_pending_batches: int,
+                         recover_failed_batches: bool = False,
+                         ) -> None:
+        adaptive_size = batch_size if isinstance(batch_size, AdaptiveBatchSize) else None
+        quarantine_file = self._get_quarantine_file(name) if recover_failed_batches else None
+        batches = self._iter_batches(records_generator, batch_size)
+        if writer_threads > 0:
+            results = self._insert_batches_pipelined(batches, name, mode, writer_threads,
+                                                     max_pending_batches, adaptive_size,
+                                                     quarantine_file)
+        else:
+            results = [self._insert_batch(batch, name + str(batch_count), mode, adaptive_size,
+                                          quarantine_file)
+                       for batch_count, batch in enumerate(batches, start=1)]
+
+        batch_count = len(results)
+        n_batches_success = sum(success for _, success in results)
+        total_records_inserted = sum(n_records for n_records, _ in results)
+        if quarantine_file is not None and quarantine_file.exists():
+            logger.warning(f'{name} quarantined records were written to {quarantine_file}')
+        logger.info(f'Saved a total of {total_records_inserted} records in {batch_count} batches')
+        logger.info(f'{name} completed with status: '
+                    f'{n_batches_success} success and {batch_count-n_batches_success} fails')
+
+    @staticmethod
+    def _iter_batches(records_generator: Iterable, batch_size: BatchSize) -> Iterator[List]:
+        # An adaptive size is read for every record, so a batch ends as
+        # soon as the size is lowered.
+        adaptive = isinstance(batch_size, AdaptiveBatchSize)
         records_to_insert = []
-        batch_count = 0
-        n_batches_success = 0
-        total_records_inserted = 0
         for record in records_generator:
             records_to_insert.append(record)
-            if len(records_to_insert) >= batch_size:
-                batch_count += 1
-                if self._insert_records(records_to_insert,
-                                        batch_statement.__name__ + str(batch_count),
-                                        bulk):
-                    n_batches_success += 1
-                    total_records_inserted += len(records_to_insert)
+            if len(records_to_insert) >= (batch_size.size if adaptive else batch_size):
+                yield records_to_insert
                 records_to_insert = []
-
-        # Insert any remaining records
+        # Any remaining records
         if len(records_to_insert) > 0:
-            batch_count += 1
-            if self._insert_records(records_to_insert,
-                                    batch_statement.__name__ + str(batch_count),
-                                    bulk):
-                n_batches_success += 1
-                total_records_inserted += len(records_to_insert)
+            yield records_to_insert
 
-        logger.info(f'Saved a total of {total_records_inserted} records in {batch_count} batches')
-        logger.info(f'{batch_statement.__name__} completed with status: '
-                    f'{n_batches_success} success and {batch_count-n_batches_success} fails')
+    def _insert_batches_pipelined(self,
+                                  batches: Iterator[List],
+                                  name: str,
+                                  mode: str,
+                                  writer_threads: int,
+                                  max_pending_batches: int,
+                                  adaptive_size: Optional[AdaptiveBatchSize] = None,
+                                  quarantine_file: Optional[Path] = None,
+                                  ) -> List[Tuple[int, bool]]:
+        # The batches are produced in the calling thread and put on a
+        # bounded queue, from which the writer threads insert them.
+        batch_queue = queue.Queue(maxsize=max_pending_batches)
+        results: List[Tuple[int, bool]] = []
+        capture = etl_stats.active_capture
+
+        def write_batches():
+            with etl_stats.capture_transformations(target=capture):
+                while True:
+                    item = batch_queue.get()
+                    if item is None:
+                        return
+                    batch_name, batch = item
+                    try:
+                        result = self._insert_batch(batch, batch_name, mode, adaptive_size,
+                                                    quarantine_file)
+                    except Exception as e:
+                        logger.error(f'{batch_name} failed: {e}', exc_info=e)
+                        result = (0, False)
+                    results.append(result)
 
-    def _insert_records(self, records_to_insert: List, name: str, bulk: bool) -> bool:
+        writers = [threading.Thread(target=write_batches, name=f'{name}_writer{i}', daemon=True)
+                   for i in range(writer_threads)]
+        for writer in writers:
+            writer.start()
+        try:
+            for batch_count, batch in enumerate(batches, start=1):
+                batch_queue.put((name + str(batch_count), batch))
+        finally:
+            for _ in writers:
+                batch_queue.put(None)
+            for writer in writers:
+                writer.join()
+        return results
+
+    def _insert_batch(self,
+                      batch: List,
+                      name: str,
+                      mode: str,
+                      adaptive_size: Optional[AdaptiveBatchSize],
+                      quarantine_file: Optional[Path],
+                      ) -> Tuple[int, bool]:
+        # Return the number of inserted records and the batch status
+        if self._insert_records(batch, name, mode, adaptive_size):
+            return len(batch), True
+        if quarantine_file is None:
+            return 0, False
+        return self._recover_records(batch, name, mode, quarantine_file), False
+
+    def _recover_records(self,
+                         records_to_insert: List,
+                         name: str,
+                         mode: str,
+                         quarantine_file: Path,
+                         ) -> int:
+        logger.info(f'{name} Recovering {len(records_to_insert)} records')
+        quarantined: List[Tuple[Any, Exception]] = []
+        with self.db.tracked_session_scope(name=f'{name}_recovery', raise_on_error=False) \
+                as (session, transformation_metadata):
+            transformation_metadata.batch_size = len(records_to_insert)
+            n_inserted = self._bisect_records(session, records_to_insert, mode,
+                                              transformation_metadata, quarantined)
+        if not transformation_metadata.query_success:
+            return 0
+        logger.info(f'{name} Recovered {n_inserted} records, '
+                    f'quarantined {len(quarantined)} records')
+        if quarantined:
+            self._write_quarantined_records(quarantine_file, name, quarantined)
+        return n_inserted
+
+    def _bisect_records(self,
+                        session: Session,
+                        records_to_insert: List,
+                        mode: str,
+                        transformation_metadata: EtlTransformation,
+                        quarantined: List[Tuple[Any, Exception]],
+                        ) -> int:
+        # Insert the records in a savepoint. If that fails, roll back to
+        # the savepoint and retry both halves, until single records
+        # remain. Return the number of inserted records.
+        tm = transformation_metadata
+        counts = tm.insertion_counts.copy(), tm.update_counts.copy(), tm.deletion_counts.copy()
+        savepoint = session.begin_nested()
+        try:
+            self._save_records(session, records_to_insert, mode, tm)
+            session.flush()
+            savepoint.commit()
+            return len(records_to_insert)
+        except Exception as e:
+            savepoint.rollback()
+            tm.insertion_counts, tm.update_counts, tm.deletion_counts = counts
+            if len(records_to_insert) == 1:
+                quarantined.append((records_to_insert[0], e))
+                return 0
+        middle = len(records_to_insert) // 2
+        return sum(self._bisect_records(session, part, mode, tm, quarantined)
+                   for part in (records_to_insert[:middle], records_to_insert[middle:]))
+
+    @staticmethod
+    def _get_quarantine_file(name: str) -> Path:
+        time_str = time.strftime("%Y-%m-%dT%H%M%S")
+        return LOG_OUTPUT_DIR / f'{time_str}_{name.rstrip("_")}_quarantine.jsonl'
+
+    @staticmethod
+    def _write_quarantined_records(quarantine_file: Path,
+                                   name: str,
+                                   quarantined: List[Tuple[Any, Exception]],
+                                   ) -> None:
+        lines = []
+        for record, error in quarantined:
+            table = get_record_table(record)
+            values = get_record_values(record, table)
+            lines.append(json.dumps({
+                'batch': name,
+                'table': table.name,
+                'record': {column.name: value for column, value in zip(table.columns, values)},
+                'error': str(getattr(error, 'orig', None) or error).strip(),
+            }, default=str) + '\n')
+        with _quarantine_lock:
+            quarantine_file.parent.mkdir(exist_ok=True)
+            with quarantine_file.open('a', encoding='utf-8') as f:
+                f.writelines(lines)
+
+    def _insert_records(self,
+                        records_to_insert: List,
+                        name: str,
+                        mode: str,
+                        adaptive_size: Optional[AdaptiveBatchSize] = None,
+                        ) -> bool:
+        start = time.perf_counter()
         with self.db.tracked_session_scope(name=name, raise_on_error=False) \
                 as (session, transformation_metadata):
             logger.info(f'{name} Saving {len(records_to_insert)} objects')
-            if bulk:
-                session.bulk_save_objects(records_to_insert)
-                self._collect_query_statistics_bulk_mode(session, records_to_insert,
-                                                         transformation_metadata)
-            else:
-                session.add_all(records_to_insert)
+            transformation_metadata.batch_size = len(records_to_insert)
+            with transformation_metadata.time_phase('save'):
+                self._save_records(session, records_to_insert, mode, transformation_metadata)
+        if adaptive_size is not None and transformation_metadata.query_success:
+            m = adaptive_size.record(len(records_to_insert), time.perf_counter() - start)
+            rss = f', RSS {m.rss_mb:.0f} MB' if m.rss_mb is not None else ''
+            logger.info(f'{name} {m.batch_size} records in {m.latency:.2f}s '
+                        f'({m.rows_per_second:.0f} rows/s{rss}), '
+                        f'next batch size: {adaptive_size.size}')
         return transformation_metadata.query_success
 
+    @staticmethod
+    def _get_insert_mode(bulk: bool, mode: Optional[str]) -> str:
+        if mode is None:
+            return 'bulk' if bulk else 'orm'
+        if mode not in _VALID_INSERT_MODES:
+            raise ValueError(f'Invalid insert mode "{mode}", '
+                             f'must be one of {sorted(_VALID_INSERT_MODES)}')
+        return mode
+
+    def _save_records(self,
+                      session: Session,
+                      records_to_insert: List,
+                      mode: str,
+                      transformation_metadata: EtlTransformation
+                      ) -> None:
+        if mode == 'bulk':
+            session.bulk_save_objects(records_to_insert)
+            self._collect_query_statistics_bulk_mode(session, records_to_insert,
+                                                     transformation_metadata)
+        elif mode == 'copy':
+            # Use the session's own DBAPI connection, so the COPY is
+            # part of the session transaction.
+            connection = session.connection().connection
+            insertion_counts = copy_records(connection, records_to_insert,
+                                            self.db.schema_translate_map)
+            # One COPY per table, not issued via SQLAlchemy
+            transformation_metadata.n_statements += len(insertion_counts)
+            transformation_metadata.insertion_counts += insertion_counts
+        elif mode == 'core':
+            insertion_counts = core_insert_records(session.connection(), records_to_insert,
+                                                   self.db.schema_translate_map)
+            transformation_metadata.insertion_counts += insertion_counts
+        else:
+            session.add_all(records_to_insert)
+
     @staticmethod
     def _collect_query_statistics_bulk_mode(session: Session,
                                             records_to_insert: List,
@@ -170,12 +611,14 @@ class OrmWrapper(ABC):
         dc = Counter(events.get_record_targets(session.deleted))
         transformation_metadata.deletion_counts = dc
         ic = Counter(events.get_record_targets(records_to_insert))
-        transformation_metadata.insertion_counts = ic
+        transformation_metadata.insertion_counts += ic
 
-    @lru_cache(maxsize=50000)
     def lookup_stcm(self, source_vocabulary_id: str, source_code: str) -> int:
         """
-        Query the STCM table to get the target_concept_id.
+        Get the target_concept_id of a source code from the STCM table.
+
+        All mappings of the source vocabulary are loaded into the
+        stcm_index on first use, see StcmIndex.
 
         Parameters
         ----------
@@ -190,10 +633,4 @@ class OrmWrapper(ABC):
         int
             Target_concept_id if present, otherwise 0.
         """
-        with self.db.session_scope() as session:
-            q = session.query(self.cdm.SourceToConceptMap)
-            result = q.filter_by(source_vocabulary_id=source_vocabulary_id,
-                                 source_code=source_code).one_or_none()
-            if result is None:
-                return 0
-            return result.target_concept_id
+        return self.stcm_index.lookup(source_vocabulary_id, source_code)
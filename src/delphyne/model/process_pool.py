@@ -0,0 +1,171 @@
+"""Execution of wrapper methods in separate processes."""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import logging.handlers
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from .etl_stats import EtlTransformation, etl_stats
+
+if TYPE_CHECKING:
+    from ..wrapper import Wrapper
+
+logger = logging.getLogger(__name__)
+
+# Wrapper instance and shared data of the current worker process
+_worker_wrapper = None
+_worker_shared_data: Dict[str, Any] = {}
+
+
+class WrapperProcessPool:
+    """
+    Pool of worker processes, each holding its own copy of a wrapper.
+
+    The wrapper is pickled and sent to each worker process once, upon
+    which it will create its own database engine. Worker processes are
+    started with the 'spawn' method, so any transformation function that
+    is submitted must be importable (i.e. defined at module level).
+    Log records of the workers are handled by the loggers of the parent
+    process and any EtlTransformation created in a worker is added to
+    the parent's etl_stats.
+
+    Use as a context manager.
+
+    Parameters
+    ----------
+    wrapper : Wrapper
+        Wrapper instance to copy to each of the worker processes.
+    max_workers : int
+        Maximum number of worker processes.
+    shared_data : dict of {str : Any}, optional
+        Read-only data (e.g. MappingDict lookups) that is sent to each
+        worker process once, instead of with every call. Available in
+        the workers via get_shared_data.
+    """
+
+    def __init__(self,
+                 wrapper: Wrapper,
+                 max_workers: int,
+                 shared_data: Optional[Dict[str, Any]] = None):
+        self._wrapper = wrapper
+        self._max_workers = max_workers
+        self._shared_data = shared_data or {}
+        self._context = multiprocessing.get_context('spawn')
+        self._executor = None
+        self._log_queue = None
+        self._log_listener = None
+
+    def __enter__(self) -> WrapperProcessPool:
+        """Start the log listener and the worker processes."""
+        self._log_queue = self._context.Queue()
+        self._log_listener = logging.handlers.QueueListener(self._log_queue,
+                                                            _ParentLogHandler())
+        self._log_listener.start()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._wrapper, self._shared_data, self._log_queue,
+                      logging.getLogger().level),
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Wait for all submitted calls and stop the workers."""
+        try:
+            self._executor.shutdown(wait=True)
+        finally:
+            self._log_listener.stop()
+            self._log_queue.close()
+
+    def submit(self, method_name: str, *args, **kwargs) -> Future:
+        """
+        Call a method of the wrapper in one of the worker processes.
+
+        Parameters
+        ----------
+        method_name : str
+            Name of the wrapper method to call.
+        *args
+            Positional arguments of the method.
+        **kwargs
+            Keyword arguments of the method.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future of the list of EtlTransformations that were created
+            by the call.
+        """
+        future = self._executor.submit(_call_wrapper_method, method_name, *args, **kwargs)
+        # Transformations are added from another thread, so pass on the
+        # capture of the submitting thread.
+        future.add_done_callback(partial(_add_worker_transformations,
+                                         capture=etl_stats.active_capture))
+        return future
+
+
+def get_shared_data() -> Dict[str, Any]:
+    """
+    Get the data shared with the current worker process.
+
+    Returns
+    -------
+    dict of {str : Any}
+        The shared_data as provided to the WrapperProcessPool. Empty if
+        not called from a worker process.
+    """
+    return _worker_shared_data
+
+
+class _ParentLogHandler(logging.Handler):
+    """Pass log records of worker processes to the parent's loggers."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        record_logger = logging.getLogger(record.name)
+        if record_logger.isEnabledFor(record.levelno):
+            record_logger.handle(record)
+
+
+def _init_worker(wrapper: Wrapper,
+                 shared_data: Dict[str, Any],
+                 log_queue,
+                 log_level: int,
+                 ) -> None:
+    global _worker_wrapper, _worker_shared_data
+    root_logger = logging.getLogger()
+    root_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root_logger.setLevel(log_level)
+    _worker_wrapper = wrapper
+    _worker_shared_data = shared_data
+
+
+def _call_wrapper_method(method_name: str, *args, **kwargs) -> List[EtlTransformation]:
+    with etl_stats.capture_transformations() as transformations:
+        getattr(_worker_wrapper, method_name)(*args, **kwargs)
+    return transformations
+
+
+def _add_worker_transformations(future: Future,
+                                capture: Optional[List[EtlTransformation]],
+                                ) -> None:
+    if future.cancelled() or future.exception() is not None:
+        return
+    transformations = future.result()
+    # If the future was already done, this runs in the submitting
+    # thread, of which the active capture may be the capture itself.
+    # The transformations are therefore stored in an empty context and
+    # only added to the given capture.
+    contextvars.Context().run(_store_transformations, transformations)
+    if capture is not None:
+        capture.extend(transformations)
+
+
+def _store_transformations(transformations: List[EtlTransformation]) -> None:
+    for transformation in transformations:
+        etl_stats.add_transformation(transformation)
@@ -0,0 +1,157 @@
+"""Capture and summary of PostgreSQL query plans."""
+
+import json
+import re
+from typing import Dict, List, Union
+
+from .etl_stats import EtlPlanNode
+from ..util.sql import strip_leading_comments
+
+EXPLAIN_PREFIX = 'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) '
+
+# Statements of which the plan can be captured with EXPLAIN ANALYZE
+_EXPLAINABLE_PATTERN = re.compile(
+    r'(?:SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b'
+    r'|CREATE\s+(?:(?:GLOBAL|LOCAL)\s+)?(?:(?:TEMP|TEMPORARY|UNLOGGED)\s+)?TABLE\s'
+    r'(?:(?!\(|;).)*?\sAS\s+(?:SELECT|WITH|VALUES|TABLE)\b',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Parent relationship of the subplan yielding the rows of a ModifyTable
+# node: 'Member' up to PostgreSQL 13, 'Outer' as of PostgreSQL 14
+_MODIFY_TABLE_INPUTS = {'Outer', 'Member'}
+
+
+def is_explainable(statement: str) -> bool:
+    """
+    Check whether EXPLAIN ANALYZE can be applied to a statement.
+
+    Parameters
+    ----------
+    statement : str
+        A single SQL statement.
+
+    Returns
+    -------
+    bool
+        True for SELECT, INSERT, UPDATE, DELETE, WITH, VALUES and
+        CREATE TABLE AS statements.
+    """
+    return _EXPLAINABLE_PATTERN.match(strip_leading_comments(statement)) is not None
+
+
+def parse_explain_output(output: Union[str, List]) -> Dict:
+    """
+    Get the plan of a statement from EXPLAIN (FORMAT JSON) output.
+
+    Parameters
+    ----------
+    output : str or list
+        The output of EXPLAIN, either as JSON string or as parsed
+        JSON.
+
+    Returns
+    -------
+    dict
+        The explained statement, containing 'Plan' and, in case of
+        ANALYZE, 'Execution Time' keys.
+    """
+    if isinstance(output, str):
+        output = json.loads(output)
+    return output[0]
+
+
+def get_plan_row_count(plan: Dict) -> int:
+    """
+    Get the number of rows affected by an explained statement.
+
+    For INSERT, UPDATE and DELETE statements, these are the rows
+    passed to the modifying node.
+
+    Parameters
+    ----------
+    plan : dict
+        The explained statement, as returned by parse_explain_output.
+
+    Returns
+    -------
+    int
+        The number of rows.
+    """
+    node = plan['Plan']
+    if node.get('Node Type') == 'ModifyTable':
+        return sum(_get_actual_rows(child) for child in node.get('Plans', [])
+                   if child.get('Parent Relationship') in _MODIFY_TABLE_INPUTS)
+    return _get_actual_rows(node)
+
+
+def get_plan_command(plan: Dict) -> str:
+    """
+    Get the command of an explained statement.
+
+    Parameters
+    ----------
+    plan : dict
+        The explained statement, as returned by parse_explain_output.
+
+    Returns
+    -------
+    str
+        'INSERT', 'UPDATE' or 'DELETE' for modifying statements,
+        otherwise 'SELECT'.
+    """
+    node = plan['Plan']
+    if node.get('Node Type') == 'ModifyTable':
+        return node.get('Operation', '?').upper()
+    return 'SELECT'
+
+
+def get_slowest_plan_nodes(plan: Dict, statement_index: int, n: int) -> List[EtlPlanNode]:
+    """
+    Get the plan nodes that took most time to execute.
+
+    The time of a node excludes the time of its child nodes.
+
+    Parameters
+    ----------
+    plan : dict
+        The explained statement, as returned by parse_explain_output.
+    statement_index : int
+        Index of the statement in its transformation.
+    n : int
+        Maximum number of nodes to return.
+
+    Returns
+    -------
+    list of EtlPlanNode
+        The slowest nodes, sorted by descending time.
+    """
+    nodes = []
+    _collect_plan_nodes(plan['Plan'], statement_index, nodes)
+    return sorted(nodes, key=lambda node: node.exclusive_time, reverse=True)[:n]
+
+
+def _collect_plan_nodes(node: Dict, statement_index: int, nodes: List[EtlPlanNode]) -> None:
+    children = node.get('Plans', [])
+    exclusive_time = _get_total_time(node) - sum(_get_total_time(child) for child in children)
+    nodes.append(EtlPlanNode(
+        statement_index=statement_index,
+        node_type=node.get('Node Type', '?'),
+        relation=node.get('Relation Name'),
+        # Parallel workers can make the children take longer than their
+        # parent in wall clock time
+        exclusive_time=max(exclusive_time, 0.0),
+        actual_rows=_get_actual_rows(node),
+        plan_rows=node.get('Plan Rows', 0),
+    ))
+    for child in children:
+        _collect_plan_nodes(child, statement_index, nodes)
+
+
+def _get_total_time(node: Dict) -> float:
+    # Actual Total Time is the average per loop, in milliseconds
+    return node.get('Actual Total Time', 0.0) * node.get('Actual Loops', 1)
+
+
+def _get_actual_rows(node: Dict) -> int:
+    return int(node.get('Actual Rows', 0) * node.get('Actual Loops', 1))
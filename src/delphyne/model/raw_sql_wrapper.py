@@ -1,22 +1,31 @@
 """Raw SQL query module."""
 
+import json
 import logging
 import re
-from collections import Counter
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 from sqlalchemy import text
-from sqlalchemy.engine.result import ResultProxy
+from sqlalchemy.engine import Connection
 
-from .etl_stats import EtlTransformation, open_transformation
-from .._paths import SQL_TRANSFORMATIONS_DIR
+from .etl_stats import EtlStatement, EtlTransformation, open_transformation
+from .query_plan import (EXPLAIN_PREFIX, get_plan_command, get_plan_row_count,
+                         get_slowest_plan_nodes, is_explainable, parse_explain_output)
+from .sharding import ChunkSpec, KeyRange
+from .sql_template import SqlTemplate
+from .._paths import LOG_OUTPUT_DIR, SQL_TRANSFORMATIONS_DIR
 from ..config.models import MainConfig
 from ..database.database import Database
-from ..util.helper import replace_substrings
+from ..util.sql import is_ddl_statement
 
 logger = logging.getLogger(__name__)
 
+# Number of slowest plan nodes kept per profiled statement
+_N_PLAN_NODES = 10
+
 
 class RawSqlWrapper:
     """
@@ -45,63 +54,449 @@ class RawSqlWrapper:
                 sql_parameters[k] = v
         return sql_parameters
 
-    def execute_sql_file(self, file_path: Union[Path, str]) -> None:
+    def execute_sql_file(self,
+                         file_path: Union[Path, str],
+                         single_transaction: bool = True,
+                         profile: bool = False,
+                         ) -> None:
         """
         Execute a raw SQL query from a file.
 
+        The file is compiled into a SqlTemplate, which is reused for as
+        long as the file is not modified.
+
+        Parameters
+        ----------
+        file_path : pathlib.Path or str
+            Relative SQL file path inside the directory for SQL
+            transformations (the root will be automatically added).
+        single_transaction : bool, default True
+            If True, all statements are executed in one transaction,
+            which is rolled back if any statement fails. Otherwise each
+            statement is committed separately.
+        profile : bool, default False
+            If True, capture the query plans of the statements by
+            executing them with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+            The plans are written to a json file in the log directory,
+            and the slowest plan nodes are included in the summary.
+
+        Returns
+        -------
+        None
+        """
+        file_path = SQL_TRANSFORMATIONS_DIR / file_path
+        template = SqlTemplate.from_file(file_path)
+        self._execute_sql_template(template, file_path.name, single_transaction, profile)
+
+    async def execute_sql_file_async(self,
+                                     file_path: Union[Path, str],
+                                     single_transaction: bool = True,
+                                     profile: bool = False,
+                                     ) -> None:
+        """
+        Execute a raw SQL query from a file in asyncio.
+
+        Async counterpart of execute_sql_file, see
+        execute_sql_query_async.
+
         Parameters
         ----------
         file_path : pathlib.Path or str
             Relative SQL file path inside the directory for SQL
             transformations (the root will be automatically added).
+        single_transaction : bool, default True
+            If True, all statements are executed in one transaction,
+            which is rolled back if any statement fails. Otherwise each
+            statement is committed separately.
+        profile : bool, default False
+            If True, capture the query plans of the statements by
+            executing them with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+            The plans are written to a json file in the log directory,
+            and the slowest plan nodes are included in the summary.
 
         Returns
         -------
         None
         """
         file_path = SQL_TRANSFORMATIONS_DIR / file_path
-        # Open and read the file as a single buffer
-        logger.debug(f'Reading query from file: {file_path.name}')
-        with file_path.open('r') as f:
-            query = f.read().strip()
+        template = SqlTemplate.from_file(file_path)
+        await self._execute_sql_template_async(template, file_path.name, single_transaction,
+                                               profile)
+
+    async def execute_sql_query_async(self,
+                                      query: str,
+                                      query_name: str,
+                                      single_transaction: bool = True,
+                                      profile: bool = False,
+                                      ) -> None:
+        """
+        Execute a raw SQL query in asyncio.
+
+        Async counterpart of execute_sql_query, allowing multiple python
+        and SQL transformations to be awaited concurrently. The query is
+        executed on a connection from the async pool of the database.
+
+        Requires the optional asyncpg package.
+
+        Parameters
+        ----------
+        query : str
+            Full SQL query as string.
+        query_name : str
+            Name of the transformation.
+        single_transaction : bool, default True
+            If True, all statements are executed in one transaction,
+            which is rolled back if any statement fails. Otherwise each
+            statement is committed separately.
+        profile : bool, default False
+            If True, capture the query plans of the statements by
+            executing them with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+            The plans are written to a json file in the log directory,
+            and the slowest plan nodes are included in the summary.
+
+        Returns
+        -------
+        None
+        """
+        await self._execute_sql_template_async(SqlTemplate(query), query_name,
+                                               single_transaction, profile)
 
-        self.execute_sql_query(query=query, query_name=file_path.name)
+    async def _execute_sql_template_async(self,
+                                          template: SqlTemplate,
+                                          query_name: str,
+                                          single_transaction: bool,
+                                          profile: bool,
+                                          ) -> None:
+        logger.info(f'Executing async raw sql query: {query_name}')
+        with open_transformation(name=query_name) as transformation_metadata:
+            statements = template.render_statements(self.sql_parameters)
+            plans: List[Dict] = []
+            statement = ''
+            try:
+                async with self.db.async_connection() as connection:
+                    transaction = connection.transaction() if single_transaction else None
+                    if transaction is not None:
+                        await transaction.start()
+                    try:
+                        for index, statement in enumerate(statements, start=1):
+                            start = time.perf_counter()
+                            with transformation_metadata.time_phase('execute'):
+                                if profile and is_explainable(statement):
+                                    output = await connection.fetchval(EXPLAIN_PREFIX + statement)
+                                    command, row_count = self._add_plan(
+                                        index, statement, output, plans, transformation_metadata)
+                                else:
+                                    status_message = await connection.execute(statement)
+                                    command = self._parse_command(status_message)
+                                    row_count = self._parse_row_count(status_message)
+                            transformation_metadata.n_statements += 1
+                            self._add_statement(index, statement, command, row_count,
+                                                time.perf_counter() - start,
+                                                transformation_metadata)
+                    except Exception:
+                        if transaction is not None:
+                            await transaction.rollback()
+                            self._clear_transformation_counts(transformation_metadata)
+                        raise
+                    if transaction is not None:
+                        await transaction.commit()
+            except Exception as msg:
+                self._log_failed_statement(query_name, statement, msg)
+                transformation_metadata.query_success = False
+            finally:
+                # DDL executed via asyncpg is not seen by the engine
+                if any(is_ddl_statement(statement) for statement in statements):
+                    self.db.invalidate_reflected_metadata()
+            if plans:
+                self._write_plans(query_name, plans)
 
-    def execute_sql_query(self, query: str, query_name: str) -> None:
+    def execute_sql_query(self,
+                          query: str,
+                          query_name: str,
+                          single_transaction: bool = True,
+                          profile: bool = False,
+                          ) -> None:
         """
         Execute a raw SQL query.
 
+        The query is split into separate statements, which are executed
+        one by one on the same connection. The row counts and duration
+        of every statement are recorded in the transformation.
+
         Parameters
         ----------
         query : str
             Full SQL query as string.
         query_name : str
             Name of the transformation.
+        single_transaction : bool, default True
+            If True, all statements are executed in one transaction,
+            which is rolled back if any statement fails. Otherwise each
+            statement is committed separately.
+        profile : bool, default False
+            If True, capture the query plans of the statements by
+            executing them with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+            The plans are written to a json file in the log directory,
+            and the slowest plan nodes are included in the summary.
 
         Returns
         -------
         None
         """
+        self._execute_sql_template(SqlTemplate(query), query_name, single_transaction, profile)
+
+    def _execute_sql_template(self,
+                              template: SqlTemplate,
+                              query_name: str,
+                              single_transaction: bool,
+                              profile: bool,
+                              ) -> None:
         logger.info(f'Executing raw sql query: {query_name}')
         with open_transformation(name=query_name) as transformation_metadata:
-            query = self.apply_sql_parameters(query, self.sql_parameters)
+            statements = template.render_statements(self.sql_parameters)
+            plans: List[Dict] = []
 
             with self.db.engine.connect() as con:
+                transaction = con.begin() if single_transaction else None
                 try:
-                    statement = text(query).execution_options(autocommit=True)
-                    result = con.execute(statement)
-                    self._collect_transformation_statistics(result, query, transformation_metadata)
-                except Exception as msg:
-                    logger.error(f'Query failed: {query_name}')
-                    logger.error(query)
-                    logger.error(msg)
+                    self._execute_statements(con, statements, query_name,
+                                             transformation_metadata, profile, plans)
+                    if transaction is not None:
+                        transaction.commit()
+                except Exception:
+                    if transaction is not None:
+                        transaction.rollback()
+                        self._clear_transformation_counts(transformation_metadata)
                     transformation_metadata.query_success = False
+            if plans:
+                self._write_plans(query_name, plans)
+
+    def execute_sql_file_chunked(self,
+                                 file_path: Union[Path, str],
+                                 chunks: Union[ChunkSpec, Iterable[KeyRange]],
+                                 max_workers: int = 1,
+                                 profile: bool = False,
+                                 ) -> List[KeyRange]:
+        """
+        Execute a raw SQL query from a file once per key range.
+
+        See execute_sql_query_chunked.
+
+        Parameters
+        ----------
+        file_path : pathlib.Path or str
+            Relative SQL file path inside the directory for SQL
+            transformations (the root will be automatically added).
+        chunks : ChunkSpec or iterable of KeyRange
+            The key ranges, or a specification to derive them from.
+        max_workers : int, default 1
+            Number of key ranges executed at the same time, each on its
+            own connection.
+        profile : bool, default False
+            If True, capture the query plans, see execute_sql_query.
+
+        Returns
+        -------
+        list of KeyRange
+            The key ranges that failed.
+        """
+        file_path = SQL_TRANSFORMATIONS_DIR / file_path
+        template = SqlTemplate.from_file(file_path)
+        return self._execute_sql_template_chunked(template, file_path.name, chunks,
+                                                  max_workers, profile)
+
+    def execute_sql_query_chunked(self,
+                                  query: str,
+                                  query_name: str,
+                                  chunks: Union[ChunkSpec, Iterable[KeyRange]],
+                                  max_workers: int = 1,
+                                  profile: bool = False,
+                                  ) -> List[KeyRange]:
+        """
+        Execute a raw SQL query once per key range.
+
+        The query must restrict its input with the @chunk_start
+        (inclusive) and @chunk_end (exclusive) parameters, e.g.
+        'WHERE person_id >= @chunk_start AND person_id < @chunk_end'.
+        It is executed for every key range, in a separate transaction
+        that is committed independently, so a failing range does not
+        affect the others. The failed ranges are returned, so they can
+        be executed again.
+
+        All key ranges are recorded together as one transformation,
+        with the statements of every range labeled with that range.
+
+        Parameters
+        ----------
+        query : str
+            Full SQL query as string.
+        query_name : str
+            Name of the transformation.
+        chunks : ChunkSpec or iterable of KeyRange
+            The key ranges, or a specification to derive them from the
+            minimum and maximum value of a key column.
+        max_workers : int, default 1
+            Number of key ranges executed at the same time, each on its
+            own connection.
+        profile : bool, default False
+            If True, capture the query plans, see execute_sql_query.
+
+        Returns
+        -------
+        list of KeyRange
+            The key ranges that failed.
+        """
+        return self._execute_sql_template_chunked(SqlTemplate(query), query_name, chunks,
+                                                  max_workers, profile)
+
+    def _execute_sql_template_chunked(self,
+                                      template: SqlTemplate,
+                                      query_name: str,
+                                      chunks: Union[ChunkSpec, Iterable[KeyRange]],
+                                      max_workers: int,
+                                      profile: bool,
+                                      ) -> List[KeyRange]:
+        if '@chunk_start' not in template.text or '@chunk_end' not in template.text:
+            raise ValueError(f'{query_name} must contain the @chunk_start and @chunk_end '
+                             f'parameters to be executed in key ranges')
+        if isinstance(chunks, ChunkSpec):
+            key_ranges = self._get_key_ranges(chunks)
+        else:
+            key_ranges = list(chunks)
+        logger.info(f'Executing raw sql query: {query_name} in {len(key_ranges)} key ranges')
+        failed: List[KeyRange] = []
+        plans: List[Dict] = []
+        with open_transformation(name=query_name) as transformation_metadata:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {pool.submit(self._execute_chunk, template, query_name, key_range,
+                                       profile, plans): key_range
+                           for key_range in key_ranges}
+                for future in as_completed(futures):
+                    chunk_metadata = future.result()
+                    self._merge_chunk(chunk_metadata, transformation_metadata)
+                    if not chunk_metadata.query_success:
+                        failed.append(futures[future])
+            if failed:
+                failed.sort(key=lambda key_range: key_range.start)
+                logger.error(f'{len(failed)} of {len(key_ranges)} key ranges of {query_name} '
+                             f'failed: {", ".join(map(str, failed))}')
+                transformation_metadata.query_success = False
+            if plans:
+                self._write_plans(query_name, plans)
+        return failed
+
+    def _get_key_ranges(self, chunk_spec: ChunkSpec) -> List[KeyRange]:
+        table = self.apply_sql_parameters(chunk_spec.table, self.sql_parameters)
+        query = f'SELECT min({chunk_spec.column}), max({chunk_spec.column}) FROM {table}'
+        with self.db.engine.connect() as con:
+            min_key, max_key = con.execute(text(query)).fetchone()
+        return chunk_spec.get_key_ranges(min_key, max_key)
+
+    def _execute_chunk(self,
+                       template: SqlTemplate,
+                       query_name: str,
+                       key_range: KeyRange,
+                       profile: bool,
+                       plans: List[Dict],
+                       ) -> EtlTransformation:
+        # Runs in a worker thread; the returned metadata is merged into
+        # the transformation of the whole query.
+        chunk_metadata = EtlTransformation(name=f'{query_name} {key_range}')
+        parameters = {**self.sql_parameters,
+                      'chunk_start': str(key_range.start),
+                      'chunk_end': str(key_range.end)}
+        statements = template.render_statements(parameters)
+        with self.db.engine.connect() as con:
+            transaction = con.begin()
+            try:
+                self._execute_statements(con, statements, chunk_metadata.name, chunk_metadata,
+                                         profile, plans, chunk=str(key_range))
+                transaction.commit()
+            except Exception:
+                transaction.rollback()
+                self._clear_transformation_counts(chunk_metadata)
+                chunk_metadata.query_success = False
+        chunk_metadata.n_statements = len(chunk_metadata.statements)
+        return chunk_metadata
+
+    @staticmethod
+    def _merge_chunk(chunk_metadata: EtlTransformation,
+                     transformation_metadata: EtlTransformation
+                     ) -> None:
+        transformation_metadata.insertion_counts.update(chunk_metadata.insertion_counts)
+        transformation_metadata.update_counts.update(chunk_metadata.update_counts)
+        transformation_metadata.deletion_counts.update(chunk_metadata.deletion_counts)
+        transformation_metadata.phase_durations.update(chunk_metadata.phase_durations)
+        transformation_metadata.n_statements += chunk_metadata.n_statements
+        transformation_metadata.statements.extend(chunk_metadata.statements)
+        transformation_metadata.plan_nodes.extend(chunk_metadata.plan_nodes)
+
+    def _execute_statements(self,
+                            con: Connection,
+                            statements: List[str],
+                            query_name: str,
+                            transformation_metadata: EtlTransformation,
+                            profile: bool,
+                            plans: List[Dict],
+                            chunk: Optional[str] = None,
+                            ) -> None:
+        for index, statement in enumerate(statements, start=1):
+            start = time.perf_counter()
+            try:
+                with transformation_metadata.time_phase('execute'):
+                    if profile and is_explainable(statement):
+                        result = con.execute(text(EXPLAIN_PREFIX + statement)
+                                             .execution_options(autocommit=True))
+                        command, row_count = self._add_plan(
+                            index, statement, result.scalar(), plans, transformation_metadata,
+                            chunk)
+                    else:
+                        result = con.execute(text(statement).execution_options(autocommit=True))
+                        command = self._parse_command(result.context.cursor.statusmessage)
+                        row_count = result.rowcount
+            except Exception as msg:
+                self._log_failed_statement(query_name, statement, msg)
+                raise
+            self._add_statement(index, statement, command, row_count,
+                                time.perf_counter() - start, transformation_metadata, chunk)
+
+    @staticmethod
+    def _add_plan(index: int,
+                  statement: str,
+                  explain_output,
+                  plans: List[Dict],
+                  transformation_metadata: EtlTransformation,
+                  chunk: Optional[str] = None,
+                  ) -> Tuple[str, int]:
+        plan = parse_explain_output(explain_output)
+        plans.append({'statement_index': index, 'chunk': chunk, 'statement': statement,
+                      'plan': plan})
+        transformation_metadata.plan_nodes.extend(
+            get_slowest_plan_nodes(plan, statement_index=index, n=_N_PLAN_NODES))
+        return get_plan_command(plan), get_plan_row_count(plan)
+
+    @staticmethod
+    def _write_plans(query_name: str, plans: List[Dict]) -> None:
+        time_str = time.strftime("%Y-%m-%dT%H%M%S")
+        plan_file = LOG_OUTPUT_DIR / f'{time_str}_{Path(query_name).stem}_plans.json'
+        plan_file.parent.mkdir(exist_ok=True)
+        with plan_file.open('w', encoding='utf-8') as f:
+            json.dump(plans, f, indent=2)
+        logger.info(f'Query plans of {query_name} written to {plan_file}')
+
+    @staticmethod
+    def _log_failed_statement(query_name: str, statement: str, msg: Exception) -> None:
+        logger.error(f'Query failed: {query_name}')
+        logger.error(statement)
+        logger.error(msg)
 
     @staticmethod
     def apply_sql_parameters(parameterized_query: str, sql_parameters: Dict[str, str]) -> str:
         """
         Create finalized SQL query by replacing any parameters.
 
+        All parameters are replaced in a single pass, see SqlTemplate.
+
         Parameters
         ----------
         parameterized_query : str
@@ -115,24 +510,47 @@ class RawSqlWrapper:
         str
             The finalized SQL query.
         """
-        replacement_dict = {'@' + key: value for key, value in sql_parameters.items()}
-        return replace_substrings(parameterized_query, replacement_dict)
-
-    def _collect_transformation_statistics(self,
-                                           result: ResultProxy,
-                                           query: str,
-                                           transformation_metadata: EtlTransformation
-                                           ) -> None:
-        status_message: str = result.context.cursor.statusmessage
-        target_table: str = self.parse_target_table_sqlquery(query)
-        row_count: int = result.rowcount
-
-        if status_message.startswith('INSERT'):
-            transformation_metadata.insertion_counts = Counter({target_table: row_count})
-        elif status_message.startswith('UPDATE'):
-            transformation_metadata.update_counts = Counter({target_table: row_count})
-        elif status_message.startswith('DELETE'):
-            transformation_metadata.deletion_counts = Counter({target_table: row_count})
+        return SqlTemplate(parameterized_query).render(sql_parameters)
+
+    def _add_statement(self,
+                       index: int,
+                       statement: str,
+                       command: str,
+                       row_count: int,
+                       duration: float,
+                       transformation_metadata: EtlTransformation,
+                       chunk: Optional[str] = None,
+                       ) -> None:
+        target_table: str = self.parse_target_table_sqlquery(statement)
+        logger.debug(f'Statement {index} of {transformation_metadata.name}: '
+                     f'{command} {row_count} ({duration:.2f}s)')
+        transformation_metadata.statements.append(EtlStatement(
+            index=index, command=command, target_table=target_table,
+            row_count=row_count, duration=duration, chunk=chunk))
+        if command == 'INSERT':
+            transformation_metadata.insertion_counts[target_table] += row_count
+        elif command == 'UPDATE':
+            transformation_metadata.update_counts[target_table] += row_count
+        elif command == 'DELETE':
+            transformation_metadata.deletion_counts[target_table] += row_count
+
+    @staticmethod
+    def _clear_transformation_counts(transformation_metadata: EtlTransformation) -> None:
+        # Changes of a rolled back transaction were not persisted
+        transformation_metadata.insertion_counts.clear()
+        transformation_metadata.update_counts.clear()
+        transformation_metadata.deletion_counts.clear()
+
+    @staticmethod
+    def _parse_command(status_message: Optional[str]) -> str:
+        # Command status of the last statement, e.g. 'INSERT 0 5'
+        return status_message.split()[0] if status_message else '?'
+
+    @staticmethod
+    def _parse_row_count(status_message: str) -> int:
+        # Command status of the last statement, e.g. 'INSERT 0 5'
+        last_word = status_message.split()[-1] if status_message else ''
+        return int(last_word) if last_word.isdigit() else -1
 
     @staticmethod
     def parse_target_table_sqlquery(query: str) -> str:
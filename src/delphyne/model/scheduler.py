@@ -0,0 +1,305 @@
+"""Dependency-aware concurrent execution of transformations."""
+
+from __future__ import annotations
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union, TYPE_CHECKING
+
+from .etl_stats import EtlTransformation, etl_stats
+from .process_pool import WrapperProcessPool
+
+if TYPE_CHECKING:
+    from ..wrapper import Wrapper
+
+logger = logging.getLogger(__name__)
+
+_VALID_EXECUTORS = {'thread', 'process'}
+
+
+@dataclass
+class _Task:
+    name: str
+    method_name: str
+    args: Tuple = ()
+    kwargs: Dict = field(default_factory=dict)
+    depends_on: Set[str] = field(default_factory=set)
+
+
+class TransformationScheduler:
+    """
+    Scheduler for running transformations concurrently.
+
+    Python and SQL transformations are registered together with the
+    names of the transformations they depend on. When run, each
+    transformation is started as soon as all of its dependencies have
+    completed successfully, with at most max_workers transformations
+    running at the same time. Every transformation uses its own session
+    or connection, and is recorded in etl_stats as usual.
+
+    If a transformation fails, the transformations depending on it
+    (directly or indirectly) are skipped. With stop_on_failure, no new
+    transformations are started at all after a failure.
+
+    Parameters
+    ----------
+    wrapper : Wrapper
+        Wrapper instance used to execute the transformations.
+    max_workers : int, default 4
+        Maximum number of transformations that run at the same time.
+    executor : {'thread', 'process'}, default 'thread'
+        If 'thread', transformations run in a thread pool. If 'process',
+        they run in a pool of worker processes, each with its own copy
+        of the wrapper and database engine. In that case, transformation
+        functions must be defined at module level.
+    stop_on_failure : bool, default False
+        If True, skip all transformations that have not been started
+        yet once a transformation fails. Transformations that are
+        already running will complete.
+    """
+
+    def __init__(self,
+                 wrapper: Wrapper,
+                 max_workers: int = 4,
+                 executor: str = 'thread',
+                 stop_on_failure: bool = False):
+        if executor not in _VALID_EXECUTORS:
+            raise ValueError(f'Invalid executor "{executor}", '
+                             f'must be one of {sorted(_VALID_EXECUTORS)}')
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self._wrapper = wrapper
+        self._max_workers = max_workers
+        self._executor = executor
+        self._stop_on_failure = stop_on_failure
+        self._tasks: Dict[str, _Task] = {}
+        self._succeeded: Set[str] = set()
+
+    @property
+    def task_names(self) -> List[str]:
+        """Names of all registered transformations."""
+        return list(self._tasks)
+
+    @property
+    def succeeded_task_names(self) -> List[str]:
+        """Names of the transformations that succeeded last run."""
+        return [name for name in self._tasks if name in self._succeeded]
+
+    def add_transformation(self,
+                           statement: Callable,
+                           depends_on: Optional[Iterable[str]] = None,
+                           name: Optional[str] = None,
+                           **kwargs,
+                           ) -> str:
+        """
+        Register a python transformation.
+
+        Parameters
+        ----------
+        statement : Callable
+            Python function as accepted by execute_transformation.
+        depends_on : iterable of str, optional
+            Names of the transformations that must complete first.
+        name : str, optional
+            Name of the transformation in the schedule. Defaults to the
+            name of the statement.
+        **kwargs
+            Additional arguments for execute_transformation.
+
+        Returns
+        -------
+        str
+            Name of the transformation in the schedule.
+        """
+        name = name or statement.__name__
+        return self._add_task(name, 'execute_transformation', (statement,), kwargs, depends_on)
+
+    def add_batch_transformation(self,
+                                 batch_statement: Callable,
+                                 depends_on: Optional[Iterable[str]] = None,
+                                 name: Optional[str] = None,
+                                 **kwargs,
+                                 ) -> str:
+        """
+        Register a batched python transformation.
+
+        Parameters
+        ----------
+        batch_statement : Callable
+            Python generator function as accepted by
+            execute_batch_transformation.
+        depends_on : iterable of str, optional
+            Names of the transformations that must complete first.
+        name : str, optional
+            Name of the transformation in the schedule. Defaults to the
+            name of the statement.
+        **kwargs
+            Additional arguments for execute_batch_transformation.
+
+        Returns
+        -------
+        str
+            Name of the transformation in the schedule.
+        """
+        name = name or batch_statement.__name__
+        return self._add_task(name, 'execute_batch_transformation', (batch_statement,),
+                              kwargs, depends_on)
+
+    def add_sql_file(self,
+                     file_path: Union[Path, str],
+                     depends_on: Optional[Iterable[str]] = None,
+                     name: Optional[str] = None,
+                     ) -> str:
+        """
+        Register a raw SQL transformation from a file.
+
+        Parameters
+        ----------
+        file_path : pathlib.Path or str
+            SQL file path as accepted by execute_sql_file.
+        depends_on : iterable of str, optional
+            Names of the transformations that must complete first.
+        name : str, optional
+            Name of the transformation in the schedule. Defaults to the
+            file name.
+
+        Returns
+        -------
+        str
+            Name of the transformation in the schedule.
+        """
+        name = name or Path(file_path).name
+        return self._add_task(name, 'execute_sql_file', (file_path,), {}, depends_on)
+
+    def add_sql_query(self,
+                      query: str,
+                      query_name: str,
+                      depends_on: Optional[Iterable[str]] = None,
+                      ) -> str:
+        """
+        Register a raw SQL query transformation.
+
+        Parameters
+        ----------
+        query : str
+            Full SQL query as string.
+        query_name : str
+            Name of the transformation.
+        depends_on : iterable of str, optional
+            Names of the transformations that must complete first.
+
+        Returns
+        -------
+        str
+            Name of the transformation in the schedule.
+        """
+        return self._add_task(query_name, 'execute_sql_query', (query, query_name), {},
+                              depends_on)
+
+    def _add_task(self,
+                  name: str,
+                  method_name: str,
+                  args: Tuple,
+                  kwargs: Dict,
+                  depends_on: Optional[Iterable[str]],
+                  ) -> str:
+        if name in self._tasks:
+            raise ValueError(f'A transformation named "{name}" was already added')
+        self._tasks[name] = _Task(name=name, method_name=method_name, args=args,
+                                  kwargs=kwargs, depends_on=set(depends_on or []))
+        return name
+
+    def run(self) -> bool:
+        """
+        Run all registered transformations.
+
+        Returns when all transformations have either completed or have
+        been skipped because of a failure.
+
+        Returns
+        -------
+        bool
+            True if all transformations completed successfully.
+        """
+        self._check_dependencies()
+        logger.info(f'Running {len(self._tasks)} transformations with '
+                    f'{self._max_workers} {self._executor} workers')
+
+        pending = dict(self._tasks)
+        succeeded: Set[str] = set()
+        self._succeeded = succeeded
+        failed: Set[str] = set()
+        running: Dict[Future, str] = {}
+
+        with ExitStack() as stack:
+            submit = self._get_submit_function(stack)
+            while pending or running:
+                if failed and self._stop_on_failure:
+                    for name in pending:
+                        logger.warning(f'Skipping {name}, because a transformation failed')
+                    failed.update(pending)
+                    pending.clear()
+                for name, task in list(pending.items()):
+                    if task.depends_on & failed:
+                        logger.warning(f'Skipping {name}, because a dependency failed')
+                        failed.add(name)
+                        del pending[name]
+                    elif task.depends_on <= succeeded and len(running) < self._max_workers:
+                        # Only submit what can start, so nothing is left
+                        # queued in the executor after a failure
+                        running[submit(task)] = name
+                        del pending[name]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if self._task_succeeded(name, future):
+                        succeeded.add(name)
+                    else:
+                        failed.add(name)
+
+        logger.info(f'Scheduled transformations completed: {len(succeeded)} success '
+                    f'and {len(failed)} fails')
+        return not failed
+
+    def _check_dependencies(self) -> None:
+        for task in self._tasks.values():
+            unknown = task.depends_on - self._tasks.keys()
+            if unknown:
+                raise ValueError(f'{task.name} depends on unknown transformations: '
+                                 f'{sorted(unknown)}')
+        # Repeatedly remove tasks without unresolved dependencies; if
+        # any remain, they are part of a dependency cycle.
+        remaining = {name: set(task.depends_on) for name, task in self._tasks.items()}
+        while remaining:
+            resolved = {name for name, deps in remaining.items() if not deps}
+            if not resolved:
+                raise ValueError(f'Circular dependency between transformations: '
+                                 f'{sorted(remaining)}')
+            remaining = {name: deps - resolved for name, deps in remaining.items()
+                         if name not in resolved}
+
+    def _get_submit_function(self, stack: ExitStack) -> Callable[[_Task], Future]:
+        if self._executor == 'process':
+            pool = stack.enter_context(WrapperProcessPool(self._wrapper, self._max_workers))
+            return lambda task: pool.submit(task.method_name, *task.args, **task.kwargs)
+
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=self._max_workers))
+        return lambda task: pool.submit(self._run_task, task)
+
+    def _run_task(self, task: _Task) -> List[EtlTransformation]:
+        with etl_stats.capture_transformations() as transformations:
+            getattr(self._wrapper, task.method_name)(*task.args, **task.kwargs)
+        return transformations
+
+    @staticmethod
+    def _task_succeeded(name: str, future: Future) -> bool:
+        try:
+            transformations: List[EtlTransformation] = future.result()
+        except Exception as e:
+            logger.error(f'{name} raised an exception: {e}', exc_info=e)
+            return False
+        return all(t.query_success for t in transformations)
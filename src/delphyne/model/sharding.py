@@ -0,0 +1,117 @@
+"""Partitioning of transformation input into shards."""
+
+import zlib
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+
+@dataclass(frozen=True)
+class Shard:
+    """
+    One of a fixed number of partitions of the transformation input.
+
+    Records are assigned to a shard based on a stable hash of their
+    partition key (e.g. the person source value), so the same key
+    always ends up in the same shard, in every process.
+
+    Attributes
+    ----------
+    index : int
+        Number of this shard, starting at 0.
+    n_shards : int
+        Total number of shards.
+    """
+
+    index: int
+    n_shards: int
+
+    def contains(self, key: Any) -> bool:
+        """
+        Check whether a partition key belongs to this shard.
+
+        Parameters
+        ----------
+        key : Any
+            Partition key value. Its string representation is hashed.
+
+        Returns
+        -------
+        bool
+            Return True if the key is assigned to this shard.
+        """
+        return zlib.crc32(str(key).encode('utf-8')) % self.n_shards == self.index
+
+    def __str__(self):
+        """Return index and total number of shards."""
+        return f'shard {self.index + 1}/{self.n_shards}'
+
+
+@dataclass(frozen=True)
+class KeyRange:
+    """
+    Range of integer keys, including start and excluding end.
+
+    Attributes
+    ----------
+    start : int
+        First key of the range.
+    end : int
+        First key after the range.
+    """
+
+    start: int
+    end: int
+
+    def __str__(self):
+        """Return the range in interval notation."""
+        return f'[{self.start}, {self.end})'
+
+
+@dataclass(frozen=True)
+class ChunkSpec:
+    """
+    Specification for splitting a SQL transformation into key ranges.
+
+    The ranges cover all values of an integer column, e.g. person_id,
+    from its minimum to its maximum value.
+
+    Attributes
+    ----------
+    table : str
+        Table containing the key column. Can contain SQL parameters,
+        e.g. '@cdm_schema.person'.
+    column : str
+        Integer key column.
+    chunk_size : int
+        Number of key values per range.
+    """
+
+    table: str
+    column: str
+    chunk_size: int
+
+    def __post_init__(self):
+        """Validate the chunk size."""
+        if self.chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+
+    def get_key_ranges(self, min_key: Optional[int], max_key: Optional[int]) -> List[KeyRange]:
+        """
+        Split the keys from min_key up to and including max_key.
+
+        Parameters
+        ----------
+        min_key : int, optional
+            Lowest key value. If None, the table is considered empty.
+        max_key : int, optional
+            Highest key value.
+
+        Returns
+        -------
+        list of KeyRange
+            Consecutive ranges of at most chunk_size keys.
+        """
+        if min_key is None or max_key is None:
+            return []
+        return [KeyRange(start, min(start + self.chunk_size, max_key + 1))
+                for start in range(min_key, max_key + 1, self.chunk_size)]
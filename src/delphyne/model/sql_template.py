@@ -0,0 +1,158 @@
+"""Compiled and cached raw SQL query templates."""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Pattern, Tuple, Union
+
+from ..util.sql import split_sql_statements
+
+logger = logging.getLogger(__name__)
+
+# Compiled templates by file path, with the file modification time
+_template_cache: Dict[Path, Tuple[int, SqlTemplate]] = {}
+_template_cache_lock = threading.Lock()
+# Number of rendered queries kept per template
+_MAX_RENDERED = 8
+
+
+class SqlTemplate:
+    """
+    SQL query containing placeholders as indicated by an '@'.
+
+    The query is split on '@' once, after which placeholders are
+    substituted in a single pass over the query. If multiple parameter
+    names match a placeholder (e.g. 'cdm' and 'cdm_schema' for
+    '@cdm_schema'), the longest one is used. Substituted values are
+    never substituted again. Rendered queries and their separate
+    statements are kept, so rendering again with the same parameters
+    is free.
+
+    Parameters
+    ----------
+    text : str
+        The parameterized SQL query.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        # Parameter names can only occur at the start of every part but
+        # the first
+        self._parts = text.split('@')
+        self._rendered: Dict[FrozenSet[Tuple[str, str]], str] = {}
+        self._statements: Dict[FrozenSet[Tuple[str, str]], Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, file_path: Union[Path, str]) -> SqlTemplate:
+        """
+        Get the compiled template of a SQL file.
+
+        Templates are cached per file for the lifetime of the process.
+        A file is only read again if its modification time has changed.
+
+        Parameters
+        ----------
+        file_path : pathlib.Path or str
+            Path to the SQL file.
+
+        Returns
+        -------
+        SqlTemplate
+        """
+        file_path = Path(file_path).resolve()
+        mtime = file_path.stat().st_mtime_ns
+        with _template_cache_lock:
+            cached = _template_cache.get(file_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        logger.debug(f'Reading query from file: {file_path.name}')
+        with file_path.open('r') as f:
+            template = cls(f.read().strip())
+        with _template_cache_lock:
+            _template_cache[file_path] = (mtime, template)
+        return template
+
+    def render(self, parameters: Optional[Dict[str, str]]) -> str:
+        """
+        Create the finalized SQL query by substituting the parameters.
+
+        Parameters
+        ----------
+        parameters : dict of {str : str}
+            Placeholder (without '@') to final value mapping.
+
+        Returns
+        -------
+        str
+            The finalized SQL query.
+        """
+        key = frozenset((parameters or {}).items())
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            rendered = self._substitute(parameters) if parameters else self.text
+            self._add_to_cache(self._rendered, key, rendered)
+        return rendered
+
+    def render_statements(self, parameters: Optional[Dict[str, str]]) -> List[str]:
+        """
+        Create the finalized SQL query, split into separate statements.
+
+        Parameters
+        ----------
+        parameters : dict of {str : str}
+            Placeholder (without '@') to final value mapping.
+
+        Returns
+        -------
+        list of str
+            The statements of the finalized SQL query, see
+            split_sql_statements.
+        """
+        key = frozenset((parameters or {}).items())
+        statements = self._statements.get(key)
+        if statements is None:
+            statements = tuple(split_sql_statements(self.render(parameters)))
+            self._add_to_cache(self._statements, key, statements)
+        return list(statements)
+
+    def _add_to_cache(self, cache: Dict, key: FrozenSet, value) -> None:
+        with self._lock:
+            if len(cache) >= _MAX_RENDERED:
+                del cache[next(iter(cache))]
+            cache[key] = value
+
+    def _substitute(self, parameters: Dict[str, str]) -> str:
+        pattern = _get_parameter_pattern(frozenset(parameters))
+        pieces = [self._parts[0]]
+        for part in self._parts[1:]:
+            match = pattern.match(part)
+            if match is None:
+                pieces.append('@' + part)
+            else:
+                pieces.append(str(parameters[match.group()]))
+                pieces.append(part[match.end():])
+        return ''.join(pieces)
+
+
+def clear_sql_template_cache() -> None:
+    """
+    Remove all compiled SQL file templates from the cache.
+
+    Returns
+    -------
+    None
+    """
+    with _template_cache_lock:
+        _template_cache.clear()
+
+
+@lru_cache(maxsize=32)
+def _get_parameter_pattern(parameter_names: FrozenSet[str]) -> Pattern:
+    # Alternatives are tried in order, so longest names go first
+    names = sorted(parameter_names, key=lambda name: (-len(name), name))
+    return re.compile('|'.join(re.escape(name) for name in names))
@@ -1,3 +1,4 @@
 """Source to concept map loading package."""
 
+from .stcm_index import StcmIndex
 from .stcm_loader import StcmLoader
@@ -0,0 +1,221 @@
+"""In-memory lookup index of source to concept map records."""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Union
+
+import pandas as pd
+from sqlalchemy import select
+
+from ...database import Database
+
+logger = logging.getLogger(__name__)
+
+# Incremented whenever the contents of the STCM tables are changed by
+# this process, so indexes know their versions must be checked again.
+_generation = itertools.count()
+_current_generation = next(_generation)
+
+
+def invalidate_stcm_indexes() -> None:
+    """
+    Mark all StcmIndex instances as possibly outdated.
+
+    Called after the source_to_concept_map tables have been modified.
+    Indexes will compare the versions of their loaded vocabularies with
+    the source_to_concept_map_version table upon their next use, and
+    reload any vocabulary of which the version has changed.
+
+    Returns
+    -------
+    None
+    """
+    global _current_generation
+    _current_generation = next(_generation)
+
+
+class StcmIndex:
+    """
+    In-memory index of source_to_concept_map target concept_ids.
+
+    All mappings of a source vocabulary are loaded with a single
+    streamed query when the vocabulary is first used, after which
+    lookups are dictionary lookups. Vocabularies of which the version
+    in the source_to_concept_map_version table has changed since they
+    were loaded, e.g. by StcmLoader.load, are reloaded.
+
+    If a source code maps to multiple target concepts, the lowest
+    target_concept_id is used.
+
+    Parameters
+    ----------
+    db : Database
+        Database instance to interact with.
+    cdm : module
+        Module containing all CDM table definitions.
+    """
+
+    def __init__(self, db: Database, cdm):
+        self._db = db
+        self._cdm = cdm
+        self._lock = threading.Lock()
+        self._generation = _current_generation
+        # source_vocabulary_id -> source_code -> target_concept_id
+        self._mappings: Dict[str, Dict[str, int]] = {}
+        self._versions: Dict[str, Optional[str]] = {}
+
+    @property
+    def loaded_vocabulary_ids(self) -> List[str]:
+        """Source vocabulary ids currently held in memory."""
+        return list(self._mappings)
+
+    def load(self, source_vocabulary_ids: Iterable[str]) -> None:
+        """
+        Load the mappings of source vocabularies into memory.
+
+        Vocabularies that are already loaded and up to date are not
+        queried again.
+
+        Parameters
+        ----------
+        source_vocabulary_ids : iterable of str
+            Source vocabulary ids to load.
+
+        Returns
+        -------
+        None
+        """
+        self._get_mappings(list(source_vocabulary_ids))
+
+    def clear(self) -> None:
+        """
+        Remove all loaded mappings from memory.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._mappings = {}
+            self._versions = {}
+
+    def lookup(self, source_vocabulary_id: str, source_code: str, default: int = 0) -> int:
+        """
+        Get the target_concept_id of a source code.
+
+        Parameters
+        ----------
+        source_vocabulary_id : str
+            Vocabulary ID of the source code.
+        source_code : str
+            Code belonging to the source vocabulary for which to look up
+            the mapping.
+        default : int, default 0
+            Value returned if the source code is not mapped.
+
+        Returns
+        -------
+        int
+            Target_concept_id if present, otherwise the default.
+        """
+        return self._get_mapping(source_vocabulary_id).get(source_code, default)
+
+    def map(self,
+            source_vocabulary_id: str,
+            source_codes: Union[pd.Series, Iterable[str]],
+            default: int = 0,
+            ) -> Union[pd.Series, List[int]]:
+        """
+        Get the target_concept_ids of multiple source codes.
+
+        Parameters
+        ----------
+        source_vocabulary_id : str
+            Vocabulary ID of the source codes.
+        source_codes : pandas.Series or iterable of str
+            Codes belonging to the source vocabulary for which to look
+            up the mapping.
+        default : int, default 0
+            Value used for source codes that are not mapped.
+
+        Returns
+        -------
+        pandas.Series or list of int
+            Target_concept_ids, as a Series with the same index if a
+            Series was provided, otherwise as a list.
+        """
+        mapping = self._get_mapping(source_vocabulary_id)
+        if isinstance(source_codes, pd.Series):
+            return source_codes.map(mapping).fillna(default).astype(int)
+        return [mapping.get(code, default) for code in source_codes]
+
+    def _get_mapping(self, source_vocabulary_id: str) -> Dict[str, int]:
+        mapping = self._mappings.get(source_vocabulary_id)
+        if mapping is None or self._generation != _current_generation:
+            mapping = self._get_mappings([source_vocabulary_id])[source_vocabulary_id]
+        return mapping
+
+    def _get_mappings(self, source_vocabulary_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            if self._generation != _current_generation:
+                self._drop_outdated_vocabularies()
+            to_load = {vocab_id for vocab_id in source_vocabulary_ids
+                       if vocab_id not in self._mappings}
+            if to_load:
+                self._load_vocabularies(to_load)
+            return self._mappings
+
+    def _get_versions(self, source_vocabulary_ids: Iterable[str]) -> Dict[str, str]:
+        version_table = self._cdm.SourceToConceptMapVersion.__table__
+        query = select([version_table.c.source_vocabulary_id, version_table.c.stcm_version]) \
+            .where(version_table.c.source_vocabulary_id.in_(list(source_vocabulary_ids)))
+        with self._db.engine.connect() as connection:
+            return dict(connection.execute(query).fetchall())
+
+    def _drop_outdated_vocabularies(self) -> None:
+        # Read the generation before the versions, so changes made in
+        # the meantime will trigger another check.
+        generation = _current_generation
+        versions = self._get_versions(self._versions) if self._versions else {}
+        # Without a version, changes cannot be detected
+        outdated = {vocab_id for vocab_id, version in self._versions.items()
+                    if version is None or versions.get(vocab_id) != version}
+        if outdated:
+            logger.info(f'STCM versions changed for {sorted(outdated)}, '
+                        f'reloading on next lookup')
+        # Replace rather than modify the dicts, so lookups in other
+        # threads are not affected.
+        self._mappings = {vocab_id: mapping for vocab_id, mapping in self._mappings.items()
+                          if vocab_id not in outdated}
+        self._versions = {vocab_id: version for vocab_id, version in self._versions.items()
+                          if vocab_id not in outdated}
+        self._generation = generation
+
+    def _load_vocabularies(self, source_vocabulary_ids: Iterable[str]) -> None:
+        stcm_table = self._cdm.SourceToConceptMap.__table__
+        vocab_ids = sorted(source_vocabulary_ids)
+        versions = self._get_versions(vocab_ids)
+        loaded: Dict[str, Dict[str, int]] = {vocab_id: {} for vocab_id in vocab_ids}
+        query = select([stcm_table.c.source_vocabulary_id,
+                        stcm_table.c.source_code,
+                        stcm_table.c.target_concept_id]) \
+            .where(stcm_table.c.source_vocabulary_id.in_(vocab_ids)) \
+            .order_by(stcm_table.c.target_concept_id.desc())
+        n_rows = 0
+        with self._db.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(query)
+            for vocab_id, source_code, target_concept_id in result:
+                # Ordered descending, so the lowest target_concept_id of
+                # a source code is stored last
+                loaded[vocab_id][source_code] = target_concept_id
+                n_rows += 1
+        n_codes = sum(len(mapping) for mapping in loaded.values())
+        if n_rows > n_codes:
+            logger.warning(f'{n_rows - n_codes} source_to_concept_map records were ignored, '
+                           f'because their source code maps to multiple target concepts')
+        logger.info(f'Loaded {n_codes} source_to_concept_map codes for {vocab_ids}')
+        self._mappings = {**self._mappings, **loaded}
+        self._versions = {**self._versions, **{v: versions.get(v) for v in vocab_ids}}
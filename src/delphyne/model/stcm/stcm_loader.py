@@ -7,7 +7,6 @@ from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Set, Optional
 
-from sqlalchemy import MetaData
 from sqlalchemy.exc import InvalidRequestError
 
 from ..._paths import STCM_DIR, STCM_VERSION_FILE
@@ -15,6 +14,7 @@ from ...cdm.schema_placeholders import VOCAB_SCHEMA
 from ...cdm.vocabularies import BaseSourceToConceptMapVersion
 from ...database import Database
 from ...util.io import get_all_files_in_dir, file_has_valid_prefix
+from .stcm_index import invalidate_stcm_indexes
 
 logger = logging.getLogger(__name__)
 
@@ -104,6 +104,7 @@ class StcmLoader:
                 continue
             self._load_stcm_from_file(stcm_file)
         self._update_stcm_version_table()
+        invalidate_stcm_indexes()
 
     def delete(self, vocab_ids: Optional[Set[str]] = None) -> None:
         """
@@ -132,6 +133,7 @@ class StcmLoader:
                     q = session.query(table)
                     q = q.filter(table.source_vocabulary_id.in_(vocab_ids))
                     q.delete(synchronize_session=False)
+        invalidate_stcm_indexes()
 
     @staticmethod
     def _get_stcm_files() -> Set[Path]:
@@ -162,14 +164,13 @@ class StcmLoader:
                 self._provided_stcm_versions[vocab_id] = version
 
     def _check_stcm_version_table_exists(self) -> None:
-        metadata = MetaData(bind=self._db.engine)
         schema = self._db.schema_translate_map.get(VOCAB_SCHEMA)
-        try:
-            metadata.reflect(schema=schema, only=[_STCM_VERSION_TABLE_NAME])
-        except InvalidRequestError:
-            logger.error(f'Table {schema}.{_STCM_VERSION_TABLE_NAME} does not exist. '
+        full_table_name = f'{schema}.{_STCM_VERSION_TABLE_NAME}'
+        if full_table_name not in self._db.reflected_metadata.tables:
+            logger.error(f'Table {full_table_name} does not exist. '
                          'Run create_all to ensure all required tables are present.')
-            raise
+            raise InvalidRequestError(f'Could not reflect: requested table(s) not available '
+                                      f'in Engine: ({full_table_name})')
 
     def _delete_outdated_stcm_records(self) -> None:
         # Delete STCM records for all source_vocabulary_ids for which a
@@ -0,0 +1,200 @@
+"""Routing of stem table records to their domain tables."""
+
+import re
+from typing import Iterable, Optional, Tuple
+
+ROUTED_STEM_TABLE = '@cdm_schema.stem_table_routed'
+WATERMARK_TABLE = '@cdm_schema.stem_table_watermark'
+
+# Source of the records in the stem_table_to_* post-processing queries
+_DOMAIN_FILTER_PATTERN = re.compile(
+    r'FROM\s+@cdm_schema\.stem_table\s+'
+    r'LEFT\s+JOIN\s+@vocabulary_schema\.concept\s+USING\s*\(\s*concept_id\s*\)\s+'
+    r'WHERE\s+concept\.domain_id\s*=\s*\'(\w+)\'',
+    re.IGNORECASE
+)
+# Domain condition of both the original and the routed queries
+_DOMAIN_CONDITION_PATTERN = re.compile(
+    r'WHERE\s+(?:concept\.domain_id|stem_table\.routed_domain_id)\s*=\s*\'\w+\'',
+    re.IGNORECASE
+)
+
+
+def get_stem_table_id_condition(after_id: Optional[int], up_to_id: Optional[int]) -> str:
+    """
+    Create a SQL condition restricting the stem table ids.
+
+    Parameters
+    ----------
+    after_id : int, optional
+        Only include ids larger than this value.
+    up_to_id : int, optional
+        Only include ids up to and including this value.
+
+    Returns
+    -------
+    str
+        The condition, or 'TRUE' if neither bound is given.
+    """
+    conditions = []
+    if after_id is not None:
+        conditions.append(f'stem_table.id > {int(after_id)}')
+    if up_to_id is not None:
+        conditions.append(f'stem_table.id <= {int(up_to_id)}')
+    return ' AND '.join(conditions) or 'TRUE'
+
+
+def get_stem_table_routing_query(domains: Iterable[str],
+                                 after_id: Optional[int] = None,
+                                 up_to_id: Optional[int] = None,
+                                 ) -> str:
+    """
+    Create the query that routes stem table records to their domain.
+
+    The query resolves the domain of every stem table record with a
+    single join, and stores the records together with their domain_id
+    in an unlogged table. The records are sorted and indexed on domain,
+    so the queries for the individual domains each read only their
+    own part of the table.
+
+    Parameters
+    ----------
+    domains : iterable of str
+        Domain ids of the records to route.
+    after_id : int, optional
+        Only route records with an id larger than this value.
+    up_to_id : int, optional
+        Only route records with an id up to and including this value.
+
+    Returns
+    -------
+    str
+        The parameterized routing query.
+    """
+    domain_list = ', '.join(f"'{domain}'" for domain in sorted(domains))
+    id_condition = get_stem_table_id_condition(after_id, up_to_id)
+    return f"""
+DROP TABLE IF EXISTS {ROUTED_STEM_TABLE};
+CREATE UNLOGGED TABLE {ROUTED_STEM_TABLE} AS
+SELECT stem_table.*, concept.domain_id AS routed_domain_id
+FROM @cdm_schema.stem_table
+    JOIN @vocabulary_schema.concept USING (concept_id)
+WHERE concept.domain_id IN ({domain_list})
+    AND {id_condition}
+ORDER BY concept.domain_id;
+CREATE INDEX ON {ROUTED_STEM_TABLE} (routed_domain_id);
+ANALYZE {ROUTED_STEM_TABLE};
+"""
+
+
+def get_drop_routed_stem_table_query() -> str:
+    """
+    Create the query that drops the routed stem table.
+
+    Returns
+    -------
+    str
+        The parameterized drop query.
+    """
+    return f'DROP TABLE IF EXISTS {ROUTED_STEM_TABLE};'
+
+
+def route_domain_query(query: str) -> Tuple[str, str]:
+    """
+    Let a stem table to domain query read from the routed stem table.
+
+    The query must select from the stem table joined with the concept
+    table, filtered on a single concept domain_id, as is the case for
+    the stem_table_to_* post-processing queries.
+
+    Parameters
+    ----------
+    query : str
+        Parameterized stem table to domain query.
+
+    Returns
+    -------
+    tuple of (str, str)
+        The rewritten query and the domain_id it selects.
+
+    Raises
+    ------
+    ValueError
+        If the query does not select stem table records by domain.
+    """
+    match = _DOMAIN_FILTER_PATTERN.search(query)
+    if match is None:
+        raise ValueError('Query does not select stem table records by concept domain_id')
+    domain = match.group(1)
+    routed_query = (query[:match.start()]
+                    + f'FROM {ROUTED_STEM_TABLE} AS stem_table\n'
+                      f"WHERE stem_table.routed_domain_id = '{domain}'"
+                    + query[match.end():])
+    return routed_query, domain
+
+
+def restrict_domain_query(query: str, after_id: Optional[int], up_to_id: Optional[int]) -> str:
+    """
+    Let a stem table to domain query only select a range of ids.
+
+    Works on both the stem_table_to_* post-processing queries and their
+    routed versions.
+
+    Parameters
+    ----------
+    query : str
+        Parameterized stem table to domain query.
+    after_id : int, optional
+        Only select records with an id larger than this value.
+    up_to_id : int, optional
+        Only select records with an id up to and including this value.
+
+    Returns
+    -------
+    str
+        The restricted query.
+
+    Raises
+    ------
+    ValueError
+        If the query does not select stem table records by domain.
+    """
+    match = _DOMAIN_CONDITION_PATTERN.search(query)
+    if match is None:
+        raise ValueError('Query does not select stem table records by concept domain_id')
+    id_condition = get_stem_table_id_condition(after_id, up_to_id)
+    return query[:match.end()] + f'\n    AND {id_condition}' + query[match.end():]
+
+
+def get_create_watermark_table_query() -> str:
+    """
+    Create the query that creates the watermark table if needed.
+
+    The watermark table records, for every stem table to domain query,
+    up to which stem table id the records have been distributed. A row
+    is added for every successful run.
+
+    Returns
+    -------
+    str
+        The parameterized create query.
+    """
+    return f"""
+CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+    query_name VARCHAR(255) NOT NULL,
+    max_stem_table_id BIGINT NOT NULL,
+    distributed_at TIMESTAMP NOT NULL DEFAULT now()
+);
+"""
+
+
+def get_drop_watermark_table_query() -> str:
+    """
+    Create the query that drops the watermark table.
+
+    Returns
+    -------
+    str
+        The parameterized drop query.
+    """
+    return f'DROP TABLE IF EXISTS {WATERMARK_TABLE};'
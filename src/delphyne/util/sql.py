@@ -0,0 +1,163 @@
+"""SQL text utility functions."""
+
+import re
+from typing import List
+
+_DOLLAR_QUOTE_TAG = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)?\$')
+# Statements that change the structure of the database
+_DDL_PATTERN = re.compile(r'(?:CREATE|ALTER|DROP)\s', re.IGNORECASE)
+
+
+def split_sql_statements(sql: str) -> List[str]:
+    """
+    Split a string of (PostgreSQL) SQL into separate statements.
+
+    Statements are split on semicolons, except for semicolons inside
+    string literals (including E'' strings with backslash escapes),
+    quoted identifiers, dollar-quoted strings, and line and (nested)
+    block comments. Statements are stripped of surrounding whitespace
+    and their terminating semicolon. Statements containing nothing but
+    comments are left out.
+
+    Parameters
+    ----------
+    sql : str
+        One or more SQL statements.
+
+    Returns
+    -------
+    list of str
+        The separate statements.
+    """
+    statements: List[str] = []
+    start = 0
+    i = 0
+    n = len(sql)
+    has_code = False
+    while i < n:
+        char = sql[i]
+        if char == '-' and sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = n if end == -1 else end + 1
+            continue
+        if char == '/' and sql.startswith('/*', i):
+            i = _skip_block_comment(sql, i)
+            continue
+        if char == ';':
+            if has_code:
+                statements.append(sql[start:i].strip())
+            start = i + 1
+            has_code = False
+            i += 1
+            continue
+
+        has_code = has_code or not char.isspace()
+        if char in ("'", '"'):
+            i = _skip_quoted(sql, i, backslash_escapes=char == "'" and _is_escape_string(sql, i))
+        elif char == '$' and (i == 0 or not _is_identifier_char(sql[i - 1])):
+            match = _DOLLAR_QUOTE_TAG.match(sql, i)
+            if match:
+                end = sql.find(match.group(), match.end())
+                i = n if end == -1 else end + len(match.group())
+            else:
+                i += 1
+        else:
+            i += 1
+
+    if has_code:
+        statements.append(sql[start:].strip())
+    return statements
+
+
+def strip_leading_comments(statement: str) -> str:
+    """
+    Remove whitespace and comments from the start of a SQL statement.
+
+    Parameters
+    ----------
+    statement : str
+        A SQL statement.
+
+    Returns
+    -------
+    str
+        The statement, starting at its first keyword.
+    """
+    i = 0
+    n = len(statement)
+    while i < n:
+        if statement[i].isspace():
+            i += 1
+        elif statement.startswith('--', i):
+            end = statement.find('\n', i)
+            i = n if end == -1 else end + 1
+        elif statement.startswith('/*', i):
+            i = _skip_block_comment(statement, i)
+        else:
+            break
+    return statement[i:]
+
+
+def is_ddl_statement(statement: str) -> bool:
+    """
+    Check whether a SQL statement changes the database structure.
+
+    Parameters
+    ----------
+    statement : str
+        A single SQL statement.
+
+    Returns
+    -------
+    bool
+        True for CREATE, ALTER and DROP statements.
+    """
+    return _DDL_PATTERN.match(strip_leading_comments(statement)) is not None
+
+
+def _is_identifier_char(char: str) -> bool:
+    return char.isalnum() or char in '_$'
+
+
+def _is_escape_string(sql: str, quote_index: int) -> bool:
+    # E'...' or e'...', where the E is not the end of an identifier
+    return (quote_index >= 1 and sql[quote_index - 1] in 'Ee'
+            and (quote_index == 1 or not _is_identifier_char(sql[quote_index - 2])))
+
+
+def _skip_quoted(sql: str, i: int, backslash_escapes: bool) -> int:
+    # Return the index after the closing quote. Quotes are escaped by
+    # doubling them.
+    quote = sql[i]
+    i += 1
+    n = len(sql)
+    while i < n:
+        char = sql[i]
+        if backslash_escapes and char == '\\':
+            i += 2
+            continue
+        if char == quote:
+            if i + 1 < n and sql[i + 1] == quote:
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return n
+
+
+def _skip_block_comment(sql: str, i: int) -> int:
+    # Return the index after the comment. Block comments can be nested.
+    depth = 0
+    n = len(sql)
+    while i < n:
+        if sql.startswith('/*', i):
+            depth += 1
+            i += 2
+        elif sql.startswith('*/', i):
+            depth -= 1
+            i += 2
+            if depth == 0:
+                return i
+        else:
+            i += 1
+    return n
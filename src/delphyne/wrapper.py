@@ -1,11 +1,12 @@
 """Wrapper module."""
 
+import importlib
 import logging
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterable, Tuple
 
 import sys
-from sqlalchemy import Table
+from sqlalchemy import Table, text
 from sqlalchemy.schema import CreateSchema
 
 from ._paths import SOURCE_DATA_CONFIG_PATH
@@ -13,11 +14,17 @@ from .cdm import vocabularies as cdm
 from .cdm.schema_placeholders import VOCAB_SCHEMA
 from .config.models import MainConfig
 from .database import Database
-from .model.etl_stats import EtlStatsReporter, etl_stats
+from .model.etl_stats import EtlStatsReporter, etl_stats, suspend_active_transformation
 from .model.mapping import CodeMapper
 from .model.orm_wrapper import OrmWrapper
 from .model.raw_sql_wrapper import RawSqlWrapper
+from .model.scheduler import TransformationScheduler
 from .model.source_data import SourceData
+from .model.stem_table import (WATERMARK_TABLE, get_create_watermark_table_query,
+                               get_drop_routed_stem_table_query,
+                               get_drop_watermark_table_query,
+                               get_stem_table_routing_query, restrict_domain_query,
+                               route_domain_query)
 from .model.vocab_manager import VocabManager
 from .util.io import read_yaml_file
 
@@ -25,6 +32,18 @@ logger = logging.getLogger(__name__)
 
 _HERE = Path(__file__).parent
 
+_STEM_TABLE_TO_DOMAIN_FILES = [
+    'stem_table_to_measurement.sql',
+    'stem_table_to_condition_occurrence.sql',
+    'stem_table_to_device_exposure.sql',
+    'stem_table_to_drug_exposure.sql',
+    'stem_table_to_observation.sql',
+    'stem_table_to_procedure_occurrence.sql',
+    'stem_table_to_specimen.sql',
+]
+
+_VALID_STEM_TABLE_METHODS = {'per_domain', 'routed'}
+
 
 class Wrapper(OrmWrapper, RawSqlWrapper):
     """
@@ -49,13 +68,59 @@ class Wrapper(OrmWrapper, RawSqlWrapper):
         if not self.db.can_connect(str(self.db.engine.url)):
             sys.exit()
 
-        super().__init__(database=self.db)
+        super().__init__(database=self.db, cdm_=cdm_)
         super(OrmWrapper, self).__init__(database=self.db, config=config)
 
         self.source_data: Optional[SourceData] = self._set_source_data()
         self.vocab_manager = VocabManager(self.db, cdm_, config)
         self.code_mapper = CodeMapper(self.db, cdm_)
 
+    def __getstate__(self) -> Dict:
+        """Get instance state, without references to the cdm module."""
+        # Modules cannot be pickled, so the components holding a
+        # reference to the cdm module are recreated when unpickling.
+        state = self.__dict__.copy()
+        state['_cdm_module_name'] = state.pop('code_mapper').cdm.__name__
+        del state['vocab_manager']
+        del state['stcm_index']
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        """Restore instance state and recreate cdm module components."""
+        state = state.copy()
+        cdm_ = importlib.import_module(state.pop('_cdm_module_name'))
+        self.__dict__.update(state)
+        self.vocab_manager = VocabManager(self.db, cdm_, self._config)
+        self.code_mapper = CodeMapper(self.db, cdm_)
+        OrmWrapper.__init__(self, database=self.db, cdm_=cdm_)
+
+    def create_scheduler(self,
+                         max_workers: int = 4,
+                         executor: str = 'thread',
+                         stop_on_failure: bool = False,
+                         ) -> TransformationScheduler:
+        """
+        Create a scheduler for running transformations concurrently.
+
+        Parameters
+        ----------
+        max_workers : int, default 4
+            Maximum number of transformations that run at the same
+            time.
+        executor : {'thread', 'process'}, default 'thread'
+            Whether transformations run in threads or in separate
+            processes.
+        stop_on_failure : bool, default False
+            If True, no new transformations are started once one has
+            failed.
+
+        Returns
+        -------
+        TransformationScheduler
+        """
+        return TransformationScheduler(self, max_workers=max_workers, executor=executor,
+                                       stop_on_failure=stop_on_failure)
+
     def _set_source_data(self):
         source_data_path = self._config.source_data_folder
         if source_data_path is None:
@@ -70,7 +135,11 @@ class Wrapper(OrmWrapper, RawSqlWrapper):
         source_config['source_data_folder'] = source_data_path
         return SourceData(source_config)
 
-    def stem_table_to_domains(self) -> None:
+    def stem_table_to_domains(self,
+                              max_workers: int = 1,
+                              method: str = 'per_domain',
+                              incremental: bool = False,
+                              ) -> bool:
         """
         Transfer all stem table records to the OMOP tables.
 
@@ -79,19 +148,139 @@ class Wrapper(OrmWrapper, RawSqlWrapper):
         (target_concept_id == 0) will be copied into the observation
         table.
 
+        The queries for the different domains are independent, so they
+        can be run concurrently, each on its own connection. Every query
+        is recorded as a separate transformation. Once a query fails,
+        the queries that have not started yet are skipped.
+
+        Parameters
+        ----------
+        max_workers : int, default 1
+            Maximum number of queries running at the same time. By
+            default, they run one after the other.
+        method : {'per_domain', 'routed'}, default 'per_domain'
+            With 'per_domain', every domain query scans the stem table
+            and joins it with the concept table. With 'routed', the
+            domain of each stem table record is resolved once into an
+            intermediate table (stem_table_routed), from which all
+            domain queries read only their own records. The
+            intermediate table is dropped afterwards.
+        incremental : bool, default False
+            If True, only transfer the stem table records that were
+            added since the previous run. For every domain query, the
+            highest transferred stem table id is recorded in the
+            stem_table_watermark table when the query succeeds, also
+            if this is False. Requires stem table ids to increase for
+            new records. The watermarks are reset when the stem table
+            is dropped or created by drop_cdm or create_cdm.
+
         Returns
         -------
-        None
+        bool
+            True if all queries completed successfully.
         """
-        logger.info('Starting stem table to domain queries')
-        post_processing_path = _HERE / 'post_processing'
-        self.execute_sql_file(post_processing_path / 'stem_table_to_measurement.sql')
-        self.execute_sql_file(post_processing_path / 'stem_table_to_condition_occurrence.sql')
-        self.execute_sql_file(post_processing_path / 'stem_table_to_device_exposure.sql')
-        self.execute_sql_file(post_processing_path / 'stem_table_to_drug_exposure.sql')
-        self.execute_sql_file(post_processing_path / 'stem_table_to_observation.sql')
-        self.execute_sql_file(post_processing_path / 'stem_table_to_procedure_occurrence.sql')
-        self.execute_sql_file(post_processing_path / 'stem_table_to_specimen.sql')
+        if method not in _VALID_STEM_TABLE_METHODS:
+            raise ValueError(f'Invalid method "{method}", '
+                             f'must be one of {sorted(_VALID_STEM_TABLE_METHODS)}')
+        logger.info(f'Starting stem table to domain queries ({method})')
+        domain_queries = self._get_stem_table_domain_queries(method)
+
+        id_ranges = self._get_stem_table_id_ranges(domain_queries, incremental)
+        if not id_ranges:
+            logger.info('No new stem table records to transfer')
+            return True
+
+        scheduler = self.create_scheduler(max_workers=max_workers, stop_on_failure=True)
+        depends_on = []
+        if method == 'routed':
+            domains = {domain_queries[name][1] for name in id_ranges}
+            after_ids = [after_id for after_id, _ in id_ranges.values()]
+            up_to_id = next(iter(id_ranges.values()))[1]
+            routing_query = get_stem_table_routing_query(
+                domains, after_id=None if None in after_ids else min(after_ids),
+                up_to_id=up_to_id)
+            depends_on.append(scheduler.add_sql_query(routing_query,
+                                                      query_name='stem_table_routing'))
+        for name, (after_id, up_to_id) in id_ranges.items():
+            query = restrict_domain_query(domain_queries[name][0], after_id, up_to_id)
+            scheduler.add_sql_query(query, query_name=name, depends_on=depends_on)
+        try:
+            success = scheduler.run()
+        finally:
+            if method == 'routed':
+                self._drop_routed_stem_table()
+        self._update_stem_table_watermarks(
+            {name: id_ranges[name][1] for name in scheduler.succeeded_task_names
+             if name in id_ranges})
+        return success
+
+    @staticmethod
+    def _get_stem_table_domain_queries(method: str) -> Dict[str, Tuple[str, str]]:
+        # Query and domain_id by file name
+        domain_queries = {}
+        for file_name in _STEM_TABLE_TO_DOMAIN_FILES:
+            with (_HERE / 'post_processing' / file_name).open('r') as f:
+                query = f.read().strip()
+            routed_query, domain = route_domain_query(query)
+            domain_queries[file_name] = (routed_query if method == 'routed' else query, domain)
+        return domain_queries
+
+    def _get_stem_table_id_ranges(self, query_names: Iterable[str], incremental: bool
+                                  ) -> Dict[str, Tuple[Optional[int], int]]:
+        # Range of stem table ids (exclusive, inclusive) that has to be
+        # transferred by each query. If incremental, queries that are
+        # up to date are left out, otherwise all ids are transferred.
+        watermark_table = self.apply_sql_parameters(WATERMARK_TABLE, self.sql_parameters)
+        stem_table = self.apply_sql_parameters('@cdm_schema.stem_table', self.sql_parameters)
+        with suspend_active_transformation(), self.db.engine.connect() as con:
+            con.execute(text(self.apply_sql_parameters(get_create_watermark_table_query(),
+                                                       self.sql_parameters))
+                        .execution_options(autocommit=True))
+            watermarks = dict(con.execute(text(
+                f'SELECT query_name, max(max_stem_table_id) '
+                f'FROM {watermark_table} GROUP BY query_name')).fetchall())
+            max_id = con.execute(text(f'SELECT max(id) FROM {stem_table}')).scalar()
+        if max_id is None:
+            return {}
+        if not incremental:
+            return {name: (None, max_id) for name in query_names}
+        id_ranges = {}
+        for name in query_names:
+            watermark = watermarks.get(name)
+            if watermark is None or watermark < max_id:
+                id_ranges[name] = (watermark, max_id)
+        logger.info(f'Transferring stem table records up to id {max_id}, '
+                    f'previous watermarks: {watermarks}')
+        return id_ranges
+
+    def _update_stem_table_watermarks(self, watermarks: Dict[str, int]) -> None:
+        if not watermarks:
+            return
+        watermark_table = self.apply_sql_parameters(WATERMARK_TABLE, self.sql_parameters)
+        statement = text(f'INSERT INTO {watermark_table} (query_name, max_stem_table_id) '
+                         f'VALUES (:query_name, :max_stem_table_id)')
+        with suspend_active_transformation(), self.db.engine.connect() as con:
+            con.execute(statement.execution_options(autocommit=True),
+                        [{'query_name': name, 'max_stem_table_id': max_id}
+                         for name, max_id in watermarks.items()])
+
+    def _drop_stem_table_watermarks(self) -> None:
+        # Watermarks refer to the ids of the current stem table only
+        logger.info('Resetting stem table watermarks')
+        query = self.apply_sql_parameters(get_drop_watermark_table_query(),
+                                          self.sql_parameters)
+        with suspend_active_transformation(), self.db.engine.connect() as con:
+            con.execute(text(query).execution_options(autocommit=True))
+
+    def _get_stem_table(self) -> Optional[Table]:
+        return next((table for table in self.db.base.metadata.tables.values()
+                     if table.name == 'stem_table'), None)
+
+    def _drop_routed_stem_table(self) -> None:
+        query = self.apply_sql_parameters(get_drop_routed_stem_table_query(),
+                                          self.sql_parameters)
+        with self.db.engine.connect() as con:
+            con.execute(text(query).execution_options(autocommit=True))
 
     def _get_cdm_tables_to_drop(self):
         tables_to_drop = []
@@ -122,18 +311,60 @@ class Wrapper(OrmWrapper, RawSqlWrapper):
             tables_to_drop = self._get_cdm_tables_to_drop()
         with self.db.engine.connect() as conn:
             self.db.base.metadata.drop_all(bind=conn, tables=tables_to_drop)
+        self.db.constraint_manager.invalidate_current_db_cache()
+        stem_table = self._get_stem_table()
+        if stem_table is not None and stem_table in tables_to_drop:
+            self._drop_stem_table_watermarks()
 
-    def create_cdm(self) -> None:
+    def create_cdm(self, unlogged: bool = False) -> None:
         """
         Create all OMOP CDM tables as defined in base.metadata.
 
+        Parameters
+        ----------
+        unlogged : bool, default False
+            If True, make the non-vocabulary tables UNLOGGED for the
+            load phase, including tables that already existed. This
+            avoids write-ahead logging while loading, but the table
+            contents are lost after a database crash. Call
+            set_cdm_logged once loading is complete.
+
         Returns
         -------
         None
         """
         logger.info('Creating OMOP CDM (non-vocabulary) tables')
+        stem_table = self._get_stem_table()
+        if stem_table is not None:
+            schema = self.db.schema_translate_map.get(stem_table.schema, stem_table.schema)
+            if not self.db.engine.has_table(stem_table.name, schema=schema):
+                self._drop_stem_table_watermarks()
         with self.db.engine.connect() as conn:
             self.db.base.metadata.create_all(bind=conn)
+        self.db.constraint_manager.invalidate_current_db_cache()
+        if unlogged:
+            logger.info('Setting OMOP CDM (non-vocabulary) tables UNLOGGED')
+            self.db.set_tables_unlogged(self._get_cdm_tables_to_drop())
+
+    def set_cdm_logged(self, max_workers: int = 1) -> None:
+        """
+        Make all unlogged CDM tables LOGGED again.
+
+        Finalizes the UNLOGGED load mode of create_cdm. Can be called
+        both before and after adding constraints with the
+        ConstraintManager.
+
+        Parameters
+        ----------
+        max_workers : int, default 1
+            Maximum number of tables that are altered simultaneously.
+
+        Returns
+        -------
+        None
+        """
+        logger.info('Setting OMOP CDM tables LOGGED')
+        self.db.set_tables_logged(max_workers=max_workers)
 
     def create_schemas(self) -> None:
         """
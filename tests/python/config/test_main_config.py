@@ -72,3 +72,11 @@ def test_mapping_value_can_be_same_as_key_within_same_pair(default_main_config:
     sql_parameters = {'key1': 'key1'}
     default_main_config['sql_parameters'] = sql_parameters
     MainConfig(**default_main_config)
+
+
+def test_staging_schema_cannot_be_cdm_schema(default_main_config: Dict):
+    schema_map = default_main_config['schema_translate_map']
+    schema_map['staging_schema'] = schema_map['cdm_schema']
+    with pytest.raises(ValidationError) as error:
+        MainConfig(**default_main_config)
+    assert 'staging_schema cannot be the same schema as cdm_schema' in str(error.value)
@@ -144,6 +144,15 @@ def cdm531_wrapper_with_tables_created(wrapper_cdm531: Wrapper) -> Wrapper:
     return wrapper_cdm531
 
 
+@pytest.mark.usefixtures("test_db")
+@pytest.fixture(scope='function')
+def cdm531_wrapper_no_constraints(cdm531_wrapper_with_tables_created: Wrapper) -> Wrapper:
+    """cdm531 wrapper with tables created, but without constraints."""
+    wrapper = cdm531_wrapper_with_tables_created
+    wrapper.db.constraint_manager.drop_all_constraints()
+    return wrapper
+
+
 @pytest.mark.usefixtures("test_db")
 @pytest.fixture(scope='function')
 def cdm600_wrapper_with_tables_created(wrapper_cdm600: Wrapper) -> Wrapper:
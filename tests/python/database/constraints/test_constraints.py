@@ -2,9 +2,13 @@ import logging
 from typing import Set
 
 import pytest
-from sqlalchemy import Table, Index, Constraint, MetaData
+from sqlalchemy import Table, Index, Constraint, MetaData, Column, Integer
 from sqlalchemy.exc import InternalError, ProgrammingError
 from src.delphyne import Wrapper
+from src.delphyne.database.constraints.constraint_manager import (_group_by_table,
+                                                                  _ReflectedConstraints,
+                                                                  ConstraintManager)
+from src.delphyne.database.database import Database
 
 from tests.python.conftest import docker_not_available
 from tests.python.database.constraints import constraint_sets as expected_sets
@@ -209,3 +213,169 @@ def test_drop_and_add_all_constraints(cdm600_wrapper_with_tables_created: Wrappe
     wrapper.db.constraint_manager.add_all_constraints()
     all_db_objects = get_all_db_table_object_names(wrapper.db.reflected_metadata)
     assert all_db_objects == expected_sets.db_table_objects_full
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_drop_and_add_all_constraints_concurrently(cdm600_wrapper_with_tables_created: Wrapper):
+    wrapper = cdm600_wrapper_with_tables_created
+    constraint_manager = wrapper.db.constraint_manager
+
+    constraint_manager.drop_all_constraints(max_workers=4, maintenance_work_mem='64MB')
+    all_db_objects = get_all_db_table_object_names(wrapper.db.reflected_metadata)
+    assert all_db_objects == {None}
+
+    constraint_manager.add_all_constraints(max_workers=4, maintenance_work_mem='64MB')
+    all_db_objects = get_all_db_table_object_names(wrapper.db.reflected_metadata)
+    assert all_db_objects == expected_sets.db_table_objects_full
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_group_by_table(wrapper_cdm600: Wrapper):
+    model = wrapper_cdm600.db.constraint_manager._model
+    groups = _group_by_table(model.constraints)
+    group_tables = [{c.table.name for c in group} for group in groups]
+    # Vocabulary tables referencing each other share a group
+    assert {'concept', 'domain', 'vocabulary', 'concept_class'} in group_tables
+    assert {'person'} in group_tables
+    assert sum(len(group) for group in groups) == len(model.constraints)
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_reflected_constraints_updated_incrementally(
+        cdm600_wrapper_with_tables_created: Wrapper, monkeypatch):
+    wrapper = cdm600_wrapper_with_tables_created
+    constraint_manager = wrapper.db.constraint_manager
+    constraint_manager.invalidate_current_db_cache()
+
+    n_reflections = 0
+    reflect = Database.reflected_metadata.fget
+
+    def count_reflections(db: Database) -> MetaData:
+        nonlocal n_reflections
+        n_reflections += 1
+        return reflect(db)
+    monkeypatch.setattr(Database, 'reflected_metadata', property(count_reflections))
+
+    constraint_manager.drop_cdm_constraints()
+    constraint_manager.add_cdm_constraints()
+    constraint_manager.drop_constraint_or_index('ix_measurement_person_id')
+    with pytest.raises(KeyError):
+        constraint_manager.drop_constraint_or_index('ix_measurement_person_id')
+    constraint_manager.add_constraint_or_index('ix_measurement_person_id')
+    constraint_manager.drop_table_constraints('measurement')
+    constraint_manager.add_table_constraints('measurement')
+    assert n_reflections == 1
+
+    monkeypatch.undo()
+    all_db_objects = get_all_db_table_object_names(wrapper.db.reflected_metadata)
+    assert all_db_objects == expected_sets.db_table_objects_full
+
+
+def test_reflected_constraints_signature():
+    metadata = MetaData()
+    table = Table('t', metadata, Column('a', Integer), Column('b', Integer),
+                  Index('ix_t_a', 'a'))
+    reflected = _ReflectedConstraints(metadata)
+
+    other_metadata = MetaData()
+    other_table = Table('t', other_metadata, Column('a', Integer), Column('b', Integer))
+    equivalent = Index('ix_other_name', other_table.c.a)
+    different = Index('ix_t_b', other_table.c.b)
+    assert reflected.get_equivalent(equivalent) is table.indexes.pop()
+    assert reflected.get_equivalent(different) is None
+
+    reflected.add(different)
+    assert reflected.get('ix_t_b') is different
+    assert {c.name for c in reflected.get_table_objects(['t'])} == {'ix_t_a', 'ix_t_b'}
+    reflected.remove(different)
+    assert reflected.get('ix_t_b') is None
+    assert reflected.get_equivalent(different) is None
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_add_fks_not_valid(cdm531_wrapper_with_tables_created: Wrapper, caplog):
+    wrapper = cdm531_wrapper_with_tables_created
+    constraint_manager = wrapper.db.constraint_manager
+    constraint_manager.drop_cdm_constraints()
+    # Refers to a concept that does not exist
+    wrapper.execute_sql_query(
+        "INSERT INTO @cdm_schema.person (person_id, gender_concept_id, year_of_birth, "
+        "race_concept_id, ethnicity_concept_id) VALUES (1, 0, 1970, 0, 0);",
+        'insert_person')
+
+    with caplog.at_level(logging.INFO):
+        constraint_manager.add_cdm_constraints(max_workers=4, fk_not_valid=True)
+    assert 'Validation of fk_person_gender_concept_id_concept failed' in caplog.text
+
+    # All constraints were added, the failing ones remain NOT VALID
+    person = reflect_table(wrapper, 'cdm.person')
+    assert 'fk_person_gender_concept_id_concept' in get_constraint_names(person.constraints)
+    failures = constraint_manager.validate_constraints()
+    assert 'fk_person_gender_concept_id_concept' in failures
+    assert all(name.startswith('fk_person_') for name in failures)
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_validate_constraints_ignores_non_model_tables(
+        cdm531_wrapper_with_tables_created: Wrapper):
+    wrapper = cdm531_wrapper_with_tables_created
+    with wrapper.db.engine.connect() as conn:
+        conn.execute('CREATE TABLE cdm.not_in_model (concept_id INT); '
+                     'ALTER TABLE cdm.not_in_model ADD CONSTRAINT fk_not_in_model_concept '
+                     'FOREIGN KEY (concept_id) REFERENCES vocab.concept NOT VALID')
+    constraint_manager = wrapper.db.constraint_manager
+    constraint_manager.drop_cdm_constraints()
+    constraint_manager.add_cdm_constraints(fk_not_valid=True)
+    assert constraint_manager.validate_constraints() == {}
+    with wrapper.db.engine.connect() as conn:
+        assert not conn.execute("SELECT convalidated FROM pg_constraint "
+                                "WHERE conname = 'fk_not_in_model_concept'").scalar()
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_constraints_suspended(cdm531_wrapper_with_tables_created: Wrapper):
+    wrapper = cdm531_wrapper_with_tables_created
+    all_db_objects = get_all_db_table_object_names(wrapper.db.reflected_metadata)
+
+    with pytest.raises(ValueError):
+        with wrapper.db.constraint_manager.constraints_suspended(['person'], max_workers=4):
+            person = reflect_table(wrapper, 'cdm.person')
+            assert get_single_table_object_names(person) == {'pk_person'}
+            # Inbound FKs are suspended too, other objects remain
+            observation = reflect_table(wrapper, 'cdm.observation')
+            observation_objects = get_single_table_object_names(observation)
+            assert 'fk_observation_person_id_person' not in observation_objects
+            assert 'ix_observation_person_id' in observation_objects
+            raise ValueError('Load failed')
+
+    assert get_all_db_table_object_names(wrapper.db.reflected_metadata) == all_db_objects
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_add_fk_indexes(cdm531_wrapper_with_tables_created: Wrapper):
+    wrapper = cdm531_wrapper_with_tables_created
+    constraint_manager = wrapper.db.constraint_manager
+
+    unindexed_fks = {fk.name for fk in constraint_manager.get_unindexed_fks()}
+    assert 'fk_measurement_provider_id_provider' in unindexed_fks
+    assert 'fk_measurement_person_id_person' not in unindexed_fks
+
+    model_tables = wrapper.db.base.metadata.tables
+    n_model_indexes = sum(len(table.indexes) for table in model_tables.values())
+
+    indexes = constraint_manager.add_fk_indexes(max_workers=4)
+    assert len(indexes) == len(unindexed_fks)
+    assert constraint_manager.get_unindexed_fks() == []
+    measurement = reflect_table(wrapper, 'cdm.measurement')
+    assert 'ix_measurement_provider_id' in get_index_names(measurement.indexes)
+
+    # The indexes are part of the model index lifecycle
+    constraint_manager.drop_cdm_constraints()
+    constraint_manager.add_cdm_constraints()
+    measurement = reflect_table(wrapper, 'cdm.measurement')
+    assert 'ix_measurement_provider_id' in get_index_names(measurement.indexes)
+
+    # The shared model tables and other wrappers are unaffected
+    assert sum(len(table.indexes) for table in model_tables.values()) == n_model_indexes
+    other_manager = ConstraintManager(wrapper.db)
+    assert {fk.name for fk in other_manager.get_unindexed_fks()} == unindexed_fks
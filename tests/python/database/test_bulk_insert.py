@@ -0,0 +1,63 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+from src.delphyne.database.bulk_insert import (format_copy_value, group_records_by_table,
+                                               get_record_values, iter_records)
+
+from tests.python.cdm import cdm531
+
+
+@pytest.mark.parametrize('value,expected', [
+    (None, '\\N'),
+    (float('nan'), '\\N'),
+    (pd.NaT, '\\N'),
+    (pd.NA, '\\N'),
+    (np.float32('nan'), '\\N'),
+    (np.float64('nan'), '\\N'),
+    (np.float32(1.5), '1.5'),
+    (np.bool_(False), 'f'),
+    (True, 't'),
+    (12, '12'),
+    (1.5, '1.5'),
+    (Decimal('10.25'), '10.25'),
+    (datetime.date(2020, 2, 29), '2020-02-29'),
+    (datetime.datetime(2020, 2, 29, 13, 5), '2020-02-29T13:05:00'),
+    ('tab\tnew\nline\\', 'tab\\tnew\\nline\\\\'),
+])
+def test_format_copy_value(value, expected):
+    assert format_copy_value(value) == expected
+
+
+def test_group_records_by_table_fk_order():
+    measurement = cdm531.Measurement(person_id=1, measurement_concept_id=0)
+    person = cdm531.Person(person_id=1, gender_concept_id=0)
+    location = (cdm531.Location, {'location_id': 1, 'city': 'Utrecht'})
+    groups = group_records_by_table([measurement, person, location])
+    assert [t.name for t in groups] == ['location', 'person', 'measurement']
+    assert groups[cdm531.Location.__table__] == [
+        get_record_values(location, cdm531.Location.__table__)]
+
+
+def test_record_values_apply_column_defaults():
+    version = cdm531.SourceToConceptMapVersion(source_vocabulary_id='v1', stcm_version='1')
+    values = get_record_values(version, cdm531.SourceToConceptMapVersion.__table__)
+    assert isinstance(values[-1], datetime.datetime)
+
+
+def test_tuple_row_values():
+    table = cdm531.Location.__table__
+    row = tuple(range(len(table.columns)))
+    assert get_record_values((cdm531.Location, row), table) == row
+    with pytest.raises(ValueError, match='Expected'):
+        get_record_values((cdm531.Location, (1, 'Utrecht')), table)
+
+
+def test_iter_records_mapping():
+    records = {cdm531.Location: [{'location_id': 1}, {'location_id': 2}]}
+    assert list(iter_records(records)) == [(cdm531.Location, {'location_id': 1}),
+                                           (cdm531.Location, {'location_id': 2})]
+    groups = group_records_by_table(records)
+    assert len(groups[cdm531.Location.__table__]) == 2
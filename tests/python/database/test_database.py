@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import create_engine
+from src.delphyne import Wrapper
+from src.delphyne.model.etl_stats import open_transformation
+
+from tests.python.conftest import docker_not_available
+
+pytestmark = pytest.mark.skipif(condition=docker_not_available(),
+                                reason='Docker daemon is not running')
+
+
+def _get_index_names(wrapper: Wrapper, table_name: str):
+    table = wrapper.db.reflected_metadata.tables[table_name]
+    return {index.name for index in table.indexes}
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_reflected_metadata_cached(cdm531_wrapper_with_tables_created: Wrapper):
+    db = cdm531_wrapper_with_tables_created.db
+    metadata = db.reflected_metadata
+    assert db.reflected_metadata is metadata
+    assert 'cdm.person' in metadata.tables
+
+    # Only model tables are reflected
+    with db.engine.connect() as conn:
+        conn.execute('CREATE TABLE cdm.not_in_model (x INT)')
+    assert db.reflected_metadata is not metadata
+    assert 'cdm.not_in_model' not in db.reflected_metadata.tables
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_reflected_metadata_invalidated_on_ddl(cdm531_wrapper_with_tables_created: Wrapper):
+    wrapper = cdm531_wrapper_with_tables_created
+    assert 'ix_test' not in _get_index_names(wrapper, 'cdm.person')
+    with wrapper.db.engine.connect() as conn:
+        conn.execute('CREATE INDEX ix_test ON cdm.person (year_of_birth)')
+    assert 'ix_test' in _get_index_names(wrapper, 'cdm.person')
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_refresh_reflected_table(cdm531_wrapper_with_tables_created: Wrapper, test_db_uri: str):
+    wrapper = cdm531_wrapper_with_tables_created
+    metadata = wrapper.db.reflected_metadata
+
+    # DDL by other means is not noticed
+    other_engine = create_engine(test_db_uri)
+    with other_engine.connect() as conn:
+        conn.execute('CREATE INDEX ix_test ON cdm.person (year_of_birth)')
+    other_engine.dispose()
+    assert 'ix_test' not in _get_index_names(wrapper, 'cdm.person')
+
+    wrapper.db.refresh_reflected_table('person')
+    assert 'ix_test' in _get_index_names(wrapper, 'cdm.person')
+    assert wrapper.db.reflected_metadata.tables.keys() == metadata.tables.keys()
+    death = wrapper.db.reflected_metadata.tables['cdm.death']
+    person = wrapper.db.reflected_metadata.tables['cdm.person']
+    assert death.c.person_id.references(person.c.person_id)
+
+    with pytest.raises(KeyError):
+        wrapper.db.refresh_reflected_table('not_in_model')
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_set_tables_unlogged_cycle(cdm531_wrapper_with_tables_created: Wrapper):
+    db = cdm531_wrapper_with_tables_created.db
+    tables = db.base.metadata.tables
+    # Concept references vocabulary and domain, which both reference it
+    cycle = [tables[f'vocabulary_schema.{name}']
+             for name in ['concept', 'vocabulary', 'domain', 'concept_synonym']]
+    with pytest.raises(ValueError, match=r"\['concept', 'domain', 'vocabulary'\]"):
+        db.set_tables_unlogged(cycle, max_workers=2)
+    assert db.get_unlogged_tables() == set()
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_statements_counted_per_engine(cdm531_wrapper_with_tables_created: Wrapper,
+                                       test_db_uri: str):
+    db = cdm531_wrapper_with_tables_created.db
+    other_engine = create_engine(test_db_uri)
+    db.invalidate_reflected_metadata()
+    with open_transformation('count_statements') as transformation:
+        with db.engine.connect() as conn:
+            conn.execute('SELECT 1')
+        # Statements of other engines and reflection are not counted
+        with other_engine.connect() as conn:
+            conn.execute('SELECT 1')
+        assert 'cdm.person' in db.reflected_metadata.tables
+    assert transformation.n_statements == 1
+    other_engine.dispose()
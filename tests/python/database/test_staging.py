@@ -0,0 +1,109 @@
+from copy import deepcopy
+from typing import Dict
+
+import pytest
+from sqlalchemy import text
+from src.delphyne import Wrapper
+from src.delphyne.config.models import MainConfig
+
+from tests.python.cdm import cdm531
+from tests.python.conftest import docker_not_available
+
+pytestmark = pytest.mark.skipif(condition=docker_not_available(),
+                                reason='Docker daemon is not running')
+
+
+def _create_wrapper(config: Dict, staging_schema: str) -> Wrapper:
+    config = deepcopy(config)
+    config['schema_translate_map']['staging_schema'] = staging_schema
+    return Wrapper(MainConfig(**config), cdm531)
+
+
+@pytest.fixture
+def wrapper_with_staging(default_run_config: Dict) -> Wrapper:
+    wrapper = _create_wrapper(default_run_config, 'staging')
+    wrapper.create_schemas()
+    wrapper.create_cdm()
+    return wrapper
+
+
+def _get_schemas(wrapper: Wrapper):
+    with wrapper.db.engine.connect() as conn:
+        return {row[0] for row in conn.execute(text('SELECT nspname FROM pg_namespace'))}
+
+
+def _get_reltuples(wrapper: Wrapper, table_name: str) -> float:
+    query = text("SELECT reltuples FROM pg_class WHERE oid = CAST(:name AS regclass)")
+    with wrapper.db.engine.connect() as conn:
+        return conn.execute(query, name=table_name).scalar()
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_staging_scope(wrapper_with_staging: Wrapper):
+    staging_manager = wrapper_with_staging.db.staging_manager
+    assert staging_manager.schema == 'staging'
+
+    with staging_manager.staging_scope():
+        assert 'staging' in _get_schemas(wrapper_with_staging)
+        table_name = staging_manager.create_table('lookup', 'SELECT generate_series(1, 5) AS x')
+        assert table_name == 'staging.lookup'
+        assert _get_reltuples(wrapper_with_staging, table_name) == 5
+
+        # Tables can also be created with raw SQL via @staging_schema
+        wrapper_with_staging.execute_sql_query(
+            'CREATE UNLOGGED TABLE @staging_schema.extract AS SELECT 1 AS x',
+            query_name='create_extract')
+        staging_manager.analyze_tables(['extract'])
+        assert _get_reltuples(wrapper_with_staging, 'staging.extract') == 1
+        assert set(staging_manager.get_table_names()) == {'lookup', 'extract'}
+
+    assert 'staging' not in _get_schemas(wrapper_with_staging)
+    assert 'cdm' in _get_schemas(wrapper_with_staging)
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_staging_scope_dropped_on_error(wrapper_with_staging: Wrapper):
+    staging_manager = wrapper_with_staging.db.staging_manager
+    with pytest.raises(ZeroDivisionError):
+        with staging_manager.staging_scope():
+            staging_manager.create_table('lookup', 'SELECT 1 AS x')
+            1 / 0
+    assert 'staging' not in _get_schemas(wrapper_with_staging)
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_staging_schema_not_configured(wrapper_cdm531: Wrapper):
+    with pytest.raises(KeyError):
+        wrapper_cdm531.db.staging_manager.schema
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_staging_scope_refuses_unknown_schema(wrapper_with_staging: Wrapper):
+    # A schema that was not created by the staging manager is kept
+    with wrapper_with_staging.db.engine.connect() as conn:
+        conn.execute('CREATE SCHEMA staging; CREATE TABLE staging.user_table (x INT)')
+    staging_manager = wrapper_with_staging.db.staging_manager
+    with pytest.raises(ValueError, match='Refusing to drop schema "staging"'):
+        with staging_manager.staging_scope():
+            pass
+    with pytest.raises(ValueError):
+        staging_manager.drop_schema()
+    assert staging_manager.get_table_names() == ['user_table']
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_staging_scope_recreates_own_schema(wrapper_with_staging: Wrapper):
+    staging_manager = wrapper_with_staging.db.staging_manager
+    staging_manager.create_schema()
+    staging_manager.create_table('leftover', 'SELECT 1 AS x')
+    with staging_manager.staging_scope():
+        assert staging_manager.get_table_names() == []
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_staging_schema_reserved(default_run_config: Dict):
+    wrapper = _create_wrapper(default_run_config, 'public')
+    with pytest.raises(ValueError, match='cannot be used as staging schema'):
+        with wrapper.db.staging_manager.staging_scope():
+            pass
+    assert 'public' in _get_schemas(wrapper)
@@ -15,5 +15,5 @@ def get_etltransformation(name: str, **kwargs) -> EtlTransformation:
         'deletion_counts': Counter(),
     }
     # Replace default values with those provided, if any
-    final_params = {k: v if k not in kwargs else kwargs[k] for k, v in default_params.items()}
+    final_params = {**default_params, **kwargs}
     return EtlTransformation(**final_params)
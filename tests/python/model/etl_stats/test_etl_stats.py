@@ -2,7 +2,7 @@ from collections import Counter
 from datetime import datetime, timedelta
 
 import pytest
-from src.delphyne.model.etl_stats import EtlStats, EtlSource, EtlTransformation
+from src.delphyne.model.etl_stats import EtlStatement, EtlStats, EtlSource, EtlTransformation
 
 from tests.python.model.etl_stats.conftest import get_etltransformation
 
@@ -47,9 +47,25 @@ def test_etltransformation_to_dict(etl_transformation: EtlTransformation):
         'insertion_counts': 'table1:25, table2:50',
         'update_counts': 'table1:10',
         'deletion_counts': None,
+        'batch_size': None,
+        'phase_durations': None,
+        'n_statements': 0,
+        'rows_per_second': 85 / 7200,
     }
 
 
+def test_etltransformation_time_phase():
+    transformation = get_etltransformation(name='timed')
+    with transformation.time_phase('flush'):
+        pass
+    with transformation.time_phase('flush'):
+        pass
+    assert list(transformation.phase_durations) == ['flush']
+    transformation.phase_durations['commit'] = 1.23456
+    assert transformation.to_dict()['phase_durations'] \
+        == f"flush:{transformation.phase_durations['flush']:.3f}, commit:1.235"
+
+
 def test_transformation_is_vocab_only():
     t1 = get_etltransformation(name='vocab_only', insertion_counts=Counter({'concept': 950}))
     assert t1.is_vocab_only
@@ -89,3 +105,16 @@ def test_total_insertions(etl_stats: EtlStats):
 
 def test_total_duration(etl_stats: EtlStats):
     assert etl_stats.get_total_duration(etl_stats.transformations) == timedelta(hours=4)
+
+
+def test_statements_df(etl_stats: EtlStats):
+    assert etl_stats.statements_df.empty
+    etl_stats.add_transformation(get_etltransformation(
+        name='T3', statements=[EtlStatement(1, 'INSERT', 'table3', 5, 0.5),
+                               EtlStatement(2, 'DELETE', 'table3', 1, 1.25)]))
+    statements_df = etl_stats.statements_df
+    assert statements_df.columns.tolist() == ['transformation', 'index', 'chunk', 'command',
+                                              'target_table', 'row_count', 'duration']
+    assert statements_df['transformation'].tolist() == ['T3', 'T3']
+    assert statements_df['duration'].tolist() == [0.5, 1.25]
+    assert 'statements' not in etl_stats.transformations_df.columns
@@ -2,7 +2,8 @@ import logging
 from collections import Counter
 
 import pytest
-from src.delphyne.model.etl_stats import EtlStats, EtlTransformation, EtlStatsReporter
+from src.delphyne.model.etl_stats import (EtlPlanNode, EtlStatement, EtlStats,
+                                          EtlTransformation, EtlStatsReporter)
 
 from tests.python.model.etl_stats.conftest import get_etltransformation
 
@@ -51,3 +52,42 @@ def test_with_records_successful(reporter_summary_output: str):
                          indirect=True)
 def test_with_records_unsuccessful(reporter_summary_output: str):
     assert 'with_records_unsuccessful' in reporter_summary_output
+
+
+@pytest.mark.parametrize('reporter_summary_output',
+                         [get_etltransformation(name='with_phases',
+                                                insertion_counts=Counter({'person': 7200}),
+                                                phase_durations=Counter({'generate': 1.5}),
+                                                n_statements=3)],
+                         indirect=True)
+def test_with_phases(reporter_summary_output: str):
+    assert 'Phases: generate 1.50s (3 statements, 2 rows/s)' in reporter_summary_output
+
+
+@pytest.mark.parametrize('reporter_summary_output',
+                         [get_etltransformation(
+                             name='with_statements',
+                             insertion_counts=Counter({'person': 7}),
+                             statements=[EtlStatement(1, 'CREATE', '?', -1, 0.1),
+                                         EtlStatement(2, 'INSERT', 'person', 7, 2.5),
+                                         EtlStatement(3, 'ANALYZE', '?', -1, 0.0),
+                                         EtlStatement(4, 'UPDATE', 'person', 0, 0.4)])],
+                         indirect=True)
+def test_with_statements(reporter_summary_output: str):
+    assert 'Slowest statements: 2: INSERT person (7 rows, 2.50s), ' \
+           '4: UPDATE person (0 rows, 0.40s), 1: CREATE (0.10s)' \
+           in reporter_summary_output
+
+
+@pytest.mark.parametrize('reporter_summary_output',
+                         [get_etltransformation(
+                             name='with_plan_nodes',
+                             insertion_counts=Counter({'person': 7}),
+                             plan_nodes=[EtlPlanNode(2, 'Seq Scan', 'stem_table', 12.5, 7, 9),
+                                         EtlPlanNode(2, 'Sort', None, 40, 7, 7)])],
+                         indirect=True)
+def test_with_plan_nodes(reporter_summary_output: str):
+    assert 'Slowest query plan nodes (2):\n' \
+           '\twith_plan_nodes: Sort in statement 2: 40.0 ms (7 rows, 7 estimated)\n' \
+           '\twith_plan_nodes: Seq Scan on stem_table in statement 2: 12.5 ms ' \
+           '(7 rows, 9 estimated)' in reporter_summary_output
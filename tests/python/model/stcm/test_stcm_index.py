@@ -0,0 +1,95 @@
+import logging
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from src.delphyne import Wrapper
+from src.delphyne.model.orm_wrapper import OrmWrapper
+
+from tests.python.cdm import cdm600
+from tests.python.conftest import docker_not_available
+from tests.python.model.stcm.load_vocab_data import (load_minimal_vocabulary,
+                                                     load_custom_vocab_records)
+from tests.python.model.stcm.test_stcm_loader import mock_stcm_paths
+
+pytestmark = pytest.mark.skipif(condition=docker_not_available(),
+                                reason='Docker daemon is not running')
+
+
+@pytest.fixture(scope='session')
+def base_stcm_dir(test_data_dir: Path) -> Path:
+    return test_data_dir / 'stcm'
+
+
+@pytest.mark.usefixtures("test_db")
+@pytest.fixture(scope='function')
+def cdm600_wrapper_with_vocabs(cdm600_wrapper_with_tables_created: Wrapper) -> Wrapper:
+    """cdm600 wrapper with the vocabularies required for the STCMs."""
+    wrapper = cdm600_wrapper_with_tables_created
+    wrapper.db.constraint_manager.drop_all_constraints()
+    load_minimal_vocabulary(wrapper=wrapper)
+    load_custom_vocab_records(wrapper=wrapper, vocab_ids=['MY_VOCAB1', 'MY_VOCAB2'])
+    wrapper.db.constraint_manager.add_all_constraints()
+    return wrapper
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_stcm_index_lookup(cdm600_wrapper_with_vocabs: Wrapper, base_stcm_dir: Path):
+    wrapper = cdm600_wrapper_with_vocabs
+    with mock_stcm_paths(base_stcm_dir, 'stcm2'):
+        wrapper.vocab_manager.stcm.load()
+
+    index = wrapper.stcm_index
+    assert index.lookup('MY_VOCAB1', 'code1') == 1
+    assert index.lookup('MY_VOCAB1', 'unknown') == 0
+    assert index.lookup('MY_VOCAB1', 'unknown', default=-1) == -1
+    assert wrapper.lookup_stcm('MY_VOCAB2', 'code2') == 1
+
+    codes = pd.Series(['code1', 'Munster cheese left outside the fridge', 'x'],
+                      index=[10, 11, 12])
+    mapped = index.map('MY_VOCAB1', codes)
+    assert mapped.tolist() == [1, 1, 0]
+    assert mapped.index.tolist() == [10, 11, 12]
+    assert index.map('MY_VOCAB2', ['code2', 'code1']) == [1, 0]
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_stcm_index_invalidation(cdm600_wrapper_with_vocabs: Wrapper, base_stcm_dir: Path,
+                                 caplog):
+    wrapper = cdm600_wrapper_with_vocabs
+    index = wrapper.stcm_index
+
+    with mock_stcm_paths(base_stcm_dir, 'stcm1'):
+        wrapper.vocab_manager.stcm.load()
+    index.load(['MY_VOCAB1', 'MY_VOCAB2'])
+    assert index.lookup('MY_VOCAB1', 'code1') == 1
+    assert index.lookup('MY_VOCAB2', 'code2') == 0
+
+    # New MY_VOCAB2 version is picked up, unchanged MY_VOCAB1 is kept
+    with mock_stcm_paths(base_stcm_dir, 'stcm2'), caplog.at_level(logging.INFO):
+        wrapper.vocab_manager.stcm.load()
+        caplog.clear()
+        assert index.lookup('MY_VOCAB2', 'code2') == 1
+        assert index.lookup('MY_VOCAB1', 'code1') == 1
+    assert "STCM versions changed for ['MY_VOCAB2']" in caplog.text
+    assert "for ['MY_VOCAB1']" not in caplog.text
+
+    wrapper.vocab_manager.stcm.delete(vocab_ids={'MY_VOCAB1'})
+    assert index.lookup('MY_VOCAB1', 'code1') == 0
+    assert index.lookup('MY_VOCAB2', 'code2') == 1
+
+
+class MinimalOrmWrapper(OrmWrapper):
+    cdm = cdm600
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_stcm_index_orm_wrapper_subclass(cdm600_wrapper_with_vocabs: Wrapper,
+                                         base_stcm_dir: Path):
+    wrapper = cdm600_wrapper_with_vocabs
+    with mock_stcm_paths(base_stcm_dir, 'stcm2'):
+        wrapper.vocab_manager.stcm.load()
+
+    orm_wrapper = MinimalOrmWrapper(database=wrapper.db)
+    assert orm_wrapper.lookup_stcm('MY_VOCAB1', 'code1') == 1
+    assert orm_wrapper.lookup_stcm('MY_VOCAB1', 'unknown') == 0
@@ -0,0 +1,50 @@
+import pickle
+
+import pytest
+from src.delphyne.model import batch_size as batch_size_module
+from src.delphyne.model.batch_size import AdaptiveBatchSize
+
+
+def test_adaptive_batch_size_scales_towards_target_latency():
+    size = AdaptiveBatchSize(initial_size=1000, target_latency=2.0, max_growth=4.0)
+    size.record(1000, latency=1.0)
+    assert size.size == 2000
+    size.record(2000, latency=8.0)
+    assert size.size == 500
+    # Change per batch is limited by max_growth
+    size.record(500, latency=0.01)
+    assert size.size == 2000
+    assert [m.batch_size for m in size.measurements] == [1000, 2000, 500]
+    assert size.measurements[0].rows_per_second == 1000
+
+
+def test_adaptive_batch_size_bounds():
+    size = AdaptiveBatchSize(initial_size=1000, target_latency=1.0, min_size=800,
+                             max_size=1500)
+    size.record(1000, latency=10)
+    assert size.size == 800
+    size.record(800, latency=0.1)
+    assert size.size == 1500
+
+
+def test_adaptive_batch_size_memory_ceiling(monkeypatch):
+    monkeypatch.setattr(batch_size_module, 'get_rss_mb', lambda: 2048.0)
+    size = AdaptiveBatchSize(initial_size=1000, target_latency=10.0, max_rss_mb=1024)
+    size.record(1000, latency=1.0)
+    assert size.size == 500
+    assert size.measurements[0].rss_mb == 2048.0
+
+
+def test_adaptive_batch_size_invalid_arguments():
+    with pytest.raises(ValueError):
+        AdaptiveBatchSize(min_size=100, max_size=10)
+    with pytest.raises(ValueError):
+        AdaptiveBatchSize(max_growth=1)
+
+
+def test_adaptive_batch_size_pickle():
+    size = AdaptiveBatchSize(initial_size=500)
+    size.record(500, latency=1.0)
+    copied = pickle.loads(pickle.dumps(size))
+    assert copied.size == size.size
+    copied.record(copied.size, latency=1.0)
@@ -0,0 +1,319 @@
+import asyncio
+import datetime
+import json
+from decimal import Decimal
+from typing import Dict, List
+
+import pytest
+from src.delphyne import Wrapper
+from src.delphyne.model.batch_size import AdaptiveBatchSize
+from src.delphyne.model.etl_stats import etl_stats
+from src.delphyne.model.sharding import Shard
+
+from tests.python.cdm import cdm531
+from tests.python.conftest import docker_not_available
+
+pytestmark = pytest.mark.skipif(condition=docker_not_available(),
+                                reason='Docker daemon is not running')
+
+
+def get_person_and_measurements(wrapper: Wrapper) -> List:
+    return [
+        cdm531.Person(person_id=1, gender_concept_id=8507, year_of_birth=1970,
+                      race_concept_id=0, ethnicity_concept_id=0,
+                      person_source_value='tab\there'),
+        (cdm531.Measurement, {'person_id': 1, 'measurement_concept_id': 3,
+                              'measurement_date': datetime.date(2020, 2, 29),
+                              'measurement_type_concept_id': 0,
+                              'value_as_number': Decimal('7.25')}),
+        (cdm531.Measurement, {'person_id': 1, 'measurement_concept_id': 4,
+                              'measurement_date': datetime.date(2020, 3, 1),
+                              'measurement_type_concept_id': 0,
+                              'value_as_number': None}),
+    ]
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_transformation_copy_mode(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+    wrapper.execute_transformation(get_person_and_measurements, mode='copy')
+
+    transformation = etl_stats.transformations[-1]
+    assert transformation.query_success
+    assert transformation.insertion_counts == {'cdm.person': 1, 'cdm.measurement': 2}
+
+    with wrapper.db.session_scope() as session:
+        person = session.query(cdm531.Person).one()
+        assert person.person_source_value == 'tab\there'
+        measurements = session.query(cdm531.Measurement) \
+            .order_by(cdm531.Measurement.measurement_concept_id).all()
+        assert [m.measurement_date for m in measurements] == [
+            datetime.date(2020, 2, 29), datetime.date(2020, 3, 1)]
+        assert [m.value_as_number for m in measurements] == [Decimal('7.25'), None]
+        # Serial primary keys are left to the database
+        assert all(m.measurement_id is not None for m in measurements)
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_transformation_phase_durations(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+
+    def get_persons(wrapper: Wrapper) -> List:
+        return [cdm531.Person(person_id=person_id, gender_concept_id=0, year_of_birth=1970,
+                              race_concept_id=0, ethnicity_concept_id=0)
+                for person_id in range(1, 4)]
+
+    wrapper.execute_transformation(get_persons)
+    transformation = etl_stats.transformations[-1]
+    assert set(transformation.phase_durations) == {'generate', 'save', 'tracking', 'flush',
+                                                   'commit'}
+    assert transformation.n_statements == 1
+    assert transformation.rows_per_second > 0
+
+    wrapper.execute_sql_query('DELETE FROM @cdm_schema.person WHERE person_id > 0',
+                              'delete_persons')
+    transformation = etl_stats.transformations[-1]
+    assert set(transformation.phase_durations) == {'execute'}
+    assert transformation.n_statements == 1
+    assert transformation.deletion_counts == {'cdm.person': 3}
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_batch_transformation_copy_mode(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+
+    def person_generator(wrapper: Wrapper):
+        for person_id in range(1, 6):
+            yield cdm531.Person(person_id=person_id, gender_concept_id=0,
+                                year_of_birth=1970, race_concept_id=0,
+                                ethnicity_concept_id=0)
+
+    wrapper.execute_batch_transformation(person_generator, mode='copy', batch_size=2)
+    batch_transformations = etl_stats.transformations[-3:]
+    assert [t.insertion_counts['cdm.person'] for t in batch_transformations] == [2, 2, 1]
+
+
+def get_persons_by_table(wrapper: Wrapper) -> Dict:
+    person_columns = [c.name for c in cdm531.Person.__table__.columns]
+    person_row = dict.fromkeys(person_columns)
+    person_row.update(person_id=2, gender_concept_id=8532, year_of_birth=1980,
+                      race_concept_id=0, ethnicity_concept_id=0)
+    return {
+        cdm531.Person: [
+            {'person_id': 1, 'gender_concept_id': 8507, 'year_of_birth': 1970,
+             'race_concept_id': 0, 'ethnicity_concept_id': 0},
+            tuple(person_row[c] for c in person_columns),
+        ],
+        cdm531.Measurement: [
+            {'person_id': 1, 'measurement_concept_id': 3,
+             'measurement_date': datetime.date(2020, 2, 29),
+             'measurement_type_concept_id': 0},
+        ],
+    }
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_transformation_core_mode(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+    wrapper.execute_transformation(get_persons_by_table, mode='core')
+
+    transformation = etl_stats.transformations[-1]
+    assert transformation.query_success
+    assert transformation.insertion_counts == {'cdm.person': 2, 'cdm.measurement': 1}
+
+    with wrapper.db.session_scope() as session:
+        persons = session.query(cdm531.Person).order_by(cdm531.Person.person_id).all()
+        assert [p.gender_concept_id for p in persons] == [8507, 8532]
+        measurement = session.query(cdm531.Measurement).one()
+        assert measurement.measurement_id is not None
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_batch_transformation_core_mode(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+
+    def person_generator(wrapper: Wrapper):
+        for person_id in range(1, 6):
+            yield cdm531.Person, {'person_id': person_id, 'gender_concept_id': 0,
+                                  'year_of_birth': 1970, 'race_concept_id': 0,
+                                  'ethnicity_concept_id': 0}
+
+    wrapper.execute_batch_transformation(person_generator, mode='core', batch_size=2)
+    batch_transformations = etl_stats.transformations[-3:]
+    assert [t.insertion_counts['cdm.person'] for t in batch_transformations] == [2, 2, 1]
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_batch_transformation_adaptive_batch_size(
+        cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+
+    def person_generator(wrapper: Wrapper):
+        for person_id in range(1, 101):
+            yield cdm531.Person(person_id=person_id, gender_concept_id=0,
+                                year_of_birth=1970, race_concept_id=0,
+                                ethnicity_concept_id=0)
+
+    # Every batch is faster than the target, so the size keeps growing
+    batch_size = AdaptiveBatchSize(initial_size=5, target_latency=60, min_size=5)
+    wrapper.execute_batch_transformation(person_generator, batch_size=batch_size)
+
+    batches = [t for t in etl_stats.transformations if t.name.startswith('person_generator')]
+    assert [t.batch_size for t in batches] == [5, 10, 20, 40, 25]
+    assert [m.batch_size for m in batch_size.measurements] == [5, 10, 20, 40, 25]
+    assert sum(t.insertion_counts['cdm.person'] for t in batches) == 100
+
+
+@pytest.mark.parametrize('mode', ['orm', 'copy'])
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_batch_transformation_recover_failed_batches(
+        cdm531_wrapper_no_constraints: Wrapper, mode: str, tmp_path, monkeypatch):
+    wrapper = cdm531_wrapper_no_constraints
+    monkeypatch.chdir(tmp_path)
+
+    def person_generator(wrapper: Wrapper):
+        for person_id in range(1, 11):
+            # Missing year_of_birth violates a not null constraint
+            year_of_birth = None if person_id in (3, 8) else 1970
+            yield cdm531.Person(person_id=person_id, gender_concept_id=0,
+                                year_of_birth=year_of_birth, race_concept_id=0,
+                                ethnicity_concept_id=0)
+
+    wrapper.execute_batch_transformation(person_generator, batch_size=5, mode=mode,
+                                         recover_failed_batches=True)
+
+    transformations = {t.name: t for t in etl_stats.transformations
+                       if t.name.startswith('person_generator')}
+    assert not transformations['person_generator1'].query_success
+    assert transformations['person_generator1_recovery'].query_success
+    assert transformations['person_generator1_recovery'].insertion_counts == {'cdm.person': 4}
+    assert transformations['person_generator2_recovery'].insertion_counts == {'cdm.person': 4}
+
+    with wrapper.db.session_scope() as session:
+        person_ids = [p.person_id for p in session.query(cdm531.Person)
+                      .order_by(cdm531.Person.person_id)]
+    assert person_ids == [1, 2, 4, 5, 6, 7, 9, 10]
+
+    quarantine_files = list((tmp_path / 'logs').glob('*_person_generator_quarantine.jsonl'))
+    assert len(quarantine_files) == 1
+    lines = [json.loads(line) for line in quarantine_files[0].read_text().splitlines()]
+    assert [line['record']['person_id'] for line in lines] == [3, 8]
+    assert [line['batch'] for line in lines] == ['person_generator1', 'person_generator2']
+    assert all(line['table'] == 'person' for line in lines)
+    assert all('year_of_birth' in line['error'] for line in lines)
+
+
+async def get_persons_async(wrapper: Wrapper) -> List:
+    await asyncio.sleep(0)
+    return [(cdm531.Person, {'person_id': person_id, 'gender_concept_id': 8507,
+                             'year_of_birth': 1970, 'race_concept_id': 0,
+                             'ethnicity_concept_id': 0, 'person_source_value': None})
+            for person_id in range(1, 4)]
+
+
+def get_invalid_persons(wrapper: Wrapper) -> List:
+    # Missing year_of_birth violates a not null constraint
+    return [(cdm531.Person, {'person_id': 10, 'gender_concept_id': 8507})]
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_transformations_async(cdm531_wrapper_no_constraints: Wrapper):
+    pytest.importorskip('asyncpg')
+    wrapper = cdm531_wrapper_no_constraints
+
+    async def run_concurrently():
+        try:
+            with etl_stats.capture_transformations() as transformations:
+                await asyncio.gather(
+                    wrapper.execute_transformation_async(get_persons_async),
+                    wrapper.execute_transformation_async(get_invalid_persons),
+                )
+            return transformations
+        finally:
+            await wrapper.db.close_async_pool()
+
+    transformations = {t.name: t for t in asyncio.run(run_concurrently())}
+    assert set(transformations) == {'get_persons_async', 'get_invalid_persons'}
+    assert transformations['get_persons_async'].query_success
+    assert transformations['get_persons_async'].insertion_counts == {'cdm.person': 3}
+    assert not transformations['get_invalid_persons'].query_success
+
+    with wrapper.db.session_scope() as session:
+        assert session.query(cdm531.Person).count() == 3
+
+
+def test_invalid_insert_mode():
+    with pytest.raises(ValueError, match='Invalid insert mode'):
+        Wrapper._get_insert_mode(bulk=False, mode='foo')
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_batch_transformation_pipelined(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+
+    def person_generator(wrapper: Wrapper):
+        for person_id in range(1, 11):
+            # Missing year_of_birth violates a not null constraint
+            year_of_birth = None if person_id == 5 else 1970
+            yield cdm531.Person(person_id=person_id, gender_concept_id=0,
+                                year_of_birth=year_of_birth, race_concept_id=0,
+                                ethnicity_concept_id=0)
+
+    wrapper.execute_batch_transformation(person_generator, batch_size=2, writer_threads=2,
+                                         max_pending_batches=1)
+
+    batches = {t.name: t for t in etl_stats.transformations
+               if t.name.startswith('person_generator')}
+    assert len(batches) == 5
+    assert [name for name, t in batches.items() if not t.query_success] == ['person_generator3']
+    with wrapper.db.session_scope() as session:
+        assert session.query(cdm531.Person).count() == 8
+
+
+@pytest.mark.usefixtures("container", "test_db")
+@pytest.mark.parametrize('writer_threads,max_pending_batches', [(-1, 2), (2, 0)])
+def test_execute_batch_transformation_invalid_pipeline(cdm531_wrapper_no_constraints: Wrapper,
+                                                       writer_threads: int,
+                                                       max_pending_batches: int):
+    def person_generator(wrapper: Wrapper):
+        yield cdm531.Person(person_id=1, gender_concept_id=0, year_of_birth=1970,
+                            race_concept_id=0, ethnicity_concept_id=0)
+
+    with pytest.raises(ValueError):
+        cdm531_wrapper_no_constraints.execute_batch_transformation(
+            person_generator, writer_threads=writer_threads,
+            max_pending_batches=max_pending_batches)
+
+
+def sharded_person_generator(wrapper: Wrapper, shard: Shard, lookups: Dict):
+    for person_id in range(1, 21):
+        if shard.contains(person_id):
+            yield cdm531.Person(person_id=person_id, year_of_birth=1970, race_concept_id=0,
+                                ethnicity_concept_id=0,
+                                gender_concept_id=lookups['gender'][person_id % 2])
+
+
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_sharded_batch_transformation(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+    wrapper.execute_sharded_batch_transformation(sharded_person_generator, n_shards=3,
+                                                 max_workers=2, batch_size=5, mode='copy',
+                                                 lookups={'gender': {0: 8507, 1: 8532}})
+
+    shard_transformations = [t for t in etl_stats.transformations
+                             if t.name.startswith('sharded_person_generator_shard')]
+    assert {t.name.rsplit('_', 1)[0] for t in shard_transformations} == \
+        {'sharded_person_generator_shard0', 'sharded_person_generator_shard1',
+         'sharded_person_generator_shard2'}
+    assert sum(t.insertion_counts['cdm.person'] for t in shard_transformations) == 20
+    with wrapper.db.session_scope() as session:
+        persons = session.query(cdm531.Person).all()
+        assert sorted(p.person_id for p in persons) == list(range(1, 21))
+        assert {p.gender_concept_id for p in persons} == {8507, 8532}
+
+
+def test_shard_assignment_is_stable():
+    shards = [Shard(index=i, n_shards=4) for i in range(4)]
+    for key in ['P001', 'P002', 12345]:
+        assert sum(shard.contains(key) for shard in shards) == 1
+    assert Shard(1, 4).contains('P001') == Shard(1, 4).contains('P001')
@@ -0,0 +1,19 @@
+from concurrent.futures import Future
+from functools import partial
+
+from src.delphyne.model.etl_stats import EtlTransformation, etl_stats
+from src.delphyne.model.process_pool import _add_worker_transformations
+
+
+def test_add_worker_transformations_done_future():
+    etl_stats.reset()
+    worker_transformations = [EtlTransformation(name='t1'), EtlTransformation(name='t2')]
+    future = Future()
+    future.set_result(worker_transformations)
+
+    with etl_stats.capture_transformations() as captured:
+        # The future is already done, so the callback runs right away,
+        # in this thread
+        future.add_done_callback(partial(_add_worker_transformations, capture=captured))
+        assert captured == worker_transformations
+    assert etl_stats.transformations == worker_transformations
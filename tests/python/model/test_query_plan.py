@@ -0,0 +1,86 @@
+import pytest
+from src.delphyne.model.query_plan import (get_plan_command, get_plan_row_count,
+                                           get_slowest_plan_nodes, is_explainable,
+                                           parse_explain_output)
+
+EXPLAIN_OUTPUT = """[{
+    "Plan": {
+        "Node Type": "ModifyTable", "Operation": "Insert", "Relation Name": "person",
+        "Plan Rows": 100, "Actual Total Time": 30.0, "Actual Rows": 0, "Actual Loops": 1,
+        "Plans": [{
+            "Node Type": "Hash Join", "Parent Relationship": "Outer", "Plan Rows": 100,
+            "Actual Total Time": 20.0, "Actual Rows": 50, "Actual Loops": 1,
+            "Plans": [
+                {"Node Type": "Seq Scan", "Parent Relationship": "Outer",
+                 "Relation Name": "stem_table", "Plan Rows": 1000,
+                 "Actual Total Time": 2.5, "Actual Rows": 200, "Actual Loops": 4},
+                {"Node Type": "Hash", "Parent Relationship": "Inner", "Plan Rows": 10,
+                 "Actual Total Time": 1.0, "Actual Rows": 10, "Actual Loops": 1}
+            ]
+        }]
+    },
+    "Execution Time": 31.0
+}]"""
+
+
+# PostgreSQL 13 and earlier label the input of ModifyTable as 'Member'
+EXPLAIN_OUTPUT_PG13 = """[{
+    "Plan": {
+        "Node Type": "ModifyTable", "Operation": "Update", "Relation Name": "person",
+        "Plan Rows": 20, "Actual Total Time": 5.0, "Actual Rows": 0, "Actual Loops": 1,
+        "Plans": [
+            {"Node Type": "Result", "Parent Relationship": "InitPlan",
+             "Subplan Name": "InitPlan 1 (returns $0)", "Plan Rows": 1,
+             "Actual Total Time": 0.1, "Actual Rows": 1, "Actual Loops": 1},
+            {"Node Type": "Seq Scan", "Parent Relationship": "Member",
+             "Relation Name": "person", "Plan Rows": 20,
+             "Actual Total Time": 2.0, "Actual Rows": 12, "Actual Loops": 1}
+        ]
+    },
+    "Execution Time": 5.5
+}]"""
+
+
+def test_parse_plan():
+    plan = parse_explain_output(EXPLAIN_OUTPUT)
+    assert plan['Execution Time'] == 31.0
+    assert parse_explain_output([plan]) is plan
+    assert get_plan_command(plan) == 'INSERT'
+    assert get_plan_row_count(plan) == 50
+    select_plan = {'Plan': plan['Plan']['Plans'][0]}
+    assert get_plan_command(select_plan) == 'SELECT'
+    assert get_plan_row_count(select_plan) == 50
+
+
+def test_parse_plan_member_subplan():
+    plan = parse_explain_output(EXPLAIN_OUTPUT_PG13)
+    assert get_plan_command(plan) == 'UPDATE'
+    assert get_plan_row_count(plan) == 12
+
+
+def test_get_slowest_plan_nodes():
+    plan = parse_explain_output(EXPLAIN_OUTPUT)
+    nodes = get_slowest_plan_nodes(plan, statement_index=3, n=3)
+    # Exclusive times: ModifyTable 30 - 20, Seq Scan 2.5 * 4,
+    # Hash Join 20 - 10 - 1
+    assert [(node.node_type, node.exclusive_time) for node in nodes] == [
+        ('ModifyTable', 10.0), ('Seq Scan', 10.0), ('Hash Join', 9.0)]
+    assert nodes[1].actual_rows == 800
+    assert nodes[1].relation == 'stem_table'
+    assert str(nodes[1]) == 'Seq Scan on stem_table in statement 3: 10.0 ms ' \
+                            '(800 rows, 1000 estimated)'
+
+
+@pytest.mark.parametrize('statement,expected', [
+    ('SELECT 1', True),
+    ('-- comment\ninsert into x select 1', True),
+    ('WITH a AS (SELECT 1) DELETE FROM x', True),
+    ('CREATE TEMP TABLE x AS SELECT 1', True),
+    ('CREATE UNLOGGED TABLE cdm.x AS\nSELECT 1', True),
+    ('CREATE TABLE x (a int)', False),
+    ('CREATE INDEX ON x (a)', False),
+    ('ANALYZE x', False),
+    ('DROP TABLE x', False),
+])
+def test_is_explainable(statement: str, expected: bool):
+    assert is_explainable(statement) is expected
@@ -1,4 +1,17 @@
+import asyncio
+import json
+
+import pytest
+from src.delphyne import Wrapper
+from src.delphyne.model.etl_stats import etl_stats
 from src.delphyne.model.raw_sql_wrapper import RawSqlWrapper
+from src.delphyne.model.sharding import ChunkSpec, KeyRange
+
+from tests.python.cdm import cdm531
+from tests.python.conftest import docker_not_available
+
+requires_docker = pytest.mark.skipif(condition=docker_not_available(),
+                                     reason='Docker daemon is not running')
 
 
 def test_apply_sql_parameters():
@@ -6,3 +19,210 @@ def test_apply_sql_parameters():
     sql_parameters = {'col1': 'menu', 'table1': 'restaurant', 'col2': 'location', 'val1': 'End of the universe'}
     final_query = RawSqlWrapper.apply_sql_parameters(prepared_statement, sql_parameters)
     assert final_query == "SELECT menu FROM restaurant WHERE location = 'End of the universe';"
+
+
+def test_parse_row_count():
+    assert RawSqlWrapper._parse_row_count('INSERT 0 5') == 5
+    assert RawSqlWrapper._parse_row_count('UPDATE 12') == 12
+    assert RawSqlWrapper._parse_row_count('CREATE TABLE') == -1
+    assert RawSqlWrapper._parse_row_count('') == -1
+
+
+def test_apply_sql_parameters_overlapping_names():
+    prepared_statement = 'SELECT * FROM @cdm_schema.person, @cdm.person;'
+    sql_parameters = {'cdm': 'cdm5', 'cdm_schema': 'cdm6'}
+    final_query = RawSqlWrapper.apply_sql_parameters(prepared_statement, sql_parameters)
+    assert final_query == 'SELECT * FROM cdm6.person, cdm5.person;'
+
+
+@requires_docker
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_sql_queries_async(cdm531_wrapper_no_constraints: Wrapper):
+    pytest.importorskip('asyncpg')
+    wrapper = cdm531_wrapper_no_constraints
+    query1 = "INSERT INTO @cdm_schema.location (location_id, city) VALUES (1, 'Utrecht');"
+    query2 = "INSERT INTO @cdm_schema.location (location_id, city) VALUES (2, 'Leiden');"
+
+    async def run_concurrently():
+        try:
+            with etl_stats.capture_transformations() as transformations:
+                await asyncio.gather(
+                    wrapper.execute_sql_query_async(query1, 'insert_utrecht'),
+                    wrapper.execute_sql_query_async(query2, 'insert_leiden'),
+                )
+            return transformations
+        finally:
+            await wrapper.db.close_async_pool()
+
+    transformations = {t.name: t for t in asyncio.run(run_concurrently())}
+    assert set(transformations) == {'insert_utrecht', 'insert_leiden'}
+    assert all(t.query_success for t in transformations.values())
+    assert transformations['insert_leiden'].insertion_counts == {'cdm.location': 1}
+
+    with wrapper.db.session_scope() as session:
+        assert session.query(cdm531.Location).count() == 2
+
+
+MULTI_STATEMENT_QUERY = """
+CREATE TEMP TABLE new_location AS SELECT 1 AS location_id, 'Utrecht;' AS city;
+INSERT INTO @cdm_schema.location (location_id, city) SELECT * FROM new_location;
+-- Statement; with comments
+INSERT INTO @cdm_schema.location (location_id, city) VALUES (2, $$Lei;den$$), (3, 'Delft');
+UPDATE @cdm_schema.location SET city = 'Den Haag' WHERE location_id > 1;
+DELETE FROM @cdm_schema.location WHERE location_id = 3;
+"""
+
+
+@requires_docker
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_sql_query_statements(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+    wrapper.execute_sql_query(MULTI_STATEMENT_QUERY, 'locations')
+    transformation = etl_stats.transformations[-1]
+    assert transformation.query_success
+    assert transformation.insertion_counts == {'cdm.location': 3}
+    assert transformation.update_counts == {'cdm.location': 2}
+    assert transformation.deletion_counts == {'cdm.location': 1}
+    assert transformation.n_statements == 5
+    assert [(s.index, s.command, s.target_table, s.row_count)
+            for s in transformation.statements] == [
+        (1, 'SELECT', '?', 1),
+        (2, 'INSERT', 'cdm.location', 1),
+        (3, 'INSERT', 'cdm.location', 2),
+        (4, 'UPDATE', 'cdm.location', 2),
+        (5, 'DELETE', 'cdm.location', 1),
+    ]
+    assert all(s.duration > 0 for s in transformation.statements)
+    with wrapper.db.session_scope() as session:
+        cities = session.query(cdm531.Location.city) \
+            .order_by(cdm531.Location.location_id).all()
+        assert cities == [('Utrecht;',), ('Den Haag',)]
+
+
+@requires_docker
+@pytest.mark.usefixtures("container", "test_db")
+@pytest.mark.parametrize('single_transaction', [True, False])
+def test_execute_sql_query_failing_statement(cdm531_wrapper_no_constraints: Wrapper,
+                                             single_transaction: bool):
+    wrapper = cdm531_wrapper_no_constraints
+    query = ("INSERT INTO @cdm_schema.location (location_id) VALUES (1);"
+             "INSERT INTO @cdm_schema.unknown_table (location_id) VALUES (2);")
+    wrapper.execute_sql_query(query, 'locations', single_transaction=single_transaction)
+    transformation = etl_stats.transformations[-1]
+    assert not transformation.query_success
+    assert len(transformation.statements) == 1
+    n_expected = 0 if single_transaction else 1
+    assert sum(transformation.insertion_counts.values()) == n_expected
+    with wrapper.db.session_scope() as session:
+        assert session.query(cdm531.Location).count() == n_expected
+
+
+@requires_docker
+@pytest.mark.usefixtures("container", "test_db")
+@pytest.mark.parametrize('profile', [False, True])
+def test_execute_sql_query_statements_async(cdm531_wrapper_no_constraints: Wrapper,
+                                            profile: bool, tmp_path, monkeypatch):
+    pytest.importorskip('asyncpg')
+    monkeypatch.chdir(tmp_path)
+    wrapper = cdm531_wrapper_no_constraints
+
+    async def run():
+        try:
+            await wrapper.execute_sql_query_async(MULTI_STATEMENT_QUERY, 'locations',
+                                                  profile=profile)
+        finally:
+            await wrapper.db.close_async_pool()
+
+    asyncio.run(run())
+    transformation = etl_stats.transformations[-1]
+    assert transformation.query_success
+    assert transformation.insertion_counts == {'cdm.location': 3}
+    assert transformation.update_counts == {'cdm.location': 2}
+    assert transformation.deletion_counts == {'cdm.location': 1}
+    assert [s.command for s in transformation.statements] == \
+        ['SELECT', 'INSERT', 'INSERT', 'UPDATE', 'DELETE']
+    assert bool(transformation.plan_nodes) is profile
+
+
+@requires_docker
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_sql_query_profile(cdm531_wrapper_no_constraints: Wrapper, tmp_path,
+                                   monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    wrapper = cdm531_wrapper_no_constraints
+    wrapper.execute_sql_query(MULTI_STATEMENT_QUERY, 'locations.sql', profile=True)
+    transformation = etl_stats.transformations[-1]
+    assert transformation.query_success
+    assert transformation.insertion_counts == {'cdm.location': 3}
+    assert transformation.update_counts == {'cdm.location': 2}
+    assert transformation.deletion_counts == {'cdm.location': 1}
+    assert [(s.command, s.row_count) for s in transformation.statements] == \
+        [('SELECT', 1), ('INSERT', 1), ('INSERT', 2), ('UPDATE', 2), ('DELETE', 1)]
+    assert {node.statement_index for node in transformation.plan_nodes} == {1, 2, 3, 4, 5}
+    assert 'ModifyTable' in {node.node_type for node in transformation.plan_nodes}
+
+    plan_files = list((tmp_path / 'logs').glob('*_locations_plans.json'))
+    assert len(plan_files) == 1
+    plans = json.loads(plan_files[0].read_text())
+    assert [plan['statement_index'] for plan in plans] == [1, 2, 3, 4, 5]
+    assert 'Execution Time' in plans[0]['plan']
+    with wrapper.db.session_scope() as session:
+        assert session.query(cdm531.Location).count() == 2
+
+
+def _insert_persons_sql(wrapper: Wrapper, n_persons: int) -> None:
+    wrapper.execute_sql_query(
+        f"INSERT INTO @cdm_schema.person (person_id, gender_concept_id, year_of_birth, "
+        f"race_concept_id, ethnicity_concept_id) "
+        f"SELECT i, 0, 1970, 0, 0 FROM generate_series(1, {n_persons}) AS i;",
+        'insert_persons')
+
+
+@requires_docker
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_sql_query_chunked(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+    _insert_persons_sql(wrapper, 10)
+    query = """
+    INSERT INTO @cdm_schema.observation_period (person_id, observation_period_start_date,
+        observation_period_end_date, period_type_concept_id)
+    SELECT person_id, '2020-01-01', '2020-12-31', 0
+    FROM @cdm_schema.person
+    WHERE person_id >= @chunk_start AND person_id < @chunk_end;
+    """
+    chunks = ChunkSpec(table='@cdm_schema.person', column='person_id', chunk_size=3)
+    failed = wrapper.execute_sql_query_chunked(query, 'observation_periods', chunks,
+                                               max_workers=2)
+    assert failed == []
+    transformation = etl_stats.transformations[-1]
+    assert transformation.name == 'observation_periods'
+    assert transformation.query_success
+    assert transformation.insertion_counts == {'cdm.observation_period': 10}
+    assert transformation.n_statements == 4
+    assert sorted((s.chunk, s.row_count) for s in transformation.statements) == [
+        ('[1, 4)', 3), ('[10, 11)', 1), ('[4, 7)', 3), ('[7, 10)', 3)]
+
+    with pytest.raises(ValueError, match='@chunk_start and @chunk_end'):
+        wrapper.execute_sql_query_chunked('SELECT 1;', 'no_chunks', chunks)
+
+
+@requires_docker
+@pytest.mark.usefixtures("container", "test_db")
+def test_execute_sql_query_chunked_failing_range(cdm531_wrapper_no_constraints: Wrapper):
+    wrapper = cdm531_wrapper_no_constraints
+    _insert_persons_sql(wrapper, 10)
+    # Division by zero for person 5
+    query = """
+    INSERT INTO @cdm_schema.location (location_id, city)
+    SELECT person_id, (100 / (person_id - 5))::text
+    FROM @cdm_schema.person
+    WHERE person_id >= @chunk_start AND person_id < @chunk_end;
+    """
+    key_ranges = [KeyRange(1, 4), KeyRange(4, 7), KeyRange(7, 11)]
+    failed = wrapper.execute_sql_query_chunked(query, 'locations', key_ranges, max_workers=3)
+    assert failed == [KeyRange(4, 7)]
+    transformation = etl_stats.transformations[-1]
+    assert not transformation.query_success
+    assert transformation.insertion_counts == {'cdm.location': 7}
+    with wrapper.db.session_scope() as session:
+        assert session.query(cdm531.Location).count() == 7
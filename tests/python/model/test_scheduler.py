@@ -0,0 +1,121 @@
+import threading
+from typing import List
+
+import pytest
+from src.delphyne import Wrapper
+from src.delphyne.model.etl_stats import etl_stats, open_transformation
+from src.delphyne.model.scheduler import TransformationScheduler
+
+from tests.python.cdm import cdm531
+from tests.python.conftest import docker_not_available
+
+
+class MockWrapper:
+    """Records the order in which transformations are executed."""
+
+    def __init__(self):
+        self.executed: List[str] = []
+        self._lock = threading.Lock()
+
+    def execute_transformation(self, statement, fail: bool = False):
+        with open_transformation(name=statement.__name__) as transformation:
+            with self._lock:
+                self.executed.append(statement.__name__)
+            transformation.query_success = not fail
+
+
+def person(wrapper):
+    pass
+
+
+def visit_occurrence(wrapper):
+    pass
+
+
+def condition_occurrence(wrapper):
+    pass
+
+
+def test_dependencies_are_respected():
+    wrapper = MockWrapper()
+    scheduler = TransformationScheduler(wrapper, max_workers=3)
+    scheduler.add_transformation(condition_occurrence, depends_on=['visit_occurrence'])
+    scheduler.add_transformation(visit_occurrence, depends_on=['person'])
+    scheduler.add_transformation(person)
+    scheduler.run()
+    assert wrapper.executed == ['person', 'visit_occurrence', 'condition_occurrence']
+
+
+def test_dependents_of_failed_transformation_are_skipped():
+    wrapper = MockWrapper()
+    scheduler = TransformationScheduler(wrapper, max_workers=2)
+    scheduler.add_transformation(person, fail=True)
+    scheduler.add_transformation(visit_occurrence, depends_on=['person'])
+    scheduler.add_transformation(condition_occurrence, depends_on=['visit_occurrence'])
+    scheduler.run()
+    assert wrapper.executed == ['person']
+
+
+def test_invalid_dependencies():
+    scheduler = TransformationScheduler(MockWrapper())
+    scheduler.add_transformation(person, depends_on=['visit_occurrence'])
+    with pytest.raises(ValueError, match='unknown transformations'):
+        scheduler.run()
+    scheduler.add_transformation(visit_occurrence, depends_on=['person'])
+    with pytest.raises(ValueError, match='Circular dependency'):
+        scheduler.run()
+    with pytest.raises(ValueError, match='already added'):
+        scheduler.add_transformation(person)
+
+
+def insert_persons(wrapper: Wrapper) -> List:
+    return [cdm531.Person(person_id=i, gender_concept_id=0, year_of_birth=1970,
+                          race_concept_id=0, ethnicity_concept_id=0) for i in range(1, 4)]
+
+
+def insert_observation_periods(wrapper: Wrapper) -> List:
+    with wrapper.db.session_scope() as session:
+        person_ids = [p.person_id for p in session.query(cdm531.Person).all()]
+    return [cdm531.ObservationPeriod(person_id=person_id, period_type_concept_id=0,
+                                     observation_period_start_date='2020-01-01',
+                                     observation_period_end_date='2020-12-31')
+            for person_id in person_ids]
+
+
+@pytest.mark.skipif(condition=docker_not_available(), reason='Docker daemon is not running')
+@pytest.mark.usefixtures("container", "test_db")
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_run_scheduled_transformations(cdm531_wrapper_with_tables_created: Wrapper, executor):
+    wrapper = cdm531_wrapper_with_tables_created
+    wrapper.db.constraint_manager.drop_all_constraints()
+    scheduler = wrapper.create_scheduler(max_workers=2, executor=executor)
+    scheduler.add_transformation(insert_observation_periods, depends_on=['insert_persons'])
+    scheduler.add_transformation(insert_persons)
+    scheduler.run()
+
+    transformations = {t.name: t for t in etl_stats.transformations}
+    assert transformations['insert_persons'].insertion_counts == {'cdm.person': 3}
+    assert transformations['insert_observation_periods'].insertion_counts == \
+        {'cdm.observation_period': 3}
+
+
+def test_stop_on_failure():
+    wrapper = MockWrapper()
+    scheduler = TransformationScheduler(wrapper, max_workers=1, stop_on_failure=True)
+    scheduler.add_transformation(person, fail=True)
+    scheduler.add_transformation(visit_occurrence)
+    scheduler.add_transformation(condition_occurrence)
+    assert scheduler.run() is False
+    assert wrapper.executed == ['person']
+
+    wrapper = MockWrapper()
+    scheduler = TransformationScheduler(wrapper, max_workers=1)
+    scheduler.add_transformation(person, fail=True)
+    scheduler.add_transformation(visit_occurrence)
+    assert scheduler.run() is False
+    assert wrapper.executed == ['person', 'visit_occurrence']
+    assert scheduler.succeeded_task_names == ['visit_occurrence']
+
+    scheduler = TransformationScheduler(MockWrapper(), max_workers=2)
+    scheduler.add_transformation(person)
+    assert scheduler.run() is True
@@ -0,0 +1,18 @@
+import pytest
+from src.delphyne.model.sharding import ChunkSpec, KeyRange, Shard
+
+
+def test_shard_contains():
+    shards = [Shard(index=i, n_shards=3) for i in range(3)]
+    for key in ['a', 'b', 1, 2]:
+        assert sum(shard.contains(key) for shard in shards) == 1
+
+
+def test_chunk_spec_key_ranges():
+    spec = ChunkSpec(table='@cdm_schema.person', column='person_id', chunk_size=4)
+    assert spec.get_key_ranges(1, 10) == [KeyRange(1, 5), KeyRange(5, 9), KeyRange(9, 11)]
+    assert spec.get_key_ranges(3, 3) == [KeyRange(3, 4)]
+    assert spec.get_key_ranges(None, None) == []
+    assert str(KeyRange(1, 5)) == '[1, 5)'
+    with pytest.raises(ValueError):
+        ChunkSpec(table='person', column='person_id', chunk_size=0)
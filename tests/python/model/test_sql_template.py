@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from src.delphyne.model import sql_template
+from src.delphyne.model.sql_template import SqlTemplate, clear_sql_template_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_template_cache():
+    clear_sql_template_cache()
+    yield
+    clear_sql_template_cache()
+
+
+def test_longest_parameter_is_substituted():
+    template = SqlTemplate('SELECT * FROM @cdm_schema.person JOIN @cdm.x ON @cdm_schema_x')
+    parameters = {'cdm': 'a', 'cdm_schema': 'b'}
+    assert template.render(parameters) == 'SELECT * FROM b.person JOIN a.x ON b_x'
+    # Independent of the order of the parameters
+    assert template.render(dict(reversed(parameters.items()))) == \
+        'SELECT * FROM b.person JOIN a.x ON b_x'
+
+
+def test_values_are_not_substituted_again():
+    template = SqlTemplate("SELECT '@a', 'user@host', @@b")
+    assert template.render({'a': '@b', 'b': 'x'}) == "SELECT '@b', 'user@host', @x"
+    assert template.render({}) == template.text
+
+
+def test_rendered_queries_are_reused(monkeypatch):
+    template = SqlTemplate('SELECT @col')
+    assert template.render({'col': 'x'}) == 'SELECT x'
+    monkeypatch.setattr(template, '_substitute', None)
+    assert template.render({'col': 'x'}) == 'SELECT x'
+
+
+def test_rendered_queries_are_limited():
+    template = SqlTemplate('SELECT @col')
+    for i in range(sql_template._MAX_RENDERED + 5):
+        assert template.render({'col': str(i)}) == f'SELECT {i}'
+    assert len(template._rendered) == sql_template._MAX_RENDERED
+
+
+def test_file_templates_are_cached(tmp_path):
+    file_path = tmp_path / 'query.sql'
+    file_path.write_text('SELECT @col;\n')
+    template = SqlTemplate.from_file(file_path)
+    assert template.text == 'SELECT @col;'
+    assert SqlTemplate.from_file(str(file_path)) is template
+
+    # Modified files are read again
+    file_path.write_text('SELECT @col, 1;')
+    stat = file_path.stat()
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    new_template = SqlTemplate.from_file(file_path)
+    assert new_template is not template
+    assert new_template.render({'col': 'x'}) == 'SELECT x, 1;'
+
+
+def test_render_statements():
+    template = SqlTemplate("INSERT INTO @schema.a VALUES (';'); DELETE FROM @schema.b;")
+    statements = template.render_statements({'schema': 'cdm'})
+    assert statements == ["INSERT INTO cdm.a VALUES (';')", 'DELETE FROM cdm.b']
+    statements.clear()
+    assert len(template.render_statements({'schema': 'cdm'})) == 2
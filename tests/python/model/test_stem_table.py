@@ -0,0 +1,38 @@
+import pytest
+from src.delphyne.model.stem_table import (get_stem_table_routing_query, restrict_domain_query,
+                                           route_domain_query)
+from src.delphyne.wrapper import _HERE, _STEM_TABLE_TO_DOMAIN_FILES
+
+
+@pytest.mark.parametrize('file_name', _STEM_TABLE_TO_DOMAIN_FILES)
+def test_route_post_processing_queries(file_name: str):
+    query = (_HERE / 'post_processing' / file_name).read_text()
+    routed_query, domain = route_domain_query(query)
+    assert '@vocabulary_schema.concept' not in routed_query
+    assert 'FROM @cdm_schema.stem_table_routed AS stem_table\n' \
+           f"WHERE stem_table.routed_domain_id = '{domain}'" in routed_query
+    # Everything but the source of the records is unchanged
+    assert routed_query.startswith(query[:query.index('FROM @cdm_schema.stem_table')])
+    assert routed_query.rstrip().endswith(';')
+
+
+def test_route_domain_query_invalid():
+    with pytest.raises(ValueError, match='by concept domain_id'):
+        route_domain_query('INSERT INTO @cdm_schema.observation SELECT * FROM x;')
+
+
+def test_stem_table_routing_query():
+    query = get_stem_table_routing_query(['Drug', 'Condition'])
+    assert "WHERE concept.domain_id IN ('Condition', 'Drug')" in query
+    assert 'CREATE UNLOGGED TABLE @cdm_schema.stem_table_routed AS' in query
+
+
+def test_restrict_domain_query():
+    query = (_HERE / 'post_processing' / 'stem_table_to_specimen.sql').read_text()
+    restricted = restrict_domain_query(query, after_id=10, up_to_id=20)
+    assert "WHERE concept.domain_id = 'Specimen'\n    AND stem_table.id > 10 " \
+           "AND stem_table.id <= 20" in restricted
+    routed_query, _ = route_domain_query(query)
+    restricted = restrict_domain_query(routed_query, after_id=None, up_to_id=20)
+    assert "routed_domain_id = 'Specimen'\n    AND stem_table.id <= 20" in restricted
+    assert 'AND TRUE' in restrict_domain_query(query, None, None)
@@ -0,0 +1,75 @@
+import pytest
+
+from src.delphyne.util.sql import is_ddl_statement, split_sql_statements, strip_leading_comments
+
+
+def test_split_sql_statements():
+    sql = """
+    CREATE TEMP TABLE tmp AS SELECT 1 AS x;
+    INSERT INTO cdm.person SELECT * FROM tmp;
+
+    DELETE FROM tmp WHERE x = 1
+    """
+    assert split_sql_statements(sql) == [
+        'CREATE TEMP TABLE tmp AS SELECT 1 AS x',
+        'INSERT INTO cdm.person SELECT * FROM tmp',
+        'DELETE FROM tmp WHERE x = 1',
+    ]
+
+
+def test_split_sql_statements_quotes():
+    sql = ("SELECT 'a;b', 'it''s;', \"col;name\" FROM t;"
+           "SELECT E'\\';', e'x' ;"
+           "SELECT name' ;';")
+    assert split_sql_statements(sql) == [
+        "SELECT 'a;b', 'it''s;', \"col;name\" FROM t",
+        "SELECT E'\\';', e'x'",
+        "SELECT name' ;'",
+    ]
+
+
+def test_split_sql_statements_dollar_quotes():
+    sql = """
+    CREATE FUNCTION f() RETURNS int AS $body$
+        BEGIN RETURN 1; END;
+    $body$ LANGUAGE plpgsql;
+    DO $$ BEGIN PERFORM 1; END $$;
+    PREPARE p AS SELECT $1;
+    SELECT a$b FROM t;
+    """
+    statements = split_sql_statements(sql)
+    assert len(statements) == 4
+    assert statements[0].endswith('$body$ LANGUAGE plpgsql')
+    assert statements[1] == 'DO $$ BEGIN PERFORM 1; END $$'
+    assert statements[2] == 'PREPARE p AS SELECT $1'
+    assert statements[3] == 'SELECT a$b FROM t'
+
+
+def test_split_sql_statements_comments():
+    sql = """
+    -- First; statement
+    SELECT 1; /* block; /* nested; */ still comment; */
+    SELECT 2; -- trailing; comment
+    /* only a comment */ ;
+    """
+    assert split_sql_statements(sql) == [
+        '-- First; statement\n    SELECT 1',
+        '/* block; /* nested; */ still comment; */\n    SELECT 2',
+    ]
+    assert split_sql_statements('-- nothing here') == []
+
+
+def test_strip_leading_comments():
+    assert strip_leading_comments('\n -- a\n/* b /* c */ */  SELECT 1 -- d') == 'SELECT 1 -- d'
+    assert strip_leading_comments('-- only') == ''
+
+
+@pytest.mark.parametrize('statement,expected', [
+    ('CREATE INDEX ix ON cdm.person (person_id)', True),
+    ('-- comment\nalter table cdm.person SET LOGGED', True),
+    ('DROP TABLE IF EXISTS tmp', True),
+    ('INSERT INTO cdm.person SELECT * FROM tmp', False),
+    ('SELECT created_at FROM t', False),
+])
+def test_is_ddl_statement(statement: str, expected: bool):
+    assert is_ddl_statement(statement) == expected
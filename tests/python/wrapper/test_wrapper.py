@@ -1,8 +1,13 @@
+from collections import Counter
+from typing import List
+
 import pytest
 from sqlalchemy import inspect
 from src.delphyne import Wrapper
 from src.delphyne.database.database import Database
+from src.delphyne.model.etl_stats import etl_stats
 
+from tests.python.cdm import cdm600
 from tests.python.conftest import docker_not_available
 
 pytestmark = pytest.mark.skipif(condition=docker_not_available(),
@@ -75,3 +80,122 @@ def test_create_tables_cdm600(wrapper_cdm600: Wrapper):
         'measurement', 'observation', 'stem_table', 'condition_occurrence',
         'device_exposure', 'drug_exposure', 'procedure_occurrence', 'survey_conduct',
         'note_nlp'}
+
+
+@pytest.mark.usefixtures("test_db")
+def test_create_cdm_unlogged(wrapper_cdm600: Wrapper):
+    wrapper_cdm600.create_schemas()
+    wrapper_cdm600.create_cdm(unlogged=True)
+    cdm_tables = set(inspect(wrapper_cdm600.db.engine).get_table_names('cdm'))
+    assert wrapper_cdm600.db.get_unlogged_tables() == cdm_tables
+
+    # Constraints can be dropped and added while the tables are unlogged
+    constraint_manager = wrapper_cdm600.db.constraint_manager
+    constraint_manager.drop_cdm_constraints()
+    constraint_manager.add_cdm_constraints()
+
+    wrapper_cdm600.set_cdm_logged(max_workers=4)
+    assert wrapper_cdm600.db.get_unlogged_tables() == set()
+
+
+def _insert_stem_table_records(wrapper: Wrapper, concept_ids: List[int], first_id: int = 1):
+    with wrapper.db.session_scope() as session:
+        for stem_id, concept_id in enumerate(concept_ids, start=first_id):
+            session.add(cdm600.StemTable(id=stem_id, person_id=1, concept_id=concept_id,
+                                         type_concept_id=0, route_concept_id=0,
+                                         start_date='2020-01-01',
+                                         start_datetime='2020-01-01 00:00:00',
+                                         end_date='2020-01-02',
+                                         end_datetime='2020-01-02 00:00:00'))
+
+
+@pytest.fixture(scope='function')
+def cdm600_wrapper_with_domain_concepts(cdm600_wrapper_with_tables_created: Wrapper) -> Wrapper:
+    """cdm600 wrapper with a concept for every stem table domain."""
+    wrapper = cdm600_wrapper_with_tables_created
+    wrapper.db.constraint_manager.drop_all_constraints()
+    domains = ['Condition', 'Device', 'Drug', 'Measurement', 'Observation', 'Procedure',
+               'Specimen']
+    with wrapper.db.session_scope() as session:
+        for concept_id, domain in enumerate(domains, start=1):
+            session.add(cdm600.Concept(concept_id=concept_id, concept_name=domain,
+                                       domain_id=domain, vocabulary_id='None',
+                                       concept_class_id='None', concept_code=domain,
+                                       valid_start_date='1970-01-01',
+                                       valid_end_date='2099-12-31'))
+    return wrapper
+
+
+def _get_insertion_counts() -> Counter:
+    insertion_counts = Counter()
+    for transformation in etl_stats.transformations:
+        insertion_counts += transformation.insertion_counts
+    return insertion_counts
+
+
+@pytest.mark.usefixtures("test_db")
+@pytest.mark.parametrize('method', ['per_domain', 'routed'])
+def test_stem_table_to_domains(cdm600_wrapper_with_domain_concepts: Wrapper, method: str):
+    wrapper = cdm600_wrapper_with_domain_concepts
+    _insert_stem_table_records(wrapper, [1, 1, 2, 3, 4, 5, 6, 7])
+
+    etl_stats.reset()
+    assert wrapper.stem_table_to_domains(max_workers=3, method=method)
+    assert len(etl_stats.transformations) == (7 if method == 'per_domain' else 8)
+    assert _get_insertion_counts() == {
+        'cdm.condition_occurrence': 2, 'cdm.device_exposure': 1, 'cdm.drug_exposure': 1,
+        'cdm.measurement': 1, 'cdm.observation': 1, 'cdm.procedure_occurrence': 1,
+        'cdm.specimen': 1}
+    # The intermediate table of the routed method is removed
+    assert 'stem_table_routed' not in inspect(wrapper.db.engine).get_table_names('cdm')
+
+    with pytest.raises(ValueError, match='Invalid method'):
+        wrapper.stem_table_to_domains(method='unknown')
+
+
+@pytest.mark.usefixtures("test_db")
+@pytest.mark.parametrize('method', ['per_domain', 'routed'])
+def test_stem_table_to_domains_incremental(cdm600_wrapper_with_domain_concepts: Wrapper,
+                                           method: str):
+    wrapper = cdm600_wrapper_with_domain_concepts
+    _insert_stem_table_records(wrapper, [1, 1, 2])
+    etl_stats.reset()
+    assert wrapper.stem_table_to_domains(method=method, incremental=True)
+    assert _get_insertion_counts() == {'cdm.condition_occurrence': 2,
+                                       'cdm.device_exposure': 1}
+
+    # Only the late arriving records are transferred
+    _insert_stem_table_records(wrapper, [1, 3], first_id=4)
+    etl_stats.reset()
+    assert wrapper.stem_table_to_domains(method=method, incremental=True)
+    assert _get_insertion_counts() == {'cdm.condition_occurrence': 1, 'cdm.drug_exposure': 1}
+
+    etl_stats.reset()
+    assert wrapper.stem_table_to_domains(method=method, incremental=True)
+    assert etl_stats.transformations == []
+    with wrapper.db.engine.connect() as con:
+        n_condition_occurrences = con.execute(
+            'SELECT count(*) FROM cdm.condition_occurrence').scalar()
+    assert n_condition_occurrences == 3
+
+
+@pytest.mark.usefixtures("test_db")
+def test_stem_table_watermarks_reset(cdm600_wrapper_with_domain_concepts: Wrapper):
+    wrapper = cdm600_wrapper_with_domain_concepts
+    _insert_stem_table_records(wrapper, [1, 2])
+    # A full run also records watermarks, so nothing is copied again
+    assert wrapper.stem_table_to_domains()
+    etl_stats.reset()
+    assert wrapper.stem_table_to_domains(incremental=True)
+    assert etl_stats.transformations == []
+
+    # Stem table ids start at 1 again after rebuilding the CDM
+    wrapper.drop_cdm()
+    for name in ['pk_concept', 'pk_domain']:
+        wrapper.db.constraint_manager.add_constraint_or_index(name)
+    wrapper.create_cdm()
+    wrapper.db.constraint_manager.drop_all_constraints()
+    _insert_stem_table_records(wrapper, [1, 3])
+    etl_stats.reset()
+    assert wrapper.stem_table_to_domains(incremental=True)
+    assert _get_insertion_counts() == {'cdm.condition_occurrence': 1, 'cdm.drug_exposure': 1}